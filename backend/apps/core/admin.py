@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import SiteConfiguration, SiteAppearance
+from django.utils import timezone
+from .models import SiteConfiguration, SiteAppearance, OutboxEvent, OutgoingEmail
 
 
 @admin.register(SiteConfiguration)
@@ -72,3 +73,59 @@ class SiteAppearanceAdmin(admin.ModelAdmin):
     def has_delete_permission(self, request, obj=None):
         """Prevent deletion"""
         return False
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    """Admin for outbox events (read-only, failed events can be retried)"""
+    list_display = ['id', 'event_type', 'status', 'attempts', 'available_at', 'processed_at', 'created_at']
+    list_filter = ['status', 'event_type']
+    search_fields = ['event_type', 'last_error']
+    readonly_fields = ['event_type', 'payload', 'status', 'attempts', 'available_at',
+                       'processed_at', 'last_error', 'created_at', 'updated_at']
+    actions = ['retry_events']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def retry_events(self, request, queryset):
+        """Put failed events back in the queue"""
+        updated = queryset.filter(status='failed').update(
+            status='pending',
+            attempts=0,
+            available_at=timezone.now(),
+            updated_at=timezone.now()
+        )
+        self.message_user(request, f'{updated} event(s) queued for retry.')
+    retry_events.short_description = 'Retry failed events'
+
+
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    """Admin for the outgoing email queue (read-only, failed emails can be retried)"""
+    list_display = ['id', 'to_email', 'subject', 'status', 'attempts', 'available_at', 'sent_at', 'created_at']
+    list_filter = ['status', 'template']
+    search_fields = ['to_email', 'subject', 'last_error']
+    readonly_fields = ['to_email', 'subject', 'template', 'context', 'body', 'status', 'attempts',
+                       'available_at', 'sent_at', 'last_error', 'created_at', 'updated_at']
+    actions = ['retry_emails']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def retry_emails(self, request, queryset):
+        """Put failed emails back in the queue"""
+        updated = queryset.filter(status='failed').update(
+            status='pending',
+            attempts=0,
+            available_at=timezone.now(),
+            updated_at=timezone.now()
+        )
+        self.message_user(request, f'{updated} email(s) queued for retry.')
+    retry_emails.short_description = 'Retry failed emails'
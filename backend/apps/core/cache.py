@@ -0,0 +1,165 @@
+"""
+Shared cache helpers (on top of the default cache, see CACHES in settings)
+
+* make_key(): namespaced keys, e.g. make_key('games', 'detail', slug)
+* get_or_compute(): read-through caching with
+    - tags: entries remember the version of each tag they were built under;
+      invalidate_tags() bumps the versions and every tagged entry misses
+    - single-flight: on a miss only one process recomputes, the others wait
+      briefly for its result (or serve the previous value if there is one)
+    - probabilistic early refresh (XFetch): hot entries are recomputed a
+      little before they expire, proportionally to how long they take to
+      compute, so they never expire under load
+* When Redis is down the backend degrades to an always-empty cache and
+  get_or_compute() simply calls compute() (the database).
+"""
+import hashlib
+import math
+import random
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+KEY_SEPARATOR = ':'
+MAX_PART_LENGTH = 64
+
+_MISSING = object()
+
+
+def make_key(namespace, *parts):
+    """Build a namespaced cache key; long parts are hashed"""
+    safe_parts = []
+    for part in parts:
+        part = str(part)
+        if len(part) > MAX_PART_LENGTH or ' ' in part:
+            part = hashlib.md5(part.encode('utf-8')).hexdigest()
+        safe_parts.append(part)
+    return KEY_SEPARATOR.join([namespace, *safe_parts])
+
+
+def is_degraded():
+    """True while the cache backend is running without Redis"""
+    checker = getattr(cache, 'is_degraded', None)
+    return bool(checker and checker())
+
+
+# ==========================================
+# Tags
+# ==========================================
+
+def _tag_key(tag):
+    return make_key('tag', tag)
+
+
+def get_tag_versions(tags):
+    """Current version of each tag (initialised on first use)"""
+    if not tags:
+        return {}
+    keys = {_tag_key(tag): tag for tag in tags}
+    found = cache.get_many(list(keys))
+    versions = {}
+    for key, tag in keys.items():
+        version = found.get(key)
+        if version is None:
+            # Clock-based start so a flushed tag never matches an old entry
+            cache.add(key, int(time.time() * 1000), timeout=None)
+            version = cache.get(key)
+        versions[tag] = version
+    return versions
+
+
+def invalidate_tags(*tags):
+    """Invalidate every entry stored with any of the given tags"""
+    for tag in tags:
+        key = _tag_key(tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, int(time.time() * 1000), timeout=None)
+
+
+# ==========================================
+# Read-through with single-flight and early refresh
+# ==========================================
+
+def get_or_compute(key, compute, timeout=None, tags=(), beta=1.0, lock_timeout=None, wait_timeout=None):
+    """
+    Return the cached value for key, computing and storing it when needed.
+
+    Args:
+        key: cache key (see make_key)
+        compute: zero-argument callable producing the value
+        timeout: seconds to keep the value (default CACHE_DEFAULT_TIMEOUT)
+        tags: tags the value depends on (see invalidate_tags)
+        beta: early refresh aggressiveness (0 disables, >1 refreshes earlier)
+        lock_timeout: max seconds one process may hold the recompute lock
+        wait_timeout: max seconds other processes wait for that result
+    """
+    timeout = timeout or getattr(settings, 'CACHE_DEFAULT_TIMEOUT', 300)
+    lock_timeout = lock_timeout or getattr(settings, 'CACHE_LOCK_TIMEOUT', 10)
+    wait_timeout = wait_timeout if wait_timeout is not None else getattr(settings, 'CACHE_LOCK_WAIT', 2)
+
+    if is_degraded():
+        return compute()
+
+    tag_versions = get_tag_versions(tags)
+    entry = cache.get(key)
+    fresh = _is_fresh(entry, tag_versions)
+    if fresh and not _should_refresh_early(entry, beta):
+        return entry['value']
+
+    stale_value = entry['value'] if fresh else _MISSING
+    lock_key = make_key('lock', key)
+    token = uuid.uuid4().hex
+    if not cache.add(lock_key, token, timeout=lock_timeout):
+        # Someone else is recomputing
+        if stale_value is not _MISSING:
+            return stale_value
+        value = _wait_for(key, tag_versions, wait_timeout)
+        if value is not _MISSING:
+            return value
+        return compute()
+
+    try:
+        started = time.monotonic()
+        value = compute()
+        delta = time.monotonic() - started
+        cache.set(key, {
+            'value': value,
+            'tags': tag_versions,
+            'expires_at': time.time() + timeout,
+            'delta': delta,
+        }, timeout=timeout)
+        return value
+    finally:
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+
+def _is_fresh(entry, tag_versions):
+    if not isinstance(entry, dict) or 'value' not in entry:
+        return False
+    return entry.get('tags', {}) == tag_versions
+
+
+def _should_refresh_early(entry, beta):
+    """XFetch: refresh with a probability that grows as expiry approaches"""
+    if beta <= 0:
+        return False
+    delta = entry.get('delta') or 0
+    # -log(random) is exponentially distributed; 1 - random() avoids log(0)
+    return time.time() - delta * beta * math.log(1.0 - random.random()) >= entry['expires_at']
+
+
+def _wait_for(key, tag_versions, wait_timeout):
+    deadline = time.monotonic() + wait_timeout
+    delay = 0.02
+    while time.monotonic() < deadline:
+        time.sleep(delay)
+        entry = cache.get(key)
+        if _is_fresh(entry, tag_versions):
+            return entry['value']
+        delay = min(delay * 2, 0.2)
+    return _MISSING
@@ -0,0 +1,100 @@
+"""
+Cache backends
+
+ResilientRedisCache is Django's RedisCache with two changes:
+
+* one connection pool per process (Django builds a client, and therefore a
+  pool, per thread), sized by OPTIONS['max_connections'];
+* degraded mode: when Redis is unreachable the backend behaves like an
+  empty cache (reads miss, writes are dropped) for FAILURE_COOLDOWN seconds
+  instead of raising, so callers fall back to the database.
+"""
+import logging
+import threading
+import time
+
+from django.core.cache.backends.redis import RedisCache
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+
+logger = logging.getLogger(__name__)
+
+REDIS_UNAVAILABLE = (RedisConnectionError, RedisTimeoutError)
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class ResilientRedisCache(RedisCache):
+    """RedisCache sharing one pool per process and degrading while Redis is down"""
+
+    # Shared by every thread's backend instance in this process
+    _down_until = 0.0
+
+    def __init__(self, server, params):
+        super().__init__(server, params)
+        self.failure_cooldown = params.get('FAILURE_COOLDOWN', 5)
+
+    @property
+    def _cache(self):
+        key = (tuple(self._servers), tuple(sorted(self._options.items())))
+        client = _clients.get(key)
+        if client is None:
+            with _clients_lock:
+                client = _clients.get(key)
+                if client is None:
+                    client = _clients[key] = self._class(self._servers, **self._options)
+        return client
+
+    @classmethod
+    def is_degraded(cls):
+        """True while Redis is considered unreachable"""
+        return time.monotonic() < cls._down_until
+
+    def _call(self, method, default, *args, **kwargs):
+        if self.is_degraded():
+            return default
+        try:
+            return method(*args, **kwargs)
+        except REDIS_UNAVAILABLE as e:
+            if not self.is_degraded():
+                logger.warning(f"Redis cache unavailable, degrading for {self.failure_cooldown}s: {e}")
+            ResilientRedisCache._down_until = time.monotonic() + self.failure_cooldown
+            return default
+
+    def add(self, *args, **kwargs):
+        return self._call(super().add, False, *args, **kwargs)
+
+    def get(self, key, default=None, version=None):
+        return self._call(super().get, default, key, default, version)
+
+    def set(self, *args, **kwargs):
+        return self._call(super().set, None, *args, **kwargs)
+
+    def touch(self, *args, **kwargs):
+        return self._call(super().touch, False, *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._call(super().delete, False, *args, **kwargs)
+
+    def get_many(self, *args, **kwargs):
+        return self._call(super().get_many, {}, *args, **kwargs)
+
+    def has_key(self, *args, **kwargs):
+        return self._call(super().has_key, False, *args, **kwargs)
+
+    def incr(self, key, delta=1, version=None):
+        missing = object()
+        result = self._call(super().incr, missing, key, delta, version)
+        if result is missing:
+            # Same contract as a missing key; callers already handle it
+            raise ValueError(f"Key '{key}' not found (cache unavailable)")
+        return result
+
+    def set_many(self, data, *args, **kwargs):
+        return self._call(super().set_many, list(data), data, *args, **kwargs)
+
+    def delete_many(self, *args, **kwargs):
+        return self._call(super().delete_many, None, *args, **kwargs)
+
+    def clear(self):
+        return self._call(super().clear, False)
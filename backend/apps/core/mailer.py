@@ -0,0 +1,155 @@
+"""
+Email delivery queue
+
+Callers enqueue() messages inside their transaction instead of talking to
+SMTP from the request; the core.deliver_emails Celery task drains the
+queue with deliver(), which renders each message and sends the whole batch
+over a single backend connection (one SMTP login per batch rather than per
+message).
+
+Templated emails store the template name and a JSON context and are
+rendered in the worker; compiled templates are kept per process. A message
+that fails to send is retried with exponential backoff (EMAIL_RETRY_DELAY
+doubled per attempt) until EMAIL_MAX_ATTEMPTS, then marked as failed.
+
+For local testing point the SMTP backend at a debugging server, e.g.
+    python -m aiosmtpd -n -l localhost:1025
+with EMAIL_BACKEND=django.core.mail.backends.smtp.EmailBackend,
+EMAIL_HOST=localhost, EMAIL_PORT=1025 and EMAIL_USE_TLS=False.
+"""
+import logging
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.template.loader import get_template
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from .models import OutgoingEmail
+
+logger = logging.getLogger(__name__)
+
+DELIVERY_DEBOUNCE_KEY = 'mailer:delivery-scheduled'
+
+
+def enqueue(to_email, subject, template='', context=None, body=''):
+    """
+    Queue an email (call inside the business transaction).
+
+    Either template (rendered with context, which must be JSON-serializable)
+    or a plain-text body is required.
+    """
+    email = OutgoingEmail.objects.create(
+        to_email=to_email,
+        subject=subject,
+        template=template,
+        context=context or {},
+        body=body
+    )
+    transaction.on_commit(schedule_delivery)
+    return email
+
+
+def schedule_delivery():
+    """Ask a worker to drain the queue soon (at most once per second)"""
+    if not cache.add(DELIVERY_DEBOUNCE_KEY, True, timeout=1):
+        return
+    from .tasks import deliver_emails
+    try:
+        deliver_emails.delay()
+    except Exception as e:
+        # The periodic delivery will pick the emails up
+        logger.warning(f"Could not enqueue email delivery: {e}")
+
+
+@lru_cache(maxsize=64)
+def _get_template(name):
+    return get_template(name)
+
+
+def build_message(email, connection=None):
+    """EmailMultiAlternatives for a queued email"""
+    if email.template:
+        html = _get_template(email.template).render(email.context)
+        message = EmailMultiAlternatives(
+            subject=email.subject,
+            body=strip_tags(html),
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[email.to_email],
+            connection=connection
+        )
+        message.attach_alternative(html, 'text/html')
+        return message
+
+    return EmailMultiAlternatives(
+        subject=email.subject,
+        body=email.body,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[email.to_email],
+        connection=connection
+    )
+
+
+def deliver(batch_size=None):
+    """
+    Send one batch of pending emails over a single connection.
+
+    Returns:
+        dict: counts of sent, retried and failed emails
+    """
+    batch_size = batch_size or getattr(settings, 'EMAIL_BATCH_SIZE', 50)
+    max_attempts = getattr(settings, 'EMAIL_MAX_ATTEMPTS', 5)
+    retry_delay = getattr(settings, 'EMAIL_RETRY_DELAY', 30)
+    now = timezone.now()
+    result = {'sent': 0, 'retried': 0, 'failed': 0}
+
+    with transaction.atomic():
+        # skip_locked lets several workers drain the queue in parallel
+        emails = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', available_at__lte=now)
+            .order_by('id')[:batch_size]
+        )
+        if not emails:
+            return result
+
+        connection = get_connection(fail_silently=False)
+        try:
+            for email in emails:
+                email.updated_at = now
+                try:
+                    message = build_message(email, connection)
+                    # open() is a no-op while the connection is up
+                    connection.open()
+                    # One message per call so a failure is attributed to its own email
+                    connection.send_messages([message])
+                except Exception as e:
+                    # Start the next message on a fresh connection
+                    connection.close()
+                    email.attempts += 1
+                    email.last_error = f'{type(e).__name__}: {e}'
+                    if email.attempts >= max_attempts:
+                        email.status = 'failed'
+                        result['failed'] += 1
+                        logger.error(f"Email {email.pk} to {email.to_email} failed: {email.last_error}")
+                    else:
+                        email.available_at = now + timedelta(seconds=retry_delay * 2 ** (email.attempts - 1))
+                        result['retried'] += 1
+                        logger.warning(f"Email {email.pk} to {email.to_email} will be retried: {email.last_error}")
+                else:
+                    email.status = 'sent'
+                    email.sent_at = now
+                    result['sent'] += 1
+        finally:
+            connection.close()
+
+        OutgoingEmail.objects.bulk_update(
+            emails,
+            ['status', 'attempts', 'available_at', 'sent_at', 'last_error', 'updated_at']
+        )
+
+    return result
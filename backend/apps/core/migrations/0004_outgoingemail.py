@@ -0,0 +1,38 @@
+# Generated by Django 5.0 on 2026-10-16 22:41
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_outboxevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutgoingEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('to_email', models.EmailField(max_length=254, verbose_name='To')),
+                ('subject', models.CharField(max_length=255, verbose_name='Subject')),
+                ('template', models.CharField(blank=True, max_length=255, verbose_name='Template')),
+                ('context', models.JSONField(blank=True, default=dict, verbose_name='Context')),
+                ('body', models.TextField(blank=True, verbose_name='Body')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=20, verbose_name='Status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Attempts')),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Available At')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Sent At')),
+                ('last_error', models.TextField(blank=True, verbose_name='Last Error')),
+            ],
+            options={
+                'verbose_name': 'Outgoing Email',
+                'verbose_name_plural': 'Outgoing Emails',
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['status', 'available_at', 'id'], name='core_outgoi_status_52a3dd_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+from .serializers import SparseFieldsetsMixin
+
+
+class SparseFieldsetsViewMixin:
+    """
+    Generic view mixin: project the queryset to the fields requested with
+    ?fields= / ?omit= when the serializer supports sparse fieldsets.
+
+    Hooks filter_queryset so views can keep overriding get_queryset.
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        serializer_class = self.get_serializer_class()
+        if issubclass(serializer_class, SparseFieldsetsMixin):
+            queryset = serializer_class.sparse_queryset(queryset, self.request)
+        return queryset
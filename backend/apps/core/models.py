@@ -1,6 +1,8 @@
 from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 from decimal import Decimal
+from .singletons import SingletonCache
 
 
 class TimeStampedModel(models.Model):
@@ -14,6 +16,63 @@ class TimeStampedModel(models.Model):
         abstract = True
 
 
+class ChangeTrackingMixin(models.Model):
+    """
+    Abstract mixin that remembers the values of `tracked_fields` as they were
+    loaded from (or last saved to) the database, so signal receivers can
+    compare old and new values without fetching the row again.
+    """
+    tracked_fields = ()
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_tracked_fields()
+        return instance
+
+    def _snapshot_tracked_fields(self, fields=None):
+        # Read from __dict__ so deferred fields are not loaded just to be tracked
+        values = {
+            field: self.__dict__[field]
+            for field in self.tracked_fields
+            if field in self.__dict__ and (fields is None or field in fields)
+        }
+        if fields is None or '_loaded_values' not in self.__dict__:
+            self._loaded_values = values
+        else:
+            self._loaded_values.update(values)
+
+    def get_previous_value(self, field):
+        """
+        Value of a tracked field before the pending/current save.
+        Returns None for instances that were never loaded or saved.
+        """
+        loaded = self.__dict__.get('_loaded_values')
+        if loaded is None:
+            return None
+        if field in loaded:
+            return loaded[field]
+        # Field was deferred when the instance was loaded
+        return type(self)._base_manager.filter(pk=self.pk).values_list(field, flat=True).first()
+
+    def has_changed(self, field):
+        """Check if a tracked field differs from its loaded value"""
+        return self.get_previous_value(field) != getattr(self, field)
+
+    def save(self, *args, **kwargs):
+        # post_save receivers still see the old snapshot; refresh it afterwards
+        super().save(*args, **kwargs)
+        self._snapshot_tracked_fields(kwargs.get('update_fields'))
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        # Unsaved edits to fields that were not reloaded are still changes
+        self._snapshot_tracked_fields(fields)
+
+
 class SiteConfiguration(models.Model):
     """
     Singleton model for global site configuration.
@@ -44,6 +103,7 @@ class SiteConfiguration(models.Model):
         """Ensure only one instance exists"""
         self.pk = 1
         super().save(*args, **kwargs)
+        SingletonCache.invalidate(type(self))
 
     def delete(self, *args, **kwargs):
         """Prevent deletion"""
@@ -51,9 +111,8 @@ class SiteConfiguration(models.Model):
 
     @classmethod
     def get_config(cls):
-        """Get or create the singleton instance"""
-        config, created = cls.objects.get_or_create(pk=1)
-        return config
+        """Get the singleton instance (process-local copy, reloaded when another process saves it)"""
+        return SingletonCache.get(cls)
 
 
 class SiteAppearance(models.Model):
@@ -128,6 +187,7 @@ class SiteAppearance(models.Model):
         """Ensure only one instance exists"""
         self.pk = 1
         super().save(*args, **kwargs)
+        SingletonCache.invalidate(type(self))
 
     def delete(self, *args, **kwargs):
         """Prevent deletion"""
@@ -135,6 +195,71 @@ class SiteAppearance(models.Model):
 
     @classmethod
     def get_appearance(cls):
-        """Get or create the singleton instance"""
-        appearance, created = cls.objects.get_or_create(pk=1)
-        return appearance
+        """Get the singleton instance (process-local copy, reloaded when another process saves it)"""
+        return SingletonCache.get(cls)
+
+
+class OutboxEvent(TimeStampedModel):
+    """
+    Domain event written in the same transaction as the business change.
+    Drained in batches by the core.relay_outbox Celery task (see apps.core.outbox).
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processed', 'Processed'),
+        ('failed', 'Failed'),
+    ]
+
+    event_type = models.CharField(max_length=100, verbose_name='Event Type')
+    payload = models.JSONField(default=dict, verbose_name='Payload')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name='Status')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Attempts')
+    available_at = models.DateTimeField(default=timezone.now, verbose_name='Available At')
+    processed_at = models.DateTimeField(null=True, blank=True, verbose_name='Processed At')
+    last_error = models.TextField(blank=True, verbose_name='Last Error')
+
+    class Meta:
+        verbose_name = 'Outbox Event'
+        verbose_name_plural = 'Outbox Events'
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['status', 'available_at', 'id']),
+            models.Index(fields=['event_type']),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} #{self.pk} ({self.status})"
+
+
+class OutgoingEmail(TimeStampedModel):
+    """
+    Queued email, rendered and sent in batches over one SMTP connection by
+    the core.deliver_emails Celery task (see apps.core.mailer).
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    to_email = models.EmailField(verbose_name='To')
+    subject = models.CharField(max_length=255, verbose_name='Subject')
+    template = models.CharField(max_length=255, blank=True, verbose_name='Template')
+    context = models.JSONField(default=dict, blank=True, verbose_name='Context')
+    body = models.TextField(blank=True, verbose_name='Body')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name='Status')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Attempts')
+    available_at = models.DateTimeField(default=timezone.now, verbose_name='Available At')
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name='Sent At')
+    last_error = models.TextField(blank=True, verbose_name='Last Error')
+
+    class Meta:
+        verbose_name = 'Outgoing Email'
+        verbose_name_plural = 'Outgoing Emails'
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['status', 'available_at', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to_email} ({self.status})"
@@ -0,0 +1,118 @@
+"""
+Transactional outbox
+
+Producers call publish() inside the transaction that makes the business
+change, so the event row commits (or rolls back) together with it.
+Consumers register with @subscriber(event_type) and are run by relay(),
+which the core.relay_outbox Celery task calls in batches.
+
+Each event is dispatched inside its own savepoint: a failing consumer rolls
+back only that event's side effects, and the event is retried with
+exponential backoff until OUTBOX_MAX_ATTEMPTS, then marked as failed.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+_subscribers = defaultdict(list)
+
+RELAY_DEBOUNCE_KEY = 'outbox:relay-scheduled'
+
+
+def subscriber(event_type):
+    """Register a consumer: handler(payload) is called for every event_type event"""
+    def decorator(handler):
+        _subscribers[event_type].append(handler)
+        return handler
+    return decorator
+
+
+def publish(event_type, **payload):
+    """Write an event to the outbox (call inside the business transaction)"""
+    event = OutboxEvent.objects.create(event_type=event_type, payload=payload)
+    transaction.on_commit(schedule_relay)
+    return event
+
+
+def publish_many(events):
+    """Write several (event_type, payload) events with a single INSERT"""
+    created = OutboxEvent.objects.bulk_create([
+        OutboxEvent(event_type=event_type, payload=payload)
+        for event_type, payload in events
+    ])
+    if created:
+        transaction.on_commit(schedule_relay)
+    return created
+
+
+def schedule_relay():
+    """Ask a worker to drain the outbox soon (at most once per second)"""
+    if not getattr(settings, 'OUTBOX_RELAY_ON_COMMIT', True):
+        return
+    if not cache.add(RELAY_DEBOUNCE_KEY, True, timeout=1):
+        return
+    from .tasks import relay_outbox
+    try:
+        relay_outbox.delay()
+    except Exception as e:
+        # The periodic relay will pick the events up
+        logger.warning(f"Could not enqueue outbox relay: {e}")
+
+
+def relay(batch_size=None):
+    """
+    Dispatch one batch of pending events to their subscribers.
+
+    Returns:
+        dict: counts of processed, retried and failed events
+    """
+    batch_size = batch_size or getattr(settings, 'OUTBOX_RELAY_BATCH_SIZE', 100)
+    max_attempts = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 5)
+    now = timezone.now()
+    result = {'processed': 0, 'retried': 0, 'failed': 0}
+
+    with transaction.atomic():
+        # skip_locked lets several relay workers drain the table in parallel
+        events = list(
+            OutboxEvent.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', available_at__lte=now)
+            .order_by('id')[:batch_size]
+        )
+
+        for event in events:
+            event.updated_at = now
+            try:
+                with transaction.atomic():
+                    for handler in _subscribers.get(event.event_type, []):
+                        handler(event.payload)
+            except Exception as e:
+                event.attempts += 1
+                event.last_error = f'{type(e).__name__}: {e}'
+                if event.attempts >= max_attempts:
+                    event.status = 'failed'
+                    result['failed'] += 1
+                    logger.error(f"Outbox event {event.pk} ({event.event_type}) failed: {event.last_error}")
+                else:
+                    event.available_at = now + timedelta(seconds=2 ** event.attempts)
+                    result['retried'] += 1
+                    logger.warning(f"Outbox event {event.pk} ({event.event_type}) will be retried: {event.last_error}")
+            else:
+                event.status = 'processed'
+                event.processed_at = now
+                result['processed'] += 1
+
+        OutboxEvent.objects.bulk_update(
+            events,
+            ['status', 'attempts', 'available_at', 'processed_at', 'last_error', 'updated_at']
+        )
+
+    return result
@@ -0,0 +1,167 @@
+"""
+Sparse fieldsets
+
+?fields=a,b keeps only the listed serializer fields, ?omit=c drops fields.
+Serializers opt in with SparseFieldsetsMixin; views add
+apps.core.mixins.SparseFieldsetsViewMixin so the queryset only selects the
+columns and joins the remaining fields read.
+"""
+import re
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.permissions import SAFE_METHODS
+
+DISPLAY_SOURCE_PATTERN = re.compile(r'^get_(\w+)_display$')
+
+
+def _parse_param(request, name):
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    return {item.strip() for item in value.split(',') if item.strip()}
+
+
+def get_sparse_field_names(request, available):
+    """
+    Field names requested by ?fields= / ?omit= (None when the response is not sparse).
+    Unknown names are ignored; sparse fieldsets only apply to read requests.
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+
+    fields = _parse_param(request, 'fields')
+    omit = _parse_param(request, 'omit')
+    if fields is None and omit is None:
+        return None
+
+    names = set(available) if fields is None else fields & set(available)
+    return names - (omit or set())
+
+
+class SparseFieldsetsMixin:
+    """
+    Serializer mixin honouring ?fields= and ?omit= on the request in context.
+
+    Method fields (and other computed fields) declare the model paths they
+    read in Meta.field_sources so the queryset can be projected, e.g.
+    field_sources = {'time_ago': ('created_at',)}. A computed field without a
+    declaration disables queryset pruning (the response is still trimmed).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Nested serializers are built without context and keep all fields
+        names = get_sparse_field_names(self.context.get('request'), self.fields.keys())
+        if names is not None:
+            for name in set(self.fields) - names:
+                self.fields.pop(name)
+
+    @classmethod
+    def sparse_queryset(cls, queryset, request):
+        """Drop joins, prefetches and columns the requested fields do not use"""
+        serializer = cls()
+        names = get_sparse_field_names(request, serializer.fields.keys())
+        if names is None:
+            return queryset
+
+        projection = cls._get_projection(serializer, names, queryset.model)
+        if projection is None:
+            return queryset
+        columns, relations, prefetches = projection
+
+        select_related = queryset.query.select_related
+        if isinstance(select_related, dict):
+            kept = [
+                path for path in _flatten_select_related(select_related)
+                if any(rel == path or rel.startswith(path + '__') for rel in relations)
+            ]
+            queryset = queryset.select_related(None)
+            if kept:
+                queryset = queryset.select_related(*kept)
+        else:
+            kept = []
+
+        lookups = queryset._prefetch_related_lookups
+        if lookups:
+            kept_lookups = [
+                lookup for lookup in lookups
+                if getattr(lookup, 'prefetch_through', lookup).split('__')[0] in prefetches
+            ]
+            queryset = queryset.prefetch_related(None).prefetch_related(*kept_lookups)
+
+        only = {'pk'}
+        for column in columns:
+            relation, _, _ = column.rpartition('__')
+            if relation and relation not in kept and select_related is not True:
+                # Not joined: load the foreign key and let the relation load lazily
+                only.add(column.split('__')[0])
+            else:
+                only.add(column)
+        return queryset.only(*only)
+
+    @classmethod
+    def _get_projection(cls, serializer, names, model):
+        """Columns, select_related paths and prefetch roots used by the given fields"""
+        declared = getattr(cls.Meta, 'field_sources', {})
+        columns, relations, prefetches = set(), set(), set()
+
+        for name in names:
+            if name in declared:
+                paths = declared[name]
+            else:
+                source = serializer.fields[name].source
+                if source == '*':
+                    return None
+                paths = [source.replace('.', '__')]
+
+            for path in paths:
+                resolved = _resolve_path(model, path)
+                if resolved is None:
+                    return None
+                column, path_relations, prefetch = resolved
+                if column:
+                    columns.add(column)
+                relations.update(path_relations)
+                if prefetch:
+                    prefetches.add(prefetch)
+
+        return columns, relations, prefetches
+
+
+def _flatten_select_related(tree, prefix=''):
+    paths = []
+    for name, children in tree.items():
+        path = f'{prefix}{name}'
+        paths.append(path)
+        paths.extend(_flatten_select_related(children, path + '__'))
+    return paths
+
+
+def _resolve_path(model, path):
+    """
+    Map a serializer source path to (column, relations, prefetch root).
+    Returns None when the path is not a plain model attribute.
+    """
+    parts = path.split('__')
+    relations = []
+    for index, part in enumerate(parts):
+        try:
+            field = model._meta.get_field(part)
+        except FieldDoesNotExist:
+            match = DISPLAY_SOURCE_PATTERN.match(part)
+            if match and index == len(parts) - 1:
+                # get_status_display reads status
+                return _resolve_path(model, '__'.join(parts[:index] + [match.group(1)]))
+            return None
+
+        is_last = index == len(parts) - 1
+        if field.one_to_many or field.many_to_many or (field.one_to_one and not field.concrete):
+            # Reverse relations are loaded by prefetch_related, not by this SELECT
+            return (None, relations, part) if index == 0 else None
+        if field.is_relation and not is_last:
+            relations.append('__'.join(parts[:index + 1]))
+            model = field.related_model
+            continue
+        return '__'.join(parts[:index + 1]), relations, None
+
+    return None
@@ -0,0 +1,55 @@
+"""
+Process-local cache for singleton models (SiteConfiguration, SiteAppearance)
+
+Each process keeps its own loaded copy together with the version it was
+loaded under. Reading costs one shared-cache GET of the version key; the
+database is only queried when another worker or node bumped the version
+(on save), so every process reloads on its next access.
+"""
+from django.db import transaction
+
+from .cache import get_tag_versions, invalidate_tags
+
+
+class SingletonCache:
+    """Loaded singleton instances, keyed by model label"""
+    _entries = {}
+
+    @staticmethod
+    def tag(model):
+        return f'singleton:{model._meta.label_lower}'
+
+    @classmethod
+    def get(cls, model):
+        """
+        Return the pk=1 instance of model, created if missing.
+        The instance is shared within the process: treat it as read-only.
+        """
+        version = cls._current_version(model)
+        if version is None:
+            # Shared cache unavailable: other processes' saves cannot be seen
+            instance, created = model.objects.get_or_create(pk=1)
+            return instance
+
+        entry = cls._entries.get(model._meta.label_lower)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+
+        instance, created = model.objects.get_or_create(pk=1)
+        cls._entries[model._meta.label_lower] = (version, instance)
+        return instance
+
+    @classmethod
+    def invalidate(cls, model):
+        """Drop this process's copy and make every other process reload after commit"""
+        cls._entries.pop(model._meta.label_lower, None)
+        transaction.on_commit(lambda: cls._bump(model))
+
+    @classmethod
+    def _current_version(cls, model):
+        tag = cls.tag(model)
+        return get_tag_versions([tag])[tag]
+
+    @classmethod
+    def _bump(cls, model):
+        invalidate_tags(cls.tag(model))
@@ -0,0 +1,88 @@
+from celery import shared_task
+from django.utils import timezone
+from datetime import timedelta
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(name='core.relay_outbox')
+def relay_outbox(batch_size=None, max_batches=50):
+    """
+    Drain pending outbox events in batches.
+    Triggered after each commit that publishes events, and every few
+    seconds by Celery Beat as a safety net.
+    """
+    from .outbox import relay
+
+    totals = {'processed': 0, 'retried': 0, 'failed': 0}
+    for _ in range(max_batches):
+        result = relay(batch_size=batch_size)
+        for key, value in result.items():
+            totals[key] += value
+        if not any(result.values()):
+            break
+
+    if any(totals.values()):
+        logger.info(f"Outbox relay: {totals}")
+    return totals
+
+
+@shared_task(name='core.cleanup_outbox')
+def cleanup_outbox(days=7):
+    """Delete processed outbox events older than specified days"""
+    from .models import OutboxEvent
+
+    cutoff_date = timezone.now() - timedelta(days=days)
+    deleted_count, _ = OutboxEvent.objects.filter(
+        status='processed',
+        processed_at__lt=cutoff_date
+    ).delete()
+
+    logger.info(f"Cleaned up {deleted_count} processed outbox events older than {days} days")
+
+    return {
+        'deleted_count': deleted_count,
+        'cutoff_date': cutoff_date.isoformat()
+    }
+
+
+@shared_task(name='core.deliver_emails')
+def deliver_emails(batch_size=None, max_batches=20):
+    """
+    Drain queued emails in batches, one backend connection per batch.
+    Triggered after each commit that queues email, and every minute by
+    Celery Beat to pick up retries.
+    """
+    from .mailer import deliver
+
+    totals = {'sent': 0, 'retried': 0, 'failed': 0}
+    for _ in range(max_batches):
+        result = deliver(batch_size=batch_size)
+        for key, value in result.items():
+            totals[key] += value
+        if not any(result.values()):
+            break
+
+    if any(totals.values()):
+        logger.info(f"Email delivery: {totals}")
+    return totals
+
+
+@shared_task(name='core.cleanup_sent_emails')
+def cleanup_sent_emails(days=7):
+    """Delete sent emails older than specified days"""
+    from .models import OutgoingEmail
+
+    cutoff_date = timezone.now() - timedelta(days=days)
+    deleted_count, _ = OutgoingEmail.objects.filter(
+        status='sent',
+        sent_at__lt=cutoff_date
+    ).delete()
+
+    logger.info(f"Cleaned up {deleted_count} sent emails older than {days} days")
+
+    return {
+        'deleted_count': deleted_count,
+        'cutoff_date': cutoff_date.isoformat()
+    }
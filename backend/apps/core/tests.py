@@ -0,0 +1,549 @@
+import socketserver
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.cache.backends.redis import RedisCache
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from redis.exceptions import ConnectionError as RedisConnectionError, ResponseError
+
+from apps.games.models import Game
+from apps.orders.models import Order
+from apps.users.models import User
+from . import cache_backends, mailer, outbox
+from .cache import get_or_compute, invalidate_tags, make_key
+from .cache_backends import ResilientRedisCache
+from .models import OutboxEvent, OutgoingEmail, SiteConfiguration
+from .singletons import SingletonCache
+from .tasks import relay_outbox
+
+
+class SMTPStub(socketserver.ThreadingTCPServer):
+    """
+    Minimal local SMTP server: accepts every message except those to
+    `refused` recipients, and counts connections and delivered messages.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPHandler)
+        self.connections = 0
+        self.messages = []
+        self.refused = set()
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        recipients = []
+        self.reply('220 stub ESMTP')
+        for raw in self.rfile:
+            command = raw.decode().strip()
+            verb = command[:4].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 stub')
+            elif verb == 'MAIL':
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                address = command.split(':', 1)[1].strip(' <>')
+                if address in server.refused:
+                    self.reply('550 No such user')
+                else:
+                    recipients.append(address)
+                    self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                for line in self.rfile:
+                    if line in (b'.\r\n', b'.\n'):
+                        break
+                server.messages.extend(recipients)
+                self.reply('250 OK')
+            elif verb == 'RSET':
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+@override_settings(EMAIL_MAX_ATTEMPTS=3, EMAIL_RETRY_DELAY=30)
+class MailerDeliveryTests(TestCase):
+    """deliver() against a local SMTP server"""
+
+    def setUp(self):
+        self.smtp = SMTPStub()
+        self.smtp.start()
+        self.addCleanup(self.smtp.stop)
+        email_settings = override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1',
+            EMAIL_PORT=self.smtp.server_address[1],
+            EMAIL_USE_TLS=False,
+            EMAIL_HOST_USER='',
+            EMAIL_HOST_PASSWORD='',
+        )
+        email_settings.enable()
+        self.addCleanup(email_settings.disable)
+
+    def queue(self, count, prefix='user'):
+        return [
+            mailer.enqueue(f'{prefix}{i}@example.com', 'Hello', body='Hi there')
+            for i in range(count)
+        ]
+
+    def test_batch_uses_one_connection(self):
+        self.queue(10)
+
+        result = mailer.deliver(batch_size=10)
+
+        self.assertEqual(result, {'sent': 10, 'retried': 0, 'failed': 0})
+        self.assertEqual(self.smtp.connections, 1)
+        self.assertEqual(len(self.smtp.messages), 10)
+        self.assertFalse(OutgoingEmail.objects.exclude(status='sent').exists())
+
+    def test_batch_size_limits_each_run(self):
+        self.queue(5)
+
+        self.assertEqual(mailer.deliver(batch_size=3)['sent'], 3)
+        self.assertEqual(mailer.deliver(batch_size=3)['sent'], 2)
+        self.assertEqual(self.smtp.connections, 2)
+
+    def test_failed_message_is_retried_with_backoff(self):
+        self.queue(2)
+        bounced = mailer.enqueue('bounce@example.com', 'Hello', body='Hi there')
+        self.queue(2, prefix='late')
+        self.smtp.refused.add('bounce@example.com')
+
+        before = timezone.now()
+        result = mailer.deliver()
+
+        # The rest of the batch still goes out, on a fresh connection after the failure
+        self.assertEqual(result, {'sent': 4, 'retried': 1, 'failed': 0})
+        self.assertEqual(self.smtp.connections, 2)
+        bounced.refresh_from_db()
+        self.assertEqual((bounced.status, bounced.attempts), ('pending', 1))
+        self.assertIn('SMTPRecipientsRefused', bounced.last_error)
+        self.assertGreaterEqual(bounced.available_at, before + timedelta(seconds=30))
+
+        # Not due yet
+        self.assertEqual(mailer.deliver(), {'sent': 0, 'retried': 0, 'failed': 0})
+
+        # Second attempt waits twice as long
+        OutgoingEmail.objects.filter(pk=bounced.pk).update(available_at=timezone.now())
+        before = timezone.now()
+        self.assertEqual(mailer.deliver()['retried'], 1)
+        bounced.refresh_from_db()
+        self.assertEqual(bounced.attempts, 2)
+        self.assertGreaterEqual(bounced.available_at, before + timedelta(seconds=60))
+
+        # Third attempt reaches EMAIL_MAX_ATTEMPTS
+        OutgoingEmail.objects.filter(pk=bounced.pk).update(available_at=timezone.now())
+        self.assertEqual(mailer.deliver()['failed'], 1)
+        bounced.refresh_from_db()
+        self.assertEqual((bounced.status, bounced.attempts), ('failed', 3))
+
+    def test_recovered_message_is_sent_on_retry(self):
+        bounced = mailer.enqueue('bounce@example.com', 'Hello', body='Hi there')
+        self.smtp.refused.add('bounce@example.com')
+        mailer.deliver()
+
+        self.smtp.refused.clear()
+        OutgoingEmail.objects.filter(pk=bounced.pk).update(available_at=timezone.now())
+        self.assertEqual(mailer.deliver()['sent'], 1)
+        bounced.refresh_from_db()
+        self.assertEqual((bounced.status, bounced.attempts), ('sent', 1))
+        self.assertEqual(self.smtp.messages, ['bounce@example.com'])
+
+
+@override_settings(OUTBOX_MAX_ATTEMPTS=3)
+class OutboxRelayTests(TestCase):
+    """relay() with test subscribers in place of the real ones"""
+
+    def setUp(self):
+        patcher = mock.patch.dict(outbox._subscribers, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.received = []
+        outbox.subscriber('test.ok')(self.received.append)
+
+    def fail_on(self, event_type):
+        def handler(payload):
+            # A side effect that must not survive the failure
+            mailer.enqueue('side@example.com', 'Side effect', body='')
+            raise RuntimeError('subscriber down')
+        outbox.subscriber(event_type)(handler)
+
+    def test_events_are_dispatched_once(self):
+        outbox.publish('test.ok', n=1)
+        outbox.publish_many([('test.ok', {'n': 2}), ('test.unhandled', {'n': 3})])
+
+        self.assertEqual(outbox.relay(), {'processed': 3, 'retried': 0, 'failed': 0})
+        self.assertEqual(self.received, [{'n': 1}, {'n': 2}])
+        self.assertFalse(OutboxEvent.objects.exclude(status='processed').exists())
+        self.assertEqual(outbox.relay(), {'processed': 0, 'retried': 0, 'failed': 0})
+
+    def test_failed_subscriber_keeps_the_event_and_backs_off(self):
+        self.fail_on('test.broken')
+        broken = outbox.publish('test.broken', n=1)
+        outbox.publish('test.ok', n=2)
+
+        before = timezone.now()
+        self.assertEqual(outbox.relay(), {'processed': 1, 'retried': 1, 'failed': 0})
+
+        broken.refresh_from_db()
+        self.assertEqual((broken.status, broken.attempts), ('pending', 1))
+        self.assertEqual(broken.last_error, 'RuntimeError: subscriber down')
+        self.assertGreaterEqual(broken.available_at, before + timedelta(seconds=2))
+        # Only the failing event's side effects were rolled back
+        self.assertFalse(OutgoingEmail.objects.exists())
+        self.assertEqual(self.received, [{'n': 2}])
+        # Not due again until the backoff passes
+        self.assertEqual(outbox.relay(), {'processed': 0, 'retried': 0, 'failed': 0})
+
+    def test_event_fails_after_max_attempts(self):
+        self.fail_on('test.broken')
+        broken = outbox.publish('test.broken', n=1)
+
+        for attempt in range(1, 4):
+            OutboxEvent.objects.filter(pk=broken.pk).update(available_at=timezone.now())
+            result = outbox.relay()
+            broken.refresh_from_db()
+            self.assertEqual(broken.attempts, attempt)
+        self.assertEqual(result, {'processed': 0, 'retried': 0, 'failed': 1})
+        self.assertEqual(broken.status, 'failed')
+
+        OutboxEvent.objects.filter(pk=broken.pk).update(available_at=timezone.now())
+        self.assertEqual(outbox.relay(), {'processed': 0, 'retried': 0, 'failed': 0})
+
+    def test_rolled_back_event_is_never_delivered(self):
+        with mock.patch.object(outbox, 'schedule_relay') as schedule_relay:
+            with self.captureOnCommitCallbacks(execute=True):
+                with self.assertRaises(RuntimeError):
+                    with transaction.atomic():
+                        outbox.publish('test.ok', n=1)
+                        raise RuntimeError('business change failed')
+            schedule_relay.assert_not_called()
+
+        self.assertFalse(OutboxEvent.objects.exists())
+        self.assertEqual(outbox.relay()['processed'], 0)
+        self.assertEqual(self.received, [])
+
+    def test_committed_event_schedules_a_relay(self):
+        with mock.patch.object(outbox, 'schedule_relay') as schedule_relay:
+            with self.captureOnCommitCallbacks(execute=True):
+                outbox.publish('test.ok', n=1)
+            schedule_relay.assert_called_once_with()
+
+    def test_task_drains_every_batch(self):
+        for n in range(5):
+            outbox.publish('test.ok', n=n)
+
+        self.assertEqual(relay_outbox(batch_size=2), {'processed': 5, 'retried': 0, 'failed': 0})
+        self.assertEqual([payload['n'] for payload in self.received], [0, 1, 2, 3, 4])
+
+
+class ChangeTrackingTests(TestCase):
+    """ChangeTrackingMixin snapshots, exercised through Order.status"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='buyer', email='buyer@example.com', password='pass12345')
+        game = Game.objects.create(name='Game', slug='game', description='Game')
+        cls.order = Order.objects.create(user=user, game=game, game_uid='1', price=Decimal('10'))
+
+    def test_loaded_instance_snapshots_tracked_fields(self):
+        order = Order.objects.get(pk=self.order.pk)
+        self.assertEqual(order._loaded_values, {'status': 'pending_payment'})
+        self.assertFalse(order.has_changed('status'))
+
+        order.status = 'paid'
+        self.assertTrue(order.has_changed('status'))
+        self.assertEqual(order.get_previous_value('status'), 'pending_payment')
+
+    def test_unsaved_instance_has_no_previous_value(self):
+        order = Order(user=self.order.user, game=self.order.game, game_uid='2', price=Decimal('10'))
+        self.assertIsNone(order.get_previous_value('status'))
+        self.assertTrue(order.has_changed('status'))
+
+    def test_save_refreshes_the_snapshot(self):
+        order = Order.objects.get(pk=self.order.pk)
+        order.status = 'paid'
+        # UPDATE plus the status-change outbox event; the old row is not re-read
+        with mock.patch('apps.core.outbox.schedule_relay'), self.assertNumQueries(4):
+            order.save()
+        self.assertFalse(order.has_changed('status'))
+        self.assertEqual(order.get_previous_value('status'), 'paid')
+
+    def test_save_of_other_fields_keeps_unsaved_changes(self):
+        order = Order.objects.get(pk=self.order.pk)
+        order.status = 'paid'
+        order.admin_note = 'checked'
+        order.save(update_fields=['admin_note'])
+        self.assertTrue(order.has_changed('status'))
+        self.assertEqual(order.get_previous_value('status'), 'pending_payment')
+
+    def test_refresh_from_db_takes_a_new_snapshot(self):
+        order = Order.objects.get(pk=self.order.pk)
+        Order.objects.filter(pk=order.pk).update(status='paid')
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'paid')
+        self.assertFalse(order.has_changed('status'))
+
+        # Reloading other fields leaves the status snapshot and its edit alone
+        order.status = 'processing'
+        order.refresh_from_db(fields=['admin_note'])
+        self.assertTrue(order.has_changed('status'))
+        self.assertEqual(order.get_previous_value('status'), 'paid')
+
+    def test_deferred_field_is_not_loaded_for_the_snapshot(self):
+        with self.assertNumQueries(1):
+            order = Order.objects.only('id').get(pk=self.order.pk)
+        self.assertEqual(order._loaded_values, {})
+
+        # The previous value comes from the row, without loading the field on the instance
+        with self.assertNumQueries(1):
+            self.assertEqual(order.get_previous_value('status'), 'pending_payment')
+        self.assertNotIn('status', order.__dict__)
+
+    def test_loading_a_deferred_field_snapshots_it(self):
+        order = Order.objects.only('id').get(pk=self.order.pk)
+        self.assertEqual(order.status, 'pending_payment')
+        self.assertEqual(order._loaded_values, {'status': 'pending_payment'})
+        with self.assertNumQueries(0):
+            self.assertFalse(order.has_changed('status'))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class SingletonCacheTests(TestCase):
+    """Singletons are read from the process copy until a save bumps their version"""
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.dict(SingletonCache._entries, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        SiteConfiguration().save()
+
+    def test_process_copy_is_reused_while_the_version_holds(self):
+        with self.assertNumQueries(1):
+            config = SiteConfiguration.get_config()
+        with self.assertNumQueries(0):
+            self.assertIs(SiteConfiguration.get_config(), config)
+
+    def test_save_reloads_after_commit(self):
+        config = SiteConfiguration.get_config()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            SiteConfiguration(pk=1, warranty_extra_rate=Decimal('0.3')).save()
+
+        with self.assertNumQueries(1):
+            reloaded = SiteConfiguration.get_config()
+        self.assertIsNot(reloaded, config)
+        self.assertEqual(reloaded.warranty_extra_rate, Decimal('0.3'))
+
+    def test_other_process_save_is_seen_through_the_version(self):
+        config = SiteConfiguration.get_config()
+        # Another worker saved and bumped the version; this process's copy is untouched
+        SiteConfiguration.objects.filter(pk=1).update(maintenance_mode=True)
+        invalidate_tags(SingletonCache.tag(SiteConfiguration))
+
+        reloaded = SiteConfiguration.get_config()
+        self.assertIsNot(reloaded, config)
+        self.assertTrue(reloaded.maintenance_mode)
+
+    def test_rolled_back_save_does_not_bump_the_version(self):
+        SiteConfiguration.get_config()
+        version = SingletonCache._current_version(SiteConfiguration)
+
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                SiteConfiguration(pk=1, maintenance_mode=True).save()
+                raise RuntimeError('admin form failed')
+
+        self.assertEqual(SingletonCache._current_version(SiteConfiguration), version)
+        self.assertFalse(SiteConfiguration.get_config().maintenance_mode)
+
+    def test_unavailable_cache_reads_the_database(self):
+        SiteConfiguration.get_config()
+        with mock.patch.object(SingletonCache, '_current_version', return_value=None):
+            with self.assertNumQueries(1):
+                first = SiteConfiguration.get_config()
+            with self.assertNumQueries(1):
+                self.assertIsNot(SiteConfiguration.get_config(), first)
+
+
+UNREACHABLE_REDIS = {
+    'BACKEND': 'apps.core.cache_backends.ResilientRedisCache',
+    'LOCATION': 'redis://127.0.0.1:1/0',
+    'FAILURE_COOLDOWN': 5,
+}
+
+
+class ResilientRedisCacheTests(TestCase):
+    """An unreachable Redis turns the backend into an empty cache for FAILURE_COOLDOWN seconds"""
+
+    def setUp(self):
+        ResilientRedisCache._down_until = 0.0
+        self.addCleanup(setattr, ResilientRedisCache, '_down_until', 0.0)
+        patcher = mock.patch.dict(cache_backends._clients, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = ResilientRedisCache(UNREACHABLE_REDIS['LOCATION'], UNREACHABLE_REDIS)
+
+    def test_unreachable_redis_reads_as_empty(self):
+        with mock.patch.object(RedisCache, 'get', side_effect=RedisConnectionError('refused')) as get:
+            self.assertEqual(self.cache.get('key', 'default'), 'default')
+            self.assertTrue(self.cache.is_degraded())
+
+            self.assertIsNone(self.cache.get('key'))
+            # Degraded: Redis is not tried again during the cooldown
+            self.assertEqual(get.call_count, 1)
+
+        self.assertIsNone(self.cache.set('key', 1))
+        self.assertFalse(self.cache.add('key', 1))
+        self.assertEqual(self.cache.get_many(['key']), {})
+        self.assertFalse(self.cache.has_key('key'))
+        self.assertFalse(self.cache.delete('key'))
+        with self.assertRaises(ValueError):
+            self.cache.incr('key')
+
+    def test_redis_is_tried_again_after_the_cooldown(self):
+        with mock.patch.object(cache_backends, 'time') as clock, \
+                mock.patch.object(RedisCache, 'get', side_effect=[RedisConnectionError('refused'), 'value']) as get:
+            clock.monotonic.return_value = 100.0
+            self.assertIsNone(self.cache.get('key'))
+            clock.monotonic.return_value = 104.9
+            self.assertIsNone(self.cache.get('key'))
+            clock.monotonic.return_value = 105.0
+            self.assertEqual(self.cache.get('key'), 'value')
+
+        self.assertEqual(get.call_count, 2)
+
+    def test_other_redis_errors_are_raised(self):
+        with mock.patch.object(RedisCache, 'get', side_effect=ResponseError('WRONGTYPE')):
+            with self.assertRaises(ResponseError):
+                self.cache.get('key')
+        self.assertFalse(self.cache.is_degraded())
+
+    def test_backends_share_one_client_per_process(self):
+        other = ResilientRedisCache(UNREACHABLE_REDIS['LOCATION'], UNREACHABLE_REDIS)
+        self.assertIs(self.cache._cache, other._cache)
+
+    @override_settings(CACHES={'default': UNREACHABLE_REDIS})
+    def test_rate_limits_fail_closed_while_degraded(self):
+        # Counting is impossible without Redis; forgot-password refuses rather than going unlimited
+        ResilientRedisCache._down_until = float('inf')
+
+        response = self.client.post(reverse('users:forgot_password'), {'email': 'someone@example.com'})
+
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class GetOrComputeTests(TestCase):
+    """Tag-versioned read-through caching with single-flight recomputes"""
+
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self, value='value'):
+        def compute():
+            self.calls += 1
+            return value
+        return compute
+
+    def test_value_is_computed_once(self):
+        for _ in range(3):
+            self.assertEqual(get_or_compute('key', self.compute(), beta=0), 'value')
+        self.assertEqual(self.calls, 1)
+
+    def test_invalidated_tag_misses_only_its_entries(self):
+        get_or_compute('games', self.compute('old'), tags=('games',), beta=0)
+        get_or_compute('news', self.compute('news'), tags=('news',), beta=0)
+
+        invalidate_tags('games')
+
+        self.assertEqual(get_or_compute('games', self.compute('new'), tags=('games',), beta=0), 'new')
+        self.assertEqual(get_or_compute('news', self.compute('other'), tags=('news',), beta=0), 'news')
+        self.assertEqual(self.calls, 3)
+
+    def test_concurrent_misses_compute_once(self):
+        results = []
+        barrier = threading.Barrier(8)
+
+        def slow():
+            self.calls += 1
+            time.sleep(0.2)
+            return 'value'
+
+        def read():
+            barrier.wait()
+            results.append(get_or_compute('key', slow, beta=0, wait_timeout=5))
+
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ['value'] * 8)
+        self.assertEqual(self.calls, 1)
+
+    def test_waiter_computes_itself_when_the_holder_is_too_slow(self):
+        cache.add(make_key('lock', 'key'), 'other process')
+        self.assertEqual(get_or_compute('key', self.compute(), wait_timeout=0.05), 'value')
+        self.assertEqual(self.calls, 1)
+
+    def test_early_refresh_serves_the_old_value_while_another_process_recomputes(self):
+        get_or_compute('key', self.compute('old'))
+        cache.add(make_key('lock', 'key'), 'other process')
+
+        with mock.patch('apps.core.cache._should_refresh_early', return_value=True):
+            self.assertEqual(get_or_compute('key', self.compute('new')), 'old')
+        self.assertEqual(self.calls, 1)
+
+        cache.delete(make_key('lock', 'key'))
+        with mock.patch('apps.core.cache._should_refresh_early', return_value=True):
+            self.assertEqual(get_or_compute('key', self.compute('new')), 'new')
+
+    def test_entries_near_expiry_are_refreshed_early(self):
+        get_or_compute('key', self.compute('old'), timeout=60)
+        entry = cache.get('key')
+        entry['delta'] = 1.0
+        entry['expires_at'] = time.time() + 5
+        cache.set('key', entry)
+
+        # -log(1 - 0.999) * delta is about 7s, past the 5s left
+        with mock.patch('apps.core.cache.random.random', return_value=0.999):
+            self.assertEqual(get_or_compute('key', self.compute('new'), beta=0), 'old')
+            self.assertEqual(get_or_compute('key', self.compute('new')), 'new')
+
+    def test_degraded_cache_always_computes(self):
+        with mock.patch('apps.core.cache.is_degraded', return_value=True):
+            get_or_compute('key', self.compute())
+            get_or_compute('key', self.compute())
+
+        self.assertEqual(self.calls, 2)
+        self.assertIsNone(cache.get('key'))
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class GamesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.games'
+
+    def ready(self):
+        """Import signals when app is ready"""
+        import apps.games.signals  # noqa
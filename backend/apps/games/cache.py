@@ -0,0 +1,101 @@
+"""
+Catalog response cache
+
+Public catalog endpoints store their rendered JSON bytes under
+catalog:<version>:<URL>, where the URL is the scheme, host (validated by
+ALLOWED_HOSTS; images are rendered as absolute URLs), path and the query
+parameters the view actually reads (catalog_cache_params), sorted and
+normalized. Requests carrying any other parameter bypass the cache, so
+junk query strings cannot fill it. Only requests that negotiate plain JSON
+(Accept header and ?format=) use the cache; the browsable API and any
+other renderer always go through the view. Any Game, GamePackage or
+SiteConfiguration change bumps the version (after commit), so old entries
+are simply never read again and expire on their own.
+"""
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.request import Request
+
+from apps.core.cache import get_tag_versions, invalidate_tags, is_degraded, make_key
+
+CATALOG_TAG = 'catalog'
+
+
+def get_catalog_version():
+    """Current catalog version (the version of the 'catalog' cache tag)"""
+    return get_tag_versions([CATALOG_TAG])[CATALOG_TAG]
+
+
+def bump_catalog_version():
+    """Invalidate every cached catalog response"""
+    invalidate_tags(CATALOG_TAG)
+
+
+def catalog_cache_key(request, version, query):
+    """Key per host, path and normalized query"""
+    return make_key('catalog', version, f'{request.scheme}://{request.get_host()}{request.path}?{query}')
+
+
+class CatalogCacheMixin:
+    """
+    APIView mixin serving GET responses from the catalog cache.
+    Only for AllowAny views whose output does not depend on the user.
+    A hit returns the stored bytes without touching the database.
+    """
+    catalog_cache_content_type = 'application/json'
+    # Query parameters the view reads; requests with any other one are not cached
+    catalog_cache_params = ()
+    # Comma-separated sets: order and duplicates do not change the response
+    catalog_cache_set_params = ('fields', 'omit')
+
+    def dispatch(self, request, *args, **kwargs):
+        query = self._catalog_query(request)
+        if (request.method != 'GET' or query is None or is_degraded()
+                or not self._negotiates_json(request, kwargs)):
+            return super().dispatch(request, *args, **kwargs)
+
+        version = get_catalog_version()
+        key = catalog_cache_key(request, version, query)
+        content = cache.get(key)
+        if content is not None:
+            response = HttpResponse(content, content_type=self.catalog_cache_content_type)
+            patch_vary_headers(response, ['Accept'])
+            return response
+
+        response = super().dispatch(request, *args, **kwargs)
+        # Only cache JSON (not the browsable API) success responses
+        if response.status_code == 200 and getattr(response, 'accepted_media_type', None) == self.catalog_cache_content_type:
+            response.render()
+            cache.set(key, response.content, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300))
+        return response
+
+    def _catalog_query(self, request):
+        """Normalized query string for the cache key, or None if it must not be cached"""
+        params = []
+        for name in sorted(request.GET):
+            if name == 'format':
+                # Only ?format=json gets past negotiation, same bytes as Accept
+                continue
+            values = request.GET.getlist(name)
+            if name not in self.catalog_cache_params or len(values) != 1:
+                return None
+            value = values[0]
+            if name in self.catalog_cache_set_params:
+                value = ','.join(sorted({item.strip() for item in value.split(',') if item.strip()}))
+            params.append((name, value))
+        return urlencode(params)
+
+    def _negotiates_json(self, request, kwargs):
+        """Would the view render this request as plain JSON?"""
+        try:
+            _, media_type = self.get_content_negotiator().select_renderer(
+                Request(request), self.get_renderers(), self.get_format_suffix(**kwargs)
+            )
+        except NotAcceptable:
+            return False
+        return media_type == self.catalog_cache_content_type
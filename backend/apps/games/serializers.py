@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from apps.core.serializers import SparseFieldsetsMixin
 from .models import Game, GamePackage
 
 
@@ -13,7 +14,7 @@ class GamePackageSerializer(serializers.ModelSerializer):
                   'in_game_unit_label', 'is_active', 'display_order']
 
 
-class GameListSerializer(serializers.ModelSerializer):
+class GameListSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     """Serializer for listing games"""
     image = serializers.SerializerMethodField()
     icon = serializers.SerializerMethodField()
@@ -21,6 +22,7 @@ class GameListSerializer(serializers.ModelSerializer):
     class Meta:
         model = Game
         fields = ['id', 'name', 'slug', 'description', 'image', 'icon', 'status']
+        field_sources = {'image': ('image',), 'icon': ('icon',)}
 
     def get_image(self, obj):
         """Return full URL for image"""
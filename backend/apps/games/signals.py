@@ -0,0 +1,17 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from apps.core.models import SiteConfiguration
+from .cache import bump_catalog_version
+from .models import Game, GamePackage
+
+
+@receiver(post_save, sender=Game)
+@receiver(post_delete, sender=Game)
+@receiver(post_save, sender=GamePackage)
+@receiver(post_delete, sender=GamePackage)
+@receiver(post_save, sender=SiteConfiguration)
+@receiver(post_delete, sender=SiteConfiguration)
+def invalidate_catalog_cache(sender, instance, **kwargs):
+    """Bump the catalog version once the change is visible to readers"""
+    transaction.on_commit(bump_catalog_version)
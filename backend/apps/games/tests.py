@@ -0,0 +1,72 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from .models import Game
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CatalogCacheTests(APITestCase):
+    """Cached catalog bytes are only served to requests that negotiate JSON"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Game.objects.create(name='Game', slug='game', description='Game', status='active')
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('games:game_list')
+
+    def test_json_hit_skips_the_database(self):
+        first = self.client.get(self.url, HTTP_ACCEPT='application/json')
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url, HTTP_ACCEPT='application/json')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Content-Type'], 'application/json')
+        self.assertIn('Accept', second['Vary'])
+
+    def test_browsable_api_is_not_served_cached_json(self):
+        self.client.get(self.url, HTTP_ACCEPT='application/json')
+
+        response = self.client.get(self.url, HTTP_ACCEPT='text/html')
+        self.assertTrue(response['Content-Type'].startswith('text/html'))
+
+        response = self.client.get(self.url, {'format': 'api'})
+        self.assertTrue(response['Content-Type'].startswith('text/html'))
+
+    def test_browsable_api_does_not_fill_the_cache(self):
+        self.client.get(self.url, HTTP_ACCEPT='text/html')
+
+        response = self.client.get(self.url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.json()['results'][0]['slug'], 'game')
+
+    def test_json_variants_bypass_the_cache(self):
+        self.client.get(self.url, HTTP_ACCEPT='application/json')
+
+        response = self.client.get(self.url, HTTP_ACCEPT='application/json; indent=4')
+        self.assertIn(b'\n    ', response.content)
+
+    def test_equivalent_queries_share_an_entry(self):
+        self.client.get(self.url, {'fields': 'slug,name', 'page': '1'}, HTTP_ACCEPT='application/json')
+
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                f'{self.url}?page=1&fields=name,slug,name&format=json', HTTP_ACCEPT='application/json'
+            )
+        self.assertEqual(set(response.json()['results'][0]), {'name', 'slug'})
+
+    def test_unknown_params_bypass_the_cache(self):
+        for params in ({'utm_source': 'x'}, {'search': ['game', 'game']}):
+            self.client.get(self.url, params, HTTP_ACCEPT='application/json')
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self.url, params, HTTP_ACCEPT='application/json')
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(queries.captured_queries)
+
+        # Nothing was stored for them
+        self.assertEqual(len(cache._cache), 0)
@@ -3,11 +3,13 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
+from apps.core.mixins import SparseFieldsetsViewMixin
+from .cache import CatalogCacheMixin
 from .models import Game, GamePackage
 from .serializers import GameListSerializer, GameDetailSerializer, GamePackageSerializer
 
 
-class GameListView(generics.ListAPIView):
+class GameListView(CatalogCacheMixin, SparseFieldsetsViewMixin, generics.ListAPIView):
     """API endpoint for listing games"""
     queryset = Game.objects.filter(status='active')
     serializer_class = GameListSerializer
@@ -16,6 +18,7 @@ class GameListView(generics.ListAPIView):
     search_fields = ['name', 'description']
     ordering_fields = ['display_order', 'created_at', 'name']
     ordering = ['display_order']
+    catalog_cache_params = ('search', 'ordering', 'page', 'fields', 'omit')
 
     def get_serializer_context(self):
         """Pass request context to serializer"""
@@ -24,7 +27,7 @@ class GameListView(generics.ListAPIView):
         return context
 
 
-class GameDetailView(generics.RetrieveAPIView):
+class GameDetailView(CatalogCacheMixin, generics.RetrieveAPIView):
     """API endpoint for game detail"""
     queryset = Game.objects.all()
     serializer_class = GameDetailSerializer
@@ -38,7 +41,7 @@ class GameDetailView(generics.RetrieveAPIView):
         return context
 
 
-class GamePackagesView(APIView):
+class GamePackagesView(CatalogCacheMixin, APIView):
     """
     API endpoint to get packages for a specific game, grouped by type.
 
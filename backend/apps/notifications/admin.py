@@ -1,8 +1,11 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from django import forms
+from django.db.models import Count
+from django.utils import timezone
 from django.contrib.auth import get_user_model
-from .models import Notification, NotificationPreference
+from . import counters
+from .models import Broadcast, Notification, NotificationPreference
 from .services import NotificationService
 
 User = get_user_model()
@@ -39,7 +42,7 @@ class NotificationAdmin(admin.ModelAdmin):
     list_display = [
         'id',
         'user_email',
-        'title',
+        'display_title',
         'notification_type_badge',
         'is_read_icon',
         'is_important_icon',
@@ -49,6 +52,7 @@ class NotificationAdmin(admin.ModelAdmin):
         'notification_type',
         'is_read',
         'is_important',
+        'telegram_status',
         'created_at',
     ]
     search_fields = [
@@ -56,9 +60,11 @@ class NotificationAdmin(admin.ModelAdmin):
         'user__username',
         'title',
         'message',
+        'template_key',
         'order_id',
     ]
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['rendered_message', 'telegram_status', 'telegram_attempts', 'telegram_sent_at', 'telegram_error',
+                       'telegram_available_at', 'created_at', 'updated_at']
     ordering = ['-created_at']
     date_hierarchy = 'created_at'
 
@@ -67,7 +73,8 @@ class NotificationAdmin(admin.ModelAdmin):
             'fields': ('user',)
         }),
         ('Content', {
-            'fields': ('title', 'message', 'notification_type', 'is_important')
+            'fields': ('title', 'message', 'template_key', 'params', 'rendered_message',
+                       'notification_type', 'is_important')
         }),
         ('Status', {
             'fields': ('is_read',)
@@ -76,6 +83,11 @@ class NotificationAdmin(admin.ModelAdmin):
             'fields': ('order_id', 'transaction_id'),
             'classes': ('collapse',)
         }),
+        ('Telegram', {
+            'fields': ('telegram_status', 'telegram_attempts', 'telegram_sent_at', 'telegram_error',
+                       'telegram_available_at'),
+            'classes': ('collapse',)
+        }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)
@@ -87,6 +99,14 @@ class NotificationAdmin(admin.ModelAdmin):
     user_email.short_description = 'User'
     user_email.admin_order_field = 'user__email'
 
+    def display_title(self, obj):
+        return obj.render()[0]
+    display_title.short_description = 'Title'
+
+    def rendered_message(self, obj):
+        return obj.render()[1]
+    rendered_message.short_description = 'Rendered Message'
+
     def notification_type_badge(self, obj):
         colors = {
             'ORDER': '#3b82f6',    # blue
@@ -122,12 +142,16 @@ class NotificationAdmin(admin.ModelAdmin):
 
     @admin.action(description="Mark selected as read")
     def mark_as_read(self, request, queryset):
-        updated = queryset.update(is_read=True)
+        user_ids = list(queryset.values_list('user_id', flat=True).distinct())
+        updated = queryset.update(is_read=True, updated_at=timezone.now())
+        counters.reset(user_ids)
         self.message_user(request, f"{updated} notification(s) marked as read.")
 
     @admin.action(description="Mark selected as unread")
     def mark_as_unread(self, request, queryset):
-        updated = queryset.update(is_read=False)
+        user_ids = list(queryset.values_list('user_id', flat=True).distinct())
+        updated = queryset.update(is_read=False, updated_at=timezone.now())
+        counters.reset(user_ids)
         self.message_user(request, f"{updated} notification(s) marked as unread.")
 
     def get_urls(self):
@@ -155,14 +179,15 @@ class NotificationAdmin(admin.ModelAdmin):
                 is_important = form.cleaned_data['is_important']
 
                 if recipient_type == 'all':
-                    notifications = NotificationService.broadcast_system_notification(
+                    broadcast = NotificationService.broadcast_system_notification(
                         title=title,
                         message=message,
-                        is_important=is_important
+                        is_important=is_important,
+                        created_by=request.user
                     )
                     messages.success(
                         request,
-                        f"System notification sent to {len(notifications)} users."
+                        f"Broadcast #{broadcast.pk} published to all users."
                     )
                 else:
                     user = form.cleaned_data['user']
@@ -231,3 +256,27 @@ class NotificationPreferenceAdmin(admin.ModelAdmin):
         return obj.user.email
     user_email.short_description = 'User'
     user_email.admin_order_field = 'user__email'
+
+
+@admin.register(Broadcast)
+class BroadcastAdmin(admin.ModelAdmin):
+    list_display = ['id', 'title', 'is_important', 'is_active', 'read_count', 'created_by', 'created_at']
+    list_filter = ['is_active', 'is_important', 'created_at']
+    list_editable = ['is_active']
+    search_fields = ['title', 'message']
+    readonly_fields = ['created_by', 'created_at', 'updated_at']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('created_by').annotate(
+            _read_count=Count('receipts')
+        )
+
+    def read_count(self, obj):
+        return obj._read_count
+    read_count.short_description = 'Read'
+    read_count.admin_order_field = '_read_count'
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            obj.created_by = request.user
+        super().save_model(request, obj, form, change)
@@ -0,0 +1,136 @@
+"""
+Notification message catalog
+
+Notifications raised by the notify_* helpers store only a template key and
+a small params payload (e.g. {'order_id': ..., 'amount': ...}); title and
+message are rendered from this catalog when the notification is read, in
+the reader's locale. Rendered texts are cached per process.
+
+Free-form notifications (admin messages, rows written before templates)
+keep their text in title/message and have no template key.
+"""
+from functools import lru_cache
+
+DEFAULT_LOCALE = 'en'
+LOCALES = ('en', 'vi', 'cn')
+
+# Accept-Language codes that map onto a catalog locale
+LANGUAGE_ALIASES = {
+    'zh': 'cn',
+}
+
+# key: {locale: (title, message)}; messages are str.format templates over params
+TEMPLATES = {
+    'deposit_confirmed': {
+        'en': ('Deposit Successful', 'Your deposit of ${amount} USD has been confirmed and added to your wallet.'),
+        'vi': ('Nạp tiền thành công', 'Khoản nạp ${amount} USD của bạn đã được xác nhận và cộng vào ví.'),
+        'cn': ('充值成功', '您的 ${amount} USD 充值已确认并存入钱包。'),
+    },
+    'deposit_rejected': {
+        'en': ('Deposit Rejected', 'Your deposit of ${amount} USD has been rejected.'),
+        'vi': ('Nạp tiền bị từ chối', 'Khoản nạp ${amount} USD của bạn đã bị từ chối.'),
+        'cn': ('充值被拒绝', '您的 ${amount} USD 充值已被拒绝。'),
+    },
+    'withdraw_approved': {
+        'en': ('Withdrawal Approved', 'Your withdrawal request of ${amount} USD has been approved.'),
+        'vi': ('Rút tiền đã được duyệt', 'Yêu cầu rút ${amount} USD của bạn đã được duyệt.'),
+        'cn': ('提现已批准', '您的 ${amount} USD 提现申请已批准。'),
+    },
+    'withdraw_rejected': {
+        'en': ('Withdrawal Rejected', 'Your withdrawal request of ${amount} USD has been rejected.'),
+        'vi': ('Rút tiền bị từ chối', 'Yêu cầu rút ${amount} USD của bạn đã bị từ chối.'),
+        'cn': ('提现被拒绝', '您的 ${amount} USD 提现申请已被拒绝。'),
+    },
+    'order_created': {
+        'en': ('Order Created', 'Your order #{order_id} for {game_name} has been created successfully.'),
+        'vi': ('Đã tạo đơn hàng', 'Đơn hàng #{order_id} cho {game_name} của bạn đã được tạo thành công.'),
+        'cn': ('订单已创建', '您的 {game_name} 订单 #{order_id} 已成功创建。'),
+    },
+    'order_processing': {
+        'en': ('Order Processing', 'Your order #{order_id} is now being processed.'),
+        'vi': ('Đơn hàng đang xử lý', 'Đơn hàng #{order_id} của bạn đang được xử lý.'),
+        'cn': ('订单处理中', '您的订单 #{order_id} 正在处理中。'),
+    },
+    'order_completed': {
+        'en': ('Order Completed', 'Your order #{order_id} has been completed successfully!'),
+        'vi': ('Đơn hàng hoàn tất', 'Đơn hàng #{order_id} của bạn đã hoàn tất!'),
+        'cn': ('订单已完成', '您的订单 #{order_id} 已成功完成！'),
+    },
+    'order_cancelled': {
+        'en': ('Order Cancelled', 'Your order #{order_id} has been cancelled.'),
+        'vi': ('Đơn hàng đã hủy', 'Đơn hàng #{order_id} của bạn đã bị hủy.'),
+        'cn': ('订单已取消', '您的订单 #{order_id} 已被取消。'),
+    },
+    'order_refunded': {
+        'en': ('Order Refunded', 'Your order #{order_id} has been refunded. ${amount} USD has been added to your wallet.'),
+        'vi': ('Đơn hàng đã hoàn tiền', 'Đơn hàng #{order_id} của bạn đã được hoàn tiền. ${amount} USD đã được cộng vào ví.'),
+        'cn': ('订单已退款', '您的订单 #{order_id} 已退款，${amount} USD 已存入您的钱包。'),
+    },
+}
+
+# Appended to any message whose params carry a reason
+REASON_SUFFIX = {
+    'en': ' Reason: {reason}',
+    'vi': ' Lý do: {reason}',
+    'cn': '原因：{reason}',
+}
+
+
+def normalize_locale(value):
+    """Catalog locale for a language code such as 'vi', 'zh-CN' or 'en-US', or None"""
+    if not value:
+        return None
+    language = value.strip().lower().replace('_', '-').split('-')[0]
+    language = LANGUAGE_ALIASES.get(language, language)
+    return language if language in LOCALES else None
+
+
+def get_locale(request):
+    """Locale for a request: ?lang=, then Accept-Language, then DEFAULT_LOCALE"""
+    if request is None:
+        return DEFAULT_LOCALE
+
+    query_params = getattr(request, 'query_params', request.GET)
+    locale = normalize_locale(query_params.get('lang'))
+    if locale:
+        return locale
+
+    # Quality values are ignored: browsers list languages in preference order
+    for item in request.META.get('HTTP_ACCEPT_LANGUAGE', '').split(','):
+        locale = normalize_locale(item.split(';')[0])
+        if locale:
+            return locale
+    return DEFAULT_LOCALE
+
+
+class _Params(dict):
+    """Params for str.format_map; placeholders without a value render empty"""
+
+    def __missing__(self, name):
+        return ''
+
+
+def render(template_key, params, locale=DEFAULT_LOCALE):
+    """
+    (title, message) for a template key in locale.
+
+    Returns None for keys missing from the catalog. Params missing for the
+    template (written for an older version of it) render as empty text:
+    templated rows keep no title/message of their own to fall back to.
+    """
+    frozen = tuple(sorted((name, str(value)) for name, value in (params or {}).items()))
+    return _render(template_key, frozen, locale if locale in LOCALES else DEFAULT_LOCALE)
+
+
+@lru_cache(maxsize=4096)
+def _render(template_key, frozen_params, locale):
+    texts = TEMPLATES.get(template_key)
+    if texts is None:
+        return None
+
+    params = _Params(frozen_params)
+    title, message = texts.get(locale) or texts[DEFAULT_LOCALE]
+    message = message.format_map(params)
+    if params.get('reason'):
+        message += REASON_SUFFIX[locale].format(reason=params['reason'])
+    return title, message
@@ -0,0 +1,117 @@
+"""
+Unread notification counters
+
+Each user's unread count is kept in the shared cache so the polled
+unread_count endpoint does not run COUNT(*) queries:
+
+* notifications:unread:<user_id> counts unread Notification rows. Writers
+  adjust it with INCR/DECR after commit; a missing key is simply rebuilt
+  on the next read, so adjustments never need the current value.
+* notifications:broadcast_unread:<user_id> counts unread broadcasts. It is
+  tagged with BROADCASTS_TAG (bumped on every Broadcast change) and dropped
+  when the user reads or dismisses one.
+
+Both keys expire after UNREAD_COUNTER_TIMEOUT, and the
+reconcile_unread_counters task rewrites recently active users' counters
+from the table, so any drift is bounded.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+from apps.core.cache import get_or_compute, invalidate_tags, make_key
+
+from . import feed
+from .models import Notification
+
+BROADCASTS_TAG = 'notifications:broadcasts'
+
+
+def _timeout():
+    return getattr(settings, 'UNREAD_COUNTER_TIMEOUT', 3600)
+
+
+def _unread_key(user_id):
+    return make_key('notifications', 'unread', user_id)
+
+
+def _broadcast_unread_key(user_id):
+    return make_key('notifications', 'broadcast_unread', user_id)
+
+
+def count_unread_notifications(user_id):
+    return Notification.objects.filter(user_id=user_id, is_read=False).count()
+
+
+def get_unread_count(user):
+    """Unread notifications plus unread broadcasts for user"""
+    key = _unread_key(user.pk)
+    count = cache.get(key)
+    if count is None:
+        count = count_unread_notifications(user.pk)
+        # add(): never overwrite a counter another process already rebuilt and adjusted
+        cache.add(key, count, _timeout())
+
+    return count + get_or_compute(
+        _broadcast_unread_key(user.pk),
+        lambda: feed.visible_broadcasts(user).filter(is_read=False).count(),
+        timeout=_timeout(),
+        tags=(BROADCASTS_TAG,)
+    )
+
+
+def adjust(user_id, delta):
+    """Add delta to user's unread counter once the current transaction commits"""
+    if delta:
+        transaction.on_commit(lambda: _apply(user_id, delta))
+
+
+def _apply(user_id, delta):
+    key = _unread_key(user_id)
+    try:
+        value = cache.incr(key, delta)
+    except ValueError:
+        # Not cached: the next read counts from the table
+        return
+    if value < 0:
+        cache.delete(key)
+
+
+def reset(user_ids):
+    """Drop the unread counters of user_ids (after commit); they are rebuilt on read"""
+    keys = [_unread_key(user_id) for user_id in set(user_ids)]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def reset_broadcasts(user_id):
+    """Drop user's broadcast counter (after commit)"""
+    transaction.on_commit(lambda: cache.delete(_broadcast_unread_key(user_id)))
+
+
+def invalidate_broadcasts():
+    """Every user's broadcast counter misses after the next commit"""
+    transaction.on_commit(lambda: invalidate_tags(BROADCASTS_TAG))
+
+
+def reconcile(user_ids):
+    """
+    Rewrite the unread counters of user_ids from the table.
+
+    Returns:
+        int: counters written
+    """
+    user_ids = set(user_ids)
+    counts = dict(
+        Notification.objects.filter(user_id__in=user_ids, is_read=False)
+        .order_by()
+        .values('user_id')
+        .annotate(unread=Count('id'))
+        .values_list('user_id', 'unread')
+    )
+    cache.set_many(
+        {_unread_key(user_id): counts.get(user_id, 0) for user_id in user_ids},
+        _timeout()
+    )
+    return len(user_ids)
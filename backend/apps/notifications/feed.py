@@ -0,0 +1,244 @@
+"""
+Notification feed
+
+A user's feed is their own Notification rows plus the active broadcasts,
+merged in SQL with UNION ALL so ordering and pagination stay in the
+database. Broadcast items carry the negated broadcast id, so existing
+clients keep addressing every feed item by a single integer id.
+
+Delta sync walks the same feed by (updated_at, id): a cursor names the last
+item a client has seen, and changes_since() returns what was created or
+updated after it.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import CharField, Exists, F, JSONField, OuterRef, Q, Value
+from django.utils import timezone
+
+from . import preferences
+from .models import Broadcast, BroadcastReceipt, Notification
+
+# Model fields selected from both tables, followed by the per-table item_* annotations.
+# Both halves of the UNION must select these in the same order.
+COMMON_FIELDS = ('title', 'message', 'is_important', 'created_at', 'updated_at')
+ITEM_FIELDS = (
+    'item_id', 'item_type', 'item_is_read', 'item_order_id', 'item_transaction_id',
+    'item_template_key', 'item_params',
+)
+
+
+def is_broadcast_id(item_id):
+    return int(item_id) < 0
+
+
+def broadcast_pk(item_id):
+    """Broadcast primary key for a (negative) feed item id"""
+    return -int(item_id)
+
+
+def visible_broadcasts(user):
+    """
+    Active broadcasts published since the user joined, minus dismissed ones,
+    annotated with is_read for that user.
+    """
+    receipts = BroadcastReceipt.objects.filter(broadcast=OuterRef('pk'), user=user)
+    queryset = Broadcast.objects.filter(
+        is_active=True,
+        created_at__gte=user.date_joined
+    ).annotate(
+        is_read=Exists(receipts)
+    ).exclude(
+        Exists(receipts.filter(is_dismissed=True))
+    )
+
+    # Broadcasts follow the user's system notification preference
+    if not preferences.is_enabled(user.pk, 'SYSTEM'):
+        return queryset.none()
+    return queryset
+
+
+def _after(cursor):
+    """Rows positioned after cursor in (updated_at, item_id) order"""
+    updated_at, item_id = cursor
+    return Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, item_id__gt=item_id)
+
+
+def _notification_rows(user, notification_type=None, unread=False, important=False, since=None):
+    queryset = Notification.objects.filter(user=user).annotate(item_id=F('id'))
+    if since:
+        queryset = queryset.filter(_after(since))
+    if notification_type:
+        queryset = queryset.filter(notification_type=notification_type)
+    if unread:
+        queryset = queryset.filter(is_read=False)
+    if important:
+        queryset = queryset.filter(is_important=True)
+
+    return queryset.order_by().annotate(
+        item_type=F('notification_type'),
+        item_is_read=F('is_read'),
+        item_order_id=F('order_id'),
+        item_transaction_id=F('transaction_id'),
+        item_template_key=F('template_key'),
+        item_params=F('params'),
+    ).values(*COMMON_FIELDS, *ITEM_FIELDS)
+
+
+def _broadcast_rows(user, unread=False, important=False, since=None):
+    queryset = visible_broadcasts(user).annotate(item_id=-F('id'))
+    if since:
+        queryset = queryset.filter(_after(since))
+    if unread:
+        queryset = queryset.filter(is_read=False)
+    if important:
+        queryset = queryset.filter(is_important=True)
+
+    return queryset.order_by().annotate(
+        item_type=Value('SYSTEM', output_field=CharField()),
+        item_is_read=F('is_read'),
+        item_order_id=Value(None, output_field=CharField()),
+        item_transaction_id=Value(None, output_field=CharField()),
+        item_template_key=Value('', output_field=CharField()),
+        item_params=Value(None, output_field=JSONField()),
+    ).values(*COMMON_FIELDS, *ITEM_FIELDS)
+
+
+def _to_instance(user, row):
+    return Notification(
+        id=row['item_id'],
+        user=user,
+        title=row['title'],
+        message=row['message'],
+        notification_type=row['item_type'],
+        is_read=row['item_is_read'],
+        is_important=row['is_important'],
+        order_id=row['item_order_id'],
+        transaction_id=row['item_transaction_id'],
+        template_key=row['item_template_key'],
+        params=row['item_params'] or {},
+        created_at=row['created_at'],
+        updated_at=row['updated_at'],
+    )
+
+
+class NotificationFeed:
+    """
+    Lazy, sliceable feed for one user.
+
+    Supports count() and slicing, so it can be handed to DRF pagination
+    like a queryset; slices are returned as unsaved Notification instances
+    for the usual serializers.
+    """
+
+    def __init__(self, user, notification_type=None, unread=False, important=False):
+        self.user = user
+
+        queryset = _notification_rows(user, notification_type, unread, important)
+        if notification_type in (None, '', 'SYSTEM'):
+            queryset = queryset.union(_broadcast_rows(user, unread, important), all=True)
+        self.queryset = queryset.order_by('-created_at', '-item_id')
+
+    def count(self):
+        return self.queryset.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [_to_instance(self.user, row) for row in self.queryset[key]]
+        return _to_instance(self.user, self.queryset[key])
+
+    def __iter__(self):
+        return iter(self[:])
+
+
+def get_item(user, item_id):
+    """Single feed item by id, or None"""
+    if not is_broadcast_id(item_id):
+        return Notification.objects.filter(user=user, pk=item_id).first()
+
+    broadcast = visible_broadcasts(user).filter(pk=broadcast_pk(item_id)).first()
+    if broadcast is None:
+        return None
+    return Notification(
+        id=-broadcast.pk,
+        user=user,
+        title=broadcast.title,
+        message=broadcast.message,
+        notification_type='SYSTEM',
+        is_read=broadcast.is_read,
+        is_important=broadcast.is_important,
+        created_at=broadcast.created_at,
+        updated_at=broadcast.updated_at,
+    )
+
+
+# ==========================================
+# Delta sync
+# ==========================================
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def encode_cursor(updated_at, item_id):
+    """'<epoch microseconds>_<item id>' (exact, unlike float timestamps)"""
+    micros = (updated_at - EPOCH) // timedelta(microseconds=1)
+    return f'{micros}_{item_id}'
+
+
+def decode_cursor(cursor):
+    """(updated_at, item_id) for a cursor string; raises ValueError when malformed"""
+    micros, item_id = cursor.split('_', 1)
+    try:
+        updated_at = EPOCH + timedelta(microseconds=int(micros))
+    except OverflowError:
+        raise ValueError(f'Cursor out of range: {cursor}')
+    return updated_at, int(item_id)
+
+
+def _horizon():
+    """Latest position a cursor may take (see changes_since)"""
+    return timezone.now() - timedelta(seconds=getattr(settings, 'SYNC_CURSOR_LAG', 2)), 0
+
+
+def changes_since(user, cursor, limit):
+    """
+    Feed items created or updated after cursor, oldest change first.
+
+    Returns:
+        tuple: (items, next_cursor, has_more); next_cursor is cursor when nothing changed.
+        The cursor never passes now - SYNC_CURSOR_LAG: rows saved just before
+        the poll may belong to transactions that commit after it, so the
+        last few seconds are read again on the next poll.
+    """
+    since = decode_cursor(cursor)
+    queryset = _notification_rows(user, since=since).union(
+        _broadcast_rows(user, since=since),
+        all=True
+    ).order_by('updated_at', 'item_id')
+
+    rows = list(queryset[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not rows:
+        return [], cursor, False
+
+    last = (rows[-1]['updated_at'], rows[-1]['item_id'])
+    if has_more:
+        # Paging through a backlog: the client asks again right away
+        position = last
+    else:
+        position = max(since, min(last, _horizon()))
+
+    return [_to_instance(user, row) for row in rows], encode_cursor(*position), has_more
+
+
+def current_cursor(user):
+    """Cursor positioned at the user's latest change (for clients starting a sync)"""
+    rows = _notification_rows(user).union(_broadcast_rows(user), all=True).order_by('-updated_at', '-item_id')
+    row = rows.first()
+    if row is None:
+        return encode_cursor(user.date_joined, 0)
+    return encode_cursor(*min((row['updated_at'], row['item_id']), _horizon()))
@@ -0,0 +1,48 @@
+# Generated by Django 5.0 on 2026-10-16 21:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RenameIndex(
+            model_name='notification',
+            new_name='notificatio_user_id_05b4bc_idx',
+            old_name='notificatio_user_id_5f7c8a_idx',
+        ),
+        migrations.RenameIndex(
+            model_name='notification',
+            new_name='notificatio_user_id_427e4b_idx',
+            old_name='notificatio_user_id_8d3e7b_idx',
+        ),
+        migrations.RenameIndex(
+            model_name='notification',
+            new_name='notificatio_notific_f2898f_idx',
+            old_name='notificatio_notific_2a9c4e_idx',
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AlterField(
+            model_name='notificationpreference',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+        migrations.AlterField(
+            model_name='notificationpreference',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
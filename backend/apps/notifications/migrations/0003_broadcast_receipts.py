@@ -0,0 +1,85 @@
+# Generated by Django 5.0 on 2026-10-16 22:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def hide_delivered_broadcasts(apps, schema_editor):
+    """Broadcasts already fanned out as Notification rows must not show twice"""
+    Broadcast = apps.get_model('notifications', 'Broadcast')
+    Broadcast.objects.filter(sent_count__gt=0).update(is_active=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0002_broadcast'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='broadcast',
+            name='is_active',
+            field=models.BooleanField(default=True, help_text='Inactive broadcasts are hidden from all users', verbose_name='Active'),
+        ),
+        migrations.RunPython(hide_delivered_broadcasts, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='BroadcastReceipt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_dismissed', models.BooleanField(default=False, verbose_name='Dismissed')),
+            ],
+            options={
+                'verbose_name': 'Broadcast Receipt',
+                'verbose_name_plural': 'Broadcast Receipts',
+            },
+        ),
+        migrations.RemoveField(
+            model_name='broadcast',
+            name='finished_at',
+        ),
+        migrations.RemoveField(
+            model_name='broadcast',
+            name='last_error',
+        ),
+        migrations.RemoveField(
+            model_name='broadcast',
+            name='last_user_id',
+        ),
+        migrations.RemoveField(
+            model_name='broadcast',
+            name='sent_count',
+        ),
+        migrations.RemoveField(
+            model_name='broadcast',
+            name='started_at',
+        ),
+        migrations.RemoveField(
+            model_name='broadcast',
+            name='status',
+        ),
+        migrations.RemoveField(
+            model_name='broadcast',
+            name='total_count',
+        ),
+        migrations.AddIndex(
+            model_name='broadcast',
+            index=models.Index(fields=['is_active', '-created_at'], name='notificatio_is_acti_92967d_idx'),
+        ),
+        migrations.AddField(
+            model_name='broadcastreceipt',
+            name='broadcast',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='receipts', to='notifications.broadcast', verbose_name='Broadcast'),
+        ),
+        migrations.AddField(
+            model_name='broadcastreceipt',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='broadcast_receipts', to=settings.AUTH_USER_MODEL, verbose_name='User'),
+        ),
+        migrations.AddConstraint(
+            model_name='broadcastreceipt',
+            constraint=models.UniqueConstraint(fields=('user', 'broadcast'), name='unique_broadcast_receipt'),
+        ),
+    ]
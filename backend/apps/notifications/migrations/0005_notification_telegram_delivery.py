@@ -0,0 +1,39 @@
+# Generated by Django 5.0 on 2026-10-16 22:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0004_notification_sync_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='telegram_attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Telegram Attempts'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='telegram_error',
+            field=models.CharField(blank=True, max_length=255, verbose_name='Telegram Error'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='telegram_sent_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Telegram Sent At'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='telegram_status',
+            field=models.CharField(blank=True, choices=[('', 'Not sent'), ('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed'), ('skipped', 'Skipped')], default='', max_length=10, verbose_name='Telegram Status'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('telegram_status', 'pending')), fields=['id'], name='notification_telegram_pending'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0 on 2026-10-16 22:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0005_notification_telegram_delivery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='params',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Template Params'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='template_key',
+            field=models.CharField(blank=True, max_length=50, verbose_name='Template'),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='message',
+            field=models.TextField(blank=True, verbose_name='Message'),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='title',
+            field=models.CharField(blank=True, max_length=255, verbose_name='Title'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0 on 2026-10-16 23:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0006_notification_templates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='telegram_available_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Telegram Next Attempt'),
+        ),
+    ]
@@ -1,7 +1,10 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from apps.core.models import TimeStampedModel
 
+from . import catalog
+
 User = get_user_model()
 
 
@@ -21,8 +24,11 @@ class Notification(TimeStampedModel):
         related_name='notifications',
         verbose_name='User'
     )
-    title = models.CharField(max_length=255, verbose_name='Title')
-    message = models.TextField(verbose_name='Message')
+    # Free-form text; empty for templated notifications (see apps.notifications.catalog)
+    title = models.CharField(max_length=255, blank=True, verbose_name='Title')
+    message = models.TextField(blank=True, verbose_name='Message')
+    template_key = models.CharField(max_length=50, blank=True, verbose_name='Template')
+    params = models.JSONField(default=dict, blank=True, verbose_name='Template Params')
     notification_type = models.CharField(
         max_length=20,
         choices=TYPE_CHOICES,
@@ -54,6 +60,27 @@ class Notification(TimeStampedModel):
         help_text='Show as toast notification on frontend'
     )
 
+    # Telegram delivery (see apps.notifications.telegram)
+    TELEGRAM_STATUS_CHOICES = [
+        ('', 'Not sent'),
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+        ('skipped', 'Skipped'),
+    ]
+    telegram_status = models.CharField(
+        max_length=10,
+        choices=TELEGRAM_STATUS_CHOICES,
+        blank=True,
+        default='',
+        verbose_name='Telegram Status'
+    )
+    telegram_attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Telegram Attempts')
+    telegram_sent_at = models.DateTimeField(null=True, blank=True, verbose_name='Telegram Sent At')
+    telegram_error = models.CharField(max_length=255, blank=True, verbose_name='Telegram Error')
+    # Not claimed again before this: the delivery lease, a retry backoff or a rate-limit pause
+    telegram_available_at = models.DateTimeField(default=timezone.now, verbose_name='Telegram Next Attempt')
+
     class Meta:
         verbose_name = 'Notification'
         verbose_name_plural = 'Notifications'
@@ -62,10 +89,26 @@ class Notification(TimeStampedModel):
             models.Index(fields=['user', '-created_at']),
             models.Index(fields=['user', 'is_read']),
             models.Index(fields=['notification_type']),
+            # Delta sync: recent/?since=<cursor>
+            models.Index(fields=['user', 'updated_at', 'id']),
+            # Telegram delivery queue
+            models.Index(
+                fields=['id'],
+                condition=models.Q(telegram_status='pending'),
+                name='notification_telegram_pending'
+            ),
         ]
 
     def __str__(self):
-        return f"{self.user.email} - {self.title} ({self.notification_type})"
+        return f"{self.user.email} - {self.render()[0]} ({self.notification_type})"
+
+    def render(self, locale=None):
+        """(title, message) in locale, from the catalog for templated notifications"""
+        if self.template_key:
+            rendered = catalog.render(self.template_key, self.params, locale or catalog.DEFAULT_LOCALE)
+            if rendered is not None:
+                return rendered
+        return self.title, self.message
 
     def mark_as_read(self):
         """Mark notification as read"""
@@ -116,3 +159,71 @@ class NotificationPreference(TimeStampedModel):
             'SYSTEM': self.system_enabled,
         }
         return type_mapping.get(notification_type, True)
+
+
+class Broadcast(TimeStampedModel):
+    """
+    A system notification for all users, stored once.
+    Merged into each user's notification feed at read time; per-user read and
+    dismiss state lives in BroadcastReceipt.
+    """
+
+    title = models.CharField(max_length=255, verbose_name='Title')
+    message = models.TextField(verbose_name='Message')
+    is_important = models.BooleanField(default=False, verbose_name='Important')
+    is_active = models.BooleanField(
+        default=True,
+        verbose_name='Active',
+        help_text='Inactive broadcasts are hidden from all users'
+    )
+
+    created_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Created By'
+    )
+
+    class Meta:
+        verbose_name = 'Broadcast'
+        verbose_name_plural = 'Broadcasts'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['is_active', '-created_at']),
+        ]
+
+    def __str__(self):
+        return self.title
+
+
+class BroadcastReceipt(models.Model):
+    """
+    Per-user marker for a broadcast, written only when the user acts on it.
+    A receipt means the broadcast was read; is_dismissed hides it from the feed.
+    """
+
+    broadcast = models.ForeignKey(
+        Broadcast,
+        on_delete=models.CASCADE,
+        related_name='receipts',
+        verbose_name='Broadcast'
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='broadcast_receipts',
+        verbose_name='User'
+    )
+    is_dismissed = models.BooleanField(default=False, verbose_name='Dismissed')
+
+    class Meta:
+        verbose_name = 'Broadcast Receipt'
+        verbose_name_plural = 'Broadcast Receipts'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'broadcast'], name='unique_broadcast_receipt'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.broadcast_id}"
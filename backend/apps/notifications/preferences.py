@@ -0,0 +1,114 @@
+"""
+Cached notification preferences
+
+Each user's NotificationPreference is packed into a small integer bitmask
+and kept in the shared cache under notifications:prefs:<user_id>, so
+senders check opt-in without a query. A saved NotificationPreference writes
+its new mask after commit (see signals); users without a preferences row
+get DEFAULT_MASK.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from apps.core.cache import make_key
+
+from .models import NotificationPreference
+
+ORDER = 1 << 0
+DEPOSIT = 1 << 1
+WITHDRAW = 1 << 2
+SYSTEM = 1 << 3
+EMAIL = 1 << 4
+TELEGRAM = 1 << 5
+
+FIELD_FLAGS = {
+    'order_enabled': ORDER,
+    'deposit_enabled': DEPOSIT,
+    'withdraw_enabled': WITHDRAW,
+    'system_enabled': SYSTEM,
+    'email_enabled': EMAIL,
+    'telegram_enabled': TELEGRAM,
+}
+
+TYPE_FLAGS = {
+    'ORDER': ORDER,
+    'DEPOSIT': DEPOSIT,
+    'WITHDRAW': WITHDRAW,
+    'SYSTEM': SYSTEM,
+}
+
+# Matches the NotificationPreference field defaults
+DEFAULT_MASK = ORDER | DEPOSIT | WITHDRAW | SYSTEM
+
+
+def _timeout():
+    return getattr(settings, 'PREFERENCE_CACHE_TIMEOUT', 86400)
+
+
+def _key(user_id):
+    return make_key('notifications', 'prefs', user_id)
+
+
+def to_mask(values):
+    """Bitmask for a NotificationPreference instance or a dict of its fields"""
+    if isinstance(values, NotificationPreference):
+        values = {field: getattr(values, field) for field in FIELD_FLAGS}
+    mask = 0
+    for field, flag in FIELD_FLAGS.items():
+        if values[field]:
+            mask |= flag
+    return mask
+
+
+def get_masks(user_ids):
+    """{user_id: mask}, with one cache read and at most one query"""
+    user_ids = set(user_ids)
+    if not user_ids:
+        return {}
+
+    keys = {_key(user_id): user_id for user_id in user_ids}
+    found = cache.get_many(list(keys))
+    masks = {keys[key]: mask for key, mask in found.items()}
+
+    missing = user_ids - set(masks)
+    if missing:
+        loaded = {user_id: DEFAULT_MASK for user_id in missing}
+        for values in NotificationPreference.objects.filter(user_id__in=missing).values('user_id', *FIELD_FLAGS):
+            loaded[values['user_id']] = to_mask(values)
+        for user_id, mask in loaded.items():
+            # add(): a mask stored by a concurrent save is newer than what was read here
+            cache.add(_key(user_id), mask, _timeout())
+        masks.update(loaded)
+    return masks
+
+
+def get_mask(user_id):
+    return get_masks([user_id])[user_id]
+
+
+def is_enabled(user_id, notification_type):
+    """Whether user_id receives notification_type (unknown types are always sent)"""
+    flag = TYPE_FLAGS.get(notification_type)
+    if flag is None:
+        return True
+    return bool(get_mask(user_id) & flag)
+
+
+def enabled_user_ids(user_ids, notification_type):
+    """The subset of user_ids that receive notification_type"""
+    flag = TYPE_FLAGS.get(notification_type)
+    if flag is None:
+        return set(user_ids)
+    return {user_id for user_id, mask in get_masks(user_ids).items() if mask & flag}
+
+
+def store(preference):
+    """Cache preference's mask once the current transaction commits"""
+    user_id, mask = preference.user_id, to_mask(preference)
+    transaction.on_commit(lambda: cache.set(_key(user_id), mask, _timeout()))
+
+
+def forget(user_id):
+    """Drop user_id's cached mask once the current transaction commits"""
+    transaction.on_commit(lambda: cache.delete(_key(user_id)))
@@ -0,0 +1,258 @@
+"""
+Realtime push over Server-Sent Events
+
+Producers call publish_to_user() / publish_to_all() inside their
+transaction; the message goes to Redis pub/sub after commit (best effort:
+clients resynchronise over the REST API whenever they reconnect). Bulk
+producers use publish_to_users(), which sends every message in one
+pipelined round trip. After a failed publish, messages are dropped for
+SSE_PUBLISH_COOLDOWN seconds instead of each waiting on the socket
+timeout.
+
+The /api/notifications/stream/ endpoint is an async view meant to be served
+by the ASGI app (uvicorn workers, see the realtime service in
+docker-compose), so an idle connection costs a coroutine instead of a
+worker. Each process keeps a single pattern subscription (StreamHub) and
+fans messages out to its local connections, so Redis sees one subscriber
+per process rather than one per browser tab.
+
+Messages published to every stream can carry a notification type; each
+stream then only forwards them if its user has that type enabled (see
+apps.notifications.preferences), as the REST feed does.
+
+Browsers cannot send an Authorization header with EventSource: they
+exchange their JWT for a short-lived, single-use stream ticket
+(issue_ticket) and pass it as ?ticket=.
+"""
+import asyncio
+import json
+import logging
+import secrets
+import time
+import weakref
+from collections import defaultdict
+
+import redis
+import redis.asyncio as aioredis
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from apps.core.cache import make_key
+
+from . import preferences
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = 'notifications:push:'
+BROADCAST_CHANNEL = CHANNEL_PREFIX + 'all'
+
+_client = None
+_down_until = 0.0
+
+
+def user_channel(user_id):
+    return f'{CHANNEL_PREFIX}user:{user_id}'
+
+
+def _get_client():
+    """Process-wide publishing connection"""
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.REDIS_URL,
+            socket_connect_timeout=0.5,
+            socket_timeout=0.5
+        )
+    return _client
+
+
+# ==========================================
+# Publishing
+# ==========================================
+
+def publish_to_user(user_id, event, data):
+    """Push event to user's open streams after the current transaction commits"""
+    _publish(user_channel(user_id), event, data)
+
+
+def publish_to_all(event, data, notification_type=None):
+    """
+    Push event to every open stream after the current transaction commits,
+    or only to users with notification_type enabled
+    """
+    _publish(BROADCAST_CHANNEL, event, data, notification_type)
+
+
+def publish_to_users(messages):
+    """Push (user_id, event, data) messages after commit, in one round trip"""
+    payloads = [(user_channel(user_id), _encode(event, data)) for user_id, event, data in messages]
+    if payloads:
+        transaction.on_commit(lambda: _send(payloads))
+
+
+def _encode(event, data, notification_type=None):
+    message = {'event': event, 'data': data}
+    if notification_type:
+        message['type'] = notification_type
+    return json.dumps(message, cls=DjangoJSONEncoder)
+
+
+def _publish(channel, event, data, notification_type=None):
+    message = _encode(event, data, notification_type)
+    transaction.on_commit(lambda: _send([(channel, message)]))
+
+
+def _send(payloads):
+    global _down_until
+    if time.monotonic() < _down_until:
+        return
+    try:
+        pipeline = _get_client().pipeline(transaction=False)
+        for channel, message in payloads:
+            pipeline.publish(channel, message)
+        pipeline.execute()
+    except redis.RedisError as e:
+        _down_until = time.monotonic() + getattr(settings, 'SSE_PUBLISH_COOLDOWN', 5)
+        logger.warning(f"Realtime publish of {len(payloads)} message(s) failed: {str(e)}")
+
+
+# ==========================================
+# Stream tickets
+# ==========================================
+
+def _ticket_key(ticket):
+    return make_key('notifications', 'stream_ticket', ticket)
+
+
+def issue_ticket(user):
+    """Short-lived, single-use token identifying user on the stream endpoint"""
+    ticket = secrets.token_urlsafe(24)
+    cache.set(_ticket_key(ticket), user.pk, getattr(settings, 'SSE_TICKET_TIMEOUT', 60))
+    return ticket
+
+
+async def aresolve_ticket(ticket):
+    """User id for a stream ticket, or None; the ticket cannot be used again"""
+    if not ticket:
+        return None
+    key = _ticket_key(ticket)
+    user_id = await cache.aget(key)
+    # Only the request that deletes the ticket gets to use it
+    if user_id is None or not await cache.adelete(key):
+        return None
+    return user_id
+
+
+# ==========================================
+# Streaming
+# ==========================================
+
+class StreamHub:
+    """
+    One Redis pattern subscription per event loop, fanned out to the
+    asyncio queues of the connections open in this process.
+    """
+
+    def __init__(self):
+        self.queues = defaultdict(set)
+        self.listener = None
+
+    def connect(self, user_id):
+        if self.listener is None or self.listener.done():
+            self.listener = asyncio.create_task(self._listen())
+        queue = asyncio.Queue(maxsize=getattr(settings, 'SSE_QUEUE_SIZE', 100))
+        self.queues[user_id].add(queue)
+        return queue
+
+    def disconnect(self, user_id, queue):
+        queues = self.queues.get(user_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.queues[user_id]
+
+    def dispatch(self, channel, message):
+        if channel == BROADCAST_CHANNEL:
+            targets = [queue for queues in self.queues.values() for queue in queues]
+        else:
+            user_id = channel.rsplit(':', 1)[-1]
+            targets = list(self.queues.get(int(user_id), ())) if user_id.isdigit() else []
+
+        for queue in targets:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Slow client: it catches up over the REST API on its next reconnect
+                pass
+
+    async def _listen(self):
+        delay = 1
+        while self.queues:
+            client = aioredis.Redis.from_url(settings.REDIS_URL)
+            pubsub = client.pubsub()
+            try:
+                await pubsub.psubscribe(CHANNEL_PREFIX + '*')
+                delay = 1
+                while self.queues:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is not None:
+                        self.dispatch(message['channel'].decode(), message['data'].decode())
+            except redis.RedisError as e:
+                logger.warning(f"Realtime subscription lost, retrying in {delay}s: {str(e)}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+            finally:
+                await pubsub.aclose()
+                await client.aclose()
+
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_hub():
+    """Hub of the running event loop"""
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = StreamHub()
+    return hub
+
+
+def format_event(event, data):
+    return f'event: {event}\ndata: {data}\n\n'
+
+
+async def event_stream(user_id):
+    """
+    SSE body for user_id: pushed events, a keep-alive comment every
+    SSE_HEARTBEAT seconds, and an end after SSE_MAX_DURATION seconds so
+    clients reconnect (and re-authenticate) periodically.
+    """
+    heartbeat = getattr(settings, 'SSE_HEARTBEAT', 20)
+    max_duration = getattr(settings, 'SSE_MAX_DURATION', 300)
+
+    hub = get_hub()
+    queue = hub.connect(user_id)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max_duration
+    try:
+        yield f'retry: {getattr(settings, "SSE_RETRY_MS", 5000)}\n\n'
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                message = await asyncio.wait_for(queue.get(), timeout=min(heartbeat, remaining))
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            payload = json.loads(message)
+            if 'type' in payload and not await sync_to_async(preferences.is_enabled)(user_id, payload['type']):
+                continue
+            yield format_event(payload['event'], json.dumps(payload['data']))
+    finally:
+        hub.disconnect(user_id, queue)
@@ -1,10 +1,17 @@
 from rest_framework import serializers
+from apps.core.serializers import SparseFieldsetsMixin
+from . import catalog
 from .models import Notification, NotificationPreference
 
 
-class NotificationSerializer(serializers.ModelSerializer):
-    """Serializer for Notification model"""
+class NotificationSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
+    """
+    Serializer for Notification model.
+    Title and message are rendered in the request's locale (?lang= or Accept-Language).
+    """
 
+    title = serializers.SerializerMethodField()
+    message = serializers.SerializerMethodField()
     time_ago = serializers.SerializerMethodField()
 
     class Meta:
@@ -22,6 +29,20 @@ class NotificationSerializer(serializers.ModelSerializer):
             'time_ago',
         ]
         read_only_fields = ['id', 'created_at', 'time_ago']
+        field_sources = {
+            'title': ('title', 'template_key', 'params'),
+            'message': ('message', 'template_key', 'params'),
+            'time_ago': ('created_at',),
+        }
+
+    def _render(self, obj):
+        return obj.render(catalog.get_locale(self.context.get('request')))
+
+    def get_title(self, obj):
+        return self._render(obj)[0]
+
+    def get_message(self, obj):
+        return self._render(obj)[1]
 
     def get_time_ago(self, obj):
         """Return human-readable time ago string"""
@@ -1,7 +1,15 @@
-from django.contrib.auth import get_user_model
-from .models import Notification, NotificationPreference
+from collections import Counter
 
-User = get_user_model()
+from django.db import transaction
+from django.utils import timezone
+
+from . import counters, feed, preferences, realtime, telegram
+from .models import Broadcast, BroadcastReceipt, Notification
+
+
+def _params(**params):
+    """Template params without the optional ones that were not given"""
+    return {name: value for name, value in params.items() if value}
 
 
 class NotificationService:
@@ -10,75 +18,166 @@ class NotificationService:
     @staticmethod
     def create_notification(
         user,
-        title,
-        message,
+        title='',
+        message='',
         notification_type='SYSTEM',
         order_id=None,
         transaction_id=None,
-        is_important=False
+        is_important=False,
+        template_key='',
+        params=None
     ):
         """
         Create a notification for a user.
         Respects user preferences.
+
+        Pass either free-form title/message or a catalog template_key with
+        its params (rendered in the reader's locale, see catalog).
         """
-        # Check user preferences
-        try:
-            preferences = user.notification_preferences
-            if not preferences.is_type_enabled(notification_type):
-                return None
-        except NotificationPreference.DoesNotExist:
-            # Create default preferences if not exists
-            NotificationPreference.objects.create(user=user)
+        # Check user preferences (cached bitmask, no query)
+        if not preferences.is_enabled(user.pk, notification_type):
+            return None
 
         notification = Notification.objects.create(
             user=user,
             title=title,
             message=message,
+            template_key=template_key,
+            params=params or {},
             notification_type=notification_type,
             order_id=order_id,
             transaction_id=transaction_id,
-            is_important=is_important
+            is_important=is_important,
+            telegram_status=telegram.initial_status(user.pk)
         )
-
-        # Future: Send email/telegram if enabled
-        # NotificationService._send_external_notifications(notification)
+        counters.adjust(user.pk, 1)
+        NotificationService._push(notification)
+        if notification.telegram_status:
+            transaction.on_commit(telegram.schedule_delivery)
 
         return notification
 
+    @staticmethod
+    def _push(notification):
+        """Send a new notification to the user's open realtime streams"""
+        from .serializers import NotificationSerializer
+
+        realtime.publish_to_user(
+            notification.user_id,
+            'notification',
+            NotificationSerializer(notification).data
+        )
+
+    @staticmethod
+    def _push_many(notifications):
+        """Send new notifications to their users' streams in one publish"""
+        from .serializers import NotificationSerializer
+
+        realtime.publish_to_users(
+            (notification.user_id, 'notification', NotificationSerializer(notification).data)
+            for notification in notifications
+        )
+
+    @staticmethod
+    def get_feed(user, notification_type=None, unread=False, important=False):
+        """Notifications and broadcasts for user, newest first (sliceable)"""
+        return feed.NotificationFeed(
+            user,
+            notification_type=notification_type,
+            unread=unread,
+            important=important
+        )
+
+    @staticmethod
+    def get_changes(user, since, limit=50):
+        """
+        Notifications created or updated after the since cursor.
+        Returns (notifications, next_cursor, has_more); raises ValueError for a bad cursor.
+        """
+        return feed.changes_since(user, since, limit)
+
+    @staticmethod
+    def get_sync_cursor(user):
+        """Cursor for a client that has just loaded the latest notifications"""
+        return feed.current_cursor(user)
+
     @staticmethod
     def get_unread_count(user):
-        """Get count of unread notifications for user"""
-        return Notification.objects.filter(user=user, is_read=False).count()
+        """Get count of unread notifications (including broadcasts) for user"""
+        return counters.get_unread_count(user)
 
     @staticmethod
     def mark_as_read(user, notification_ids):
-        """Mark multiple notifications as read"""
-        return Notification.objects.filter(
+        """Mark multiple notifications as read (negative ids are broadcasts)"""
+        broadcast_ids = [feed.broadcast_pk(i) for i in notification_ids if feed.is_broadcast_id(i)]
+        notification_ids = [i for i in notification_ids if not feed.is_broadcast_id(i)]
+
+        updated = Notification.objects.filter(
             user=user,
             id__in=notification_ids,
             is_read=False
-        ).update(is_read=True)
+        ).update(is_read=True, updated_at=timezone.now())
+        counters.adjust(user.pk, -updated)
+        if broadcast_ids:
+            updated += NotificationService._mark_broadcasts_read(
+                user,
+                feed.visible_broadcasts(user).filter(pk__in=broadcast_ids, is_read=False)
+            )
+        return updated
 
     @staticmethod
     def mark_all_as_read(user):
         """Mark all notifications as read for user"""
-        return Notification.objects.filter(
+        updated = Notification.objects.filter(
             user=user,
             is_read=False
-        ).update(is_read=True)
+        ).update(is_read=True, updated_at=timezone.now())
+        counters.adjust(user.pk, -updated)
+        return updated + NotificationService._mark_broadcasts_read(
+            user,
+            feed.visible_broadcasts(user).filter(is_read=False)
+        )
+
+    @staticmethod
+    def _mark_broadcasts_read(user, broadcasts):
+        broadcast_ids = list(broadcasts.values_list('pk', flat=True))
+        BroadcastReceipt.objects.bulk_create(
+            [BroadcastReceipt(user=user, broadcast_id=pk) for pk in broadcast_ids],
+            ignore_conflicts=True
+        )
+        if broadcast_ids:
+            counters.reset_broadcasts(user.pk)
+        return len(broadcast_ids)
 
     @staticmethod
     def delete_notification(user, notification_id):
-        """Delete a notification"""
-        return Notification.objects.filter(
+        """Delete a notification; broadcasts are dismissed for this user only"""
+        if feed.is_broadcast_id(notification_id):
+            counters.reset_broadcasts(user.pk)
+            return BroadcastReceipt.objects.bulk_create(
+                [BroadcastReceipt(
+                    user=user,
+                    broadcast_id=feed.broadcast_pk(notification_id),
+                    is_dismissed=True
+                )],
+                update_conflicts=True,
+                unique_fields=['user', 'broadcast'],
+                update_fields=['is_dismissed']
+            )
+        queryset = Notification.objects.filter(
             user=user,
             id=notification_id
-        ).delete()
+        )
+        was_unread = queryset.filter(is_read=False).exists()
+        result = queryset.delete()
+        if was_unread and result[0]:
+            counters.adjust(user.pk, -1)
+        return result
 
     @staticmethod
     def get_recent_notifications(user, limit=10):
         """Get recent notifications for dropdown"""
-        return Notification.objects.filter(user=user)[:limit]
+        return NotificationService.get_feed(user)[:limit]
 
     # ==========================================
     # Convenience methods for specific events
@@ -89,8 +188,8 @@ class NotificationService:
         """Notify user about successful deposit"""
         return NotificationService.create_notification(
             user=user,
-            title="Deposit Successful",
-            message=f"Your deposit of ${amount} USD has been confirmed and added to your wallet.",
+            template_key='deposit_confirmed',
+            params={'amount': str(amount)},
             notification_type='DEPOSIT',
             transaction_id=transaction_id,
             is_important=True
@@ -99,14 +198,10 @@ class NotificationService:
     @staticmethod
     def notify_deposit_rejected(user, amount, reason=None, transaction_id=None):
         """Notify user about rejected deposit"""
-        message = f"Your deposit of ${amount} USD has been rejected."
-        if reason:
-            message += f" Reason: {reason}"
-
         return NotificationService.create_notification(
             user=user,
-            title="Deposit Rejected",
-            message=message,
+            template_key='deposit_rejected',
+            params=_params(amount=str(amount), reason=reason),
             notification_type='DEPOSIT',
             transaction_id=transaction_id,
             is_important=True
@@ -117,8 +212,8 @@ class NotificationService:
         """Notify user about approved withdrawal"""
         return NotificationService.create_notification(
             user=user,
-            title="Withdrawal Approved",
-            message=f"Your withdrawal request of ${amount} USD has been approved.",
+            template_key='withdraw_approved',
+            params={'amount': str(amount)},
             notification_type='WITHDRAW',
             transaction_id=transaction_id,
             is_important=True
@@ -127,14 +222,10 @@ class NotificationService:
     @staticmethod
     def notify_withdraw_rejected(user, amount, reason=None, transaction_id=None):
         """Notify user about rejected withdrawal"""
-        message = f"Your withdrawal request of ${amount} USD has been rejected."
-        if reason:
-            message += f" Reason: {reason}"
-
         return NotificationService.create_notification(
             user=user,
-            title="Withdrawal Rejected",
-            message=message,
+            template_key='withdraw_rejected',
+            params=_params(amount=str(amount), reason=reason),
             notification_type='WITHDRAW',
             transaction_id=transaction_id,
             is_important=True
@@ -145,8 +236,8 @@ class NotificationService:
         """Notify user about new order"""
         return NotificationService.create_notification(
             user=user,
-            title="Order Created",
-            message=f"Your order #{order_id} for {game_name} has been created successfully.",
+            template_key='order_created',
+            params={'order_id': order_id, 'game_name': game_name},
             notification_type='ORDER',
             order_id=order_id,
             is_important=False
@@ -157,8 +248,8 @@ class NotificationService:
         """Notify user that order is being processed"""
         return NotificationService.create_notification(
             user=user,
-            title="Order Processing",
-            message=f"Your order #{order_id} is now being processed.",
+            template_key='order_processing',
+            params={'order_id': order_id},
             notification_type='ORDER',
             order_id=order_id,
             is_important=False
@@ -169,8 +260,8 @@ class NotificationService:
         """Notify user about completed order"""
         return NotificationService.create_notification(
             user=user,
-            title="Order Completed",
-            message=f"Your order #{order_id} has been completed successfully!",
+            template_key='order_completed',
+            params={'order_id': order_id},
             notification_type='ORDER',
             order_id=order_id,
             is_important=True
@@ -179,26 +270,53 @@ class NotificationService:
     @staticmethod
     def notify_order_cancelled(user, order_id, reason=None):
         """Notify user about cancelled order"""
-        message = f"Your order #{order_id} has been cancelled."
-        if reason:
-            message += f" Reason: {reason}"
-
         return NotificationService.create_notification(
             user=user,
-            title="Order Cancelled",
-            message=message,
+            template_key='order_cancelled',
+            params=_params(order_id=order_id, reason=reason),
             notification_type='ORDER',
             order_id=order_id,
             is_important=True
         )
 
+    @staticmethod
+    def notify_orders_cancelled(orders, reason=None):
+        """
+        Notify the owners of many cancelled orders with one INSERT.
+        Users who disabled order notifications are skipped.
+        """
+        enabled = preferences.enabled_user_ids({order.user_id for order in orders}, 'ORDER')
+        telegram_statuses = telegram.initial_statuses(enabled)
+
+        notifications = []
+        for order in orders:
+            if order.user_id not in enabled:
+                continue
+            notifications.append(Notification(
+                user_id=order.user_id,
+                template_key='order_cancelled',
+                params=_params(order_id=order.order_id, reason=reason),
+                notification_type='ORDER',
+                order_id=order.order_id,
+                is_important=True,
+                telegram_status=telegram_statuses[order.user_id]
+            ))
+
+        created = Notification.objects.bulk_create(notifications)
+        for user_id, count in Counter(n.user_id for n in created).items():
+            counters.adjust(user_id, count)
+        NotificationService._push_many(created)
+        if any(n.telegram_status for n in created):
+            transaction.on_commit(telegram.schedule_delivery)
+        return created
+
     @staticmethod
     def notify_order_refunded(user, order_id, amount):
         """Notify user about refunded order"""
         return NotificationService.create_notification(
             user=user,
-            title="Order Refunded",
-            message=f"Your order #{order_id} has been refunded. ${amount} USD has been added to your wallet.",
+            template_key='order_refunded',
+            params={'order_id': order_id, 'amount': str(amount)},
             notification_type='ORDER',
             order_id=order_id,
             is_important=True
@@ -216,19 +334,14 @@ class NotificationService:
         )
 
     @staticmethod
-    def broadcast_system_notification(title, message, is_important=False):
-        """Send system notification to all users"""
-        users = User.objects.filter(is_active=True)
-        notifications = []
-
-        for user in users:
-            notification = NotificationService.send_system_notification(
-                user=user,
-                title=title,
-                message=message,
-                is_important=is_important
-            )
-            if notification:
-                notifications.append(notification)
-
-        return notifications
+    def broadcast_system_notification(title, message, is_important=False, created_by=None):
+        """
+        Send system notification to all users.
+        Stores a single Broadcast; users see it in their feed from now on.
+        """
+        return Broadcast.objects.create(
+            title=title,
+            message=message,
+            is_important=is_important,
+            created_by=created_by
+        )
@@ -1,11 +1,14 @@
-from django.db.models.signals import post_save, pre_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 
+from apps.core import outbox
 from apps.orders.models import Order
 from apps.wallets.models import Deposit, CryptoDeposit
+from . import counters, preferences, realtime
 from .services import NotificationService
-from .models import NotificationPreference
+from .models import Broadcast, NotificationPreference
 
 User = get_user_model()
 
@@ -19,141 +22,185 @@ def create_notification_preferences(sender, instance, created, **kwargs):
 
 
 # ==========================================
-# Order signals
+# Preference cache
 # ==========================================
 
-@receiver(pre_save, sender=Order)
-def cache_old_order_status(sender, instance, **kwargs):
-    """Cache old status before save for comparison"""
-    if instance.pk:
-        try:
-            old_instance = Order.objects.get(pk=instance.pk)
-            instance._old_status = old_instance.status
-        except Order.DoesNotExist:
-            instance._old_status = None
-    else:
-        instance._old_status = None
-
-
-@receiver(post_save, sender=Order)
-def notify_order_status_change(sender, instance, created, **kwargs):
+@receiver(post_save, sender=NotificationPreference)
+def cache_preferences(sender, instance, **kwargs):
+    """Keep the cached preference bitmask in step with the row (before counters read it)"""
+    preferences.store(instance)
+
+
+@receiver(post_delete, sender=NotificationPreference)
+def forget_preferences(sender, instance, **kwargs):
+    preferences.forget(instance.user_id)
+
+
+# ==========================================
+# Unread counters
+# ==========================================
+
+@receiver(post_save, sender=Broadcast)
+@receiver(post_delete, sender=Broadcast)
+def invalidate_broadcast_counters(sender, **kwargs):
+    """A new, edited or removed broadcast changes every user's unread count"""
+    counters.invalidate_broadcasts()
+
+
+@receiver(post_save, sender=Broadcast)
+def push_broadcast(sender, instance, created, **kwargs):
+    """
+    Tell the open realtime streams of users who see broadcasts (system
+    notifications on) about a new one, once it has committed
+    """
+    if created and instance.is_active:
+        transaction.on_commit(lambda: realtime.publish_to_all('broadcast', {
+            'id': -instance.pk,
+            'title': instance.title,
+            'is_important': instance.is_important,
+        }, notification_type='SYSTEM'))
+
+
+@receiver(post_save, sender=NotificationPreference)
+def reset_broadcast_counter(sender, instance, **kwargs):
+    """Broadcast visibility follows system_enabled"""
+    counters.reset_broadcasts(instance.user_id)
+
+
+# ==========================================
+# Order events (delivered by the outbox relay)
+# ==========================================
+
+@outbox.subscriber('order.created')
+def notify_order_created(payload):
+    """Send notification when an order is created"""
+    try:
+        order = Order.objects.select_related('user', 'game').get(pk=payload['order_id'])
+    except Order.DoesNotExist:
+        return
+
+    game_name = order.game.name if order.game else "Unknown Game"
+    NotificationService.notify_order_created(
+        user=order.user,
+        order_id=order.order_id,
+        game_name=game_name
+    )
+
+
+@outbox.subscriber('order.status_changed')
+def push_order_status_change(payload):
+    """Push every order status transition to the owner's open realtime streams"""
+    order = Order.objects.filter(pk=payload['order_id']).values('user_id', 'order_id').first()
+    if order is None:
+        return
+
+    realtime.publish_to_user(order['user_id'], 'order_status', {
+        'order_id': order['order_id'],
+        'old_status': payload['old_status'],
+        'status': payload['new_status'],
+    })
+
+
+@outbox.subscriber('order.status_changed')
+def notify_order_status_change(payload):
     """Send notification when order status changes"""
-    if created:
-        # New order created
-        game_name = instance.game.name if instance.game else "Unknown Game"
-        NotificationService.notify_order_created(
-            user=instance.user,
-            order_id=instance.order_id,
-            game_name=game_name
+    new_status = payload['new_status']
+    if new_status not in ['processing', 'completed', 'canceled', 'refunded']:
+        return
+    if payload.get('notified'):
+        # Bulk jobs (auto-cancel) notify in their own transaction
+        return
+
+    try:
+        order = Order.objects.select_related('user').get(pk=payload['order_id'])
+    except Order.DoesNotExist:
+        return
+
+    if new_status == 'processing':
+        NotificationService.notify_order_processing(
+            user=order.user,
+            order_id=order.order_id
+        )
+    elif new_status == 'completed':
+        NotificationService.notify_order_completed(
+            user=order.user,
+            order_id=order.order_id
+        )
+    elif new_status == 'canceled':
+        NotificationService.notify_order_cancelled(
+            user=order.user,
+            order_id=order.order_id,
+            reason=order.admin_note
+        )
+    elif new_status == 'refunded':
+        NotificationService.notify_order_refunded(
+            user=order.user,
+            order_id=order.order_id,
+            amount=order.price
         )
-    else:
-        # Check if status changed
-        old_status = getattr(instance, '_old_status', None)
-        new_status = instance.status
-
-        if old_status and old_status != new_status:
-            # Status has changed
-            if new_status == 'processing':
-                NotificationService.notify_order_processing(
-                    user=instance.user,
-                    order_id=instance.order_id
-                )
-            elif new_status == 'completed':
-                NotificationService.notify_order_completed(
-                    user=instance.user,
-                    order_id=instance.order_id
-                )
-            elif new_status == 'canceled':
-                NotificationService.notify_order_cancelled(
-                    user=instance.user,
-                    order_id=instance.order_id,
-                    reason=instance.admin_note
-                )
-            elif new_status == 'refunded':
-                NotificationService.notify_order_refunded(
-                    user=instance.user,
-                    order_id=instance.order_id,
-                    amount=instance.price
-                )
 
 
 # ==========================================
-# Deposit signals
+# Deposit events
 # ==========================================
 
-@receiver(pre_save, sender=Deposit)
-def cache_old_deposit_status(sender, instance, **kwargs):
-    """Cache old status before save for comparison"""
-    if instance.pk:
-        try:
-            old_instance = Deposit.objects.get(pk=instance.pk)
-            instance._old_status = old_instance.status
-        except Deposit.DoesNotExist:
-            instance._old_status = None
-    else:
-        instance._old_status = None
-
-
-@receiver(post_save, sender=Deposit)
-def notify_deposit_status_change(sender, instance, created, **kwargs):
+@outbox.subscriber('deposit.status_changed')
+def notify_deposit_status_change(payload):
     """Send notification when deposit status changes"""
-    if not created:
-        old_status = getattr(instance, '_old_status', None)
-        new_status = instance.status
-
-        if old_status and old_status != new_status:
-            if new_status == 'confirmed':
-                NotificationService.notify_deposit_confirmed(
-                    user=instance.user,
-                    amount=instance.amount,
-                    transaction_id=str(instance.id)
-                )
-            elif new_status == 'rejected':
-                NotificationService.notify_deposit_rejected(
-                    user=instance.user,
-                    amount=instance.amount,
-                    reason=instance.admin_note,
-                    transaction_id=str(instance.id)
-                )
+    new_status = payload['new_status']
+    if new_status not in ['confirmed', 'rejected']:
+        return
+
+    try:
+        deposit = Deposit.objects.select_related('user').get(pk=payload['deposit_id'])
+    except Deposit.DoesNotExist:
+        return
+
+    if new_status == 'confirmed':
+        NotificationService.notify_deposit_confirmed(
+            user=deposit.user,
+            amount=deposit.amount,
+            transaction_id=str(deposit.id)
+        )
+    elif new_status == 'rejected':
+        NotificationService.notify_deposit_rejected(
+            user=deposit.user,
+            amount=deposit.amount,
+            reason=deposit.admin_note,
+            transaction_id=str(deposit.id)
+        )
 
 
 # ==========================================
-# CryptoDeposit signals
+# CryptoDeposit events
 # ==========================================
 
-@receiver(pre_save, sender=CryptoDeposit)
-def cache_old_crypto_deposit_status(sender, instance, **kwargs):
-    """Cache old status before save for comparison"""
-    if instance.pk:
-        try:
-            old_instance = CryptoDeposit.objects.get(pk=instance.pk)
-            instance._old_status = old_instance.status
-        except CryptoDeposit.DoesNotExist:
-            instance._old_status = None
-    else:
-        instance._old_status = None
-
-
-@receiver(post_save, sender=CryptoDeposit)
-def notify_crypto_deposit_status_change(sender, instance, created, **kwargs):
+@outbox.subscriber('crypto_deposit.status_changed')
+def notify_crypto_deposit_status_change(payload):
     """Send notification when crypto deposit status changes"""
-    if not created:
-        old_status = getattr(instance, '_old_status', None)
-        new_status = instance.status
-
-        if old_status and old_status != new_status:
-            # Only notify for wallet deposits, not order payments
-            if not instance.related_order:
-                if new_status == 'confirmed':
-                    NotificationService.notify_deposit_confirmed(
-                        user=instance.user,
-                        amount=instance.amount,
-                        transaction_id=instance.tx_hash
-                    )
-                elif new_status == 'rejected':
-                    NotificationService.notify_deposit_rejected(
-                        user=instance.user,
-                        amount=instance.amount,
-                        reason=instance.admin_note,
-                        transaction_id=instance.tx_hash
-                    )
+    new_status = payload['new_status']
+    if new_status not in ['confirmed', 'rejected']:
+        return
+
+    try:
+        deposit = CryptoDeposit.objects.select_related('user').get(pk=payload['deposit_id'])
+    except CryptoDeposit.DoesNotExist:
+        return
+
+    # Only notify for wallet deposits, not order payments
+    if deposit.related_order_id:
+        return
+
+    if new_status == 'confirmed':
+        NotificationService.notify_deposit_confirmed(
+            user=deposit.user,
+            amount=deposit.amount,
+            transaction_id=deposit.tx_hash
+        )
+    elif new_status == 'rejected':
+        NotificationService.notify_deposit_rejected(
+            user=deposit.user,
+            amount=deposit.amount,
+            reason=deposit.admin_note,
+            transaction_id=deposit.tx_hash
+        )
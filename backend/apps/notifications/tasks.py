@@ -9,24 +9,44 @@ logger = logging.getLogger(__name__)
 @shared_task(name='notifications.cleanup_old_notifications')
 def cleanup_old_notifications(days=90):
     """
-    Delete notifications older than specified days.
+    Delete notifications and broadcasts older than specified days.
     Default: 90 days
 
     This task should be scheduled to run daily via Celery Beat.
     """
-    from .models import Notification
+    from .models import Broadcast, Notification
+
+    from . import counters
 
     cutoff_date = timezone.now() - timedelta(days=days)
 
+    # Unread rows are about to go: their owners' counters must be rebuilt
+    user_ids = list(
+        Notification.objects.filter(created_at__lt=cutoff_date, is_read=False)
+        .order_by()
+        .values_list('user_id', flat=True)
+        .distinct()
+    )
+
     # Delete old notifications
     deleted_count, _ = Notification.objects.filter(
         created_at__lt=cutoff_date
     ).delete()
+    counters.reset(user_ids)
+
+    # One row per broadcast; its receipts go with it
+    deleted_broadcasts, _ = Broadcast.objects.filter(
+        created_at__lt=cutoff_date
+    ).delete()
 
-    logger.info(f"Cleaned up {deleted_count} notifications older than {days} days")
+    logger.info(
+        f"Cleaned up {deleted_count} notifications and {deleted_broadcasts} broadcast rows "
+        f"older than {days} days"
+    )
 
     return {
         'deleted_count': deleted_count,
+        'deleted_broadcasts': deleted_broadcasts,
         'cutoff_date': cutoff_date.isoformat()
     }
 
@@ -60,93 +80,92 @@ def cleanup_read_notifications(days=30):
 @shared_task(name='notifications.send_notification_email')
 def send_notification_email(notification_id):
     """
-    Send email for a notification.
+    Queue an email for a notification (sent by core.deliver_emails).
     For future use when email notifications are enabled.
     """
     from .models import Notification
-    from django.core.mail import send_mail
-    from django.conf import settings
+    from . import preferences
+    from apps.core import mailer
 
     try:
         notification = Notification.objects.select_related('user').get(id=notification_id)
         user = notification.user
 
         # Check if user has email notifications enabled
-        try:
-            if not user.notification_preferences.email_enabled:
-                return {'status': 'skipped', 'reason': 'email_disabled'}
-        except Exception:
-            return {'status': 'skipped', 'reason': 'no_preferences'}
-
-        # Send email
-        send_mail(
-            subject=notification.title,
-            message=notification.message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[user.email],
-            fail_silently=False,
+        if not preferences.get_mask(user.pk) & preferences.EMAIL:
+            return {'status': 'skipped', 'reason': 'email_disabled'}
+
+        title, message = notification.render()
+        email = mailer.enqueue(
+            to_email=user.email,
+            subject=title,
+            body=message
         )
 
-        logger.info(f"Sent email notification to {user.email}")
-        return {'status': 'sent', 'email': user.email}
+        logger.info(f"Queued email notification to {user.email}")
+        return {'status': 'queued', 'email': user.email, 'email_id': email.pk}
 
     except Notification.DoesNotExist:
         logger.error(f"Notification {notification_id} not found")
         return {'status': 'error', 'reason': 'not_found'}
     except Exception as e:
-        logger.error(f"Failed to send email for notification {notification_id}: {str(e)}")
+        logger.error(f"Failed to queue email for notification {notification_id}: {str(e)}")
         return {'status': 'error', 'reason': str(e)}
 
 
-@shared_task(name='notifications.send_notification_telegram')
-def send_notification_telegram(notification_id):
+@shared_task(name='notifications.deliver_telegram')
+def deliver_telegram(batch_size=None, max_batches=20):
     """
-    Send Telegram message for a notification.
-    For future use when Telegram notifications are enabled.
+    Send pending Telegram messages in batches (see apps.notifications.telegram).
+    Triggered after each commit that creates one, and every 30 seconds by
+    Celery Beat to pick up retries.
     """
-    from .models import Notification
-    import requests
+    from django.core.cache import cache
+    from django.conf import settings
+    from . import telegram
 
-    try:
-        notification = Notification.objects.select_related('user').get(id=notification_id)
-        user = notification.user
+    # Rate limits are tracked in-process: one delivery at a time
+    lock_key = 'notifications:telegram:delivering'
+    if not cache.add(lock_key, True, timeout=getattr(settings, 'TELEGRAM_LOCK_TIMEOUT', 300)):
+        return {'status': 'skipped', 'reason': 'already_running'}
 
-        # Check if user has Telegram notifications enabled
-        try:
-            preferences = user.notification_preferences
-            if not preferences.telegram_enabled or not preferences.telegram_chat_id:
-                return {'status': 'skipped', 'reason': 'telegram_disabled'}
-
-            chat_id = preferences.telegram_chat_id
-        except Exception:
-            return {'status': 'skipped', 'reason': 'no_preferences'}
-
-        # TODO: Configure bot token in settings
-        # bot_token = settings.TELEGRAM_BOT_TOKEN
-        #
-        # message = f"*{notification.title}*\n\n{notification.message}"
-        #
-        # response = requests.post(
-        #     f"https://api.telegram.org/bot{bot_token}/sendMessage",
-        #     json={
-        #         'chat_id': chat_id,
-        #         'text': message,
-        #         'parse_mode': 'Markdown'
-        #     }
-        # )
-        #
-        # if response.status_code == 200:
-        #     logger.info(f"Sent Telegram notification to {chat_id}")
-        #     return {'status': 'sent', 'chat_id': chat_id}
-        # else:
-        #     logger.error(f"Telegram API error: {response.text}")
-        #     return {'status': 'error', 'reason': response.text}
-
-        return {'status': 'skipped', 'reason': 'telegram_not_configured'}
+    totals = {'sent': 0, 'retried': 0, 'deferred': 0, 'failed': 0, 'skipped': 0}
+    try:
+        for _ in range(max_batches):
+            result = telegram.deliver(batch_size=batch_size)
+            for key, value in result.items():
+                totals[key] += value
+            # Retries and paused chats are scheduled past now, so they drop
+            # out of the queue; stop once nothing due is left
+            if not any(result.values()):
+                break
+    finally:
+        cache.delete(lock_key)
+
+    if any(totals.values()):
+        logger.info(f"Telegram delivery: {totals}")
+    return totals
+
+
+@shared_task(name='notifications.reconcile_unread_counters')
+def reconcile_unread_counters(minutes=30):
+    """
+    Rewrite the cached unread counters of users whose notifications changed
+    in the last `minutes` from the table, correcting any drift.
 
-    except Notification.DoesNotExist:
-        logger.error(f"Notification {notification_id} not found")
-        return {'status': 'error', 'reason': 'not_found'}
-    except Exception as e:
-        logger.error(f"Failed to send Telegram for notification {notification_id}: {str(e)}")
-        return {'status': 'error', 'reason': str(e)}
+    This task should be scheduled via Celery Beat.
+    """
+    from .models import Notification
+    from . import counters
+
+    cutoff = timezone.now() - timedelta(minutes=minutes)
+    user_ids = (
+        Notification.objects.filter(updated_at__gte=cutoff)
+        .order_by()
+        .values_list('user_id', flat=True)
+        .distinct()
+    )
+    reconciled = counters.reconcile(user_ids)
+
+    logger.info(f"Reconciled {reconciled} unread notification counters")
+    return {'reconciled': reconciled}
@@ -0,0 +1,324 @@
+"""
+Telegram delivery
+
+Notifications for users with Telegram enabled are created with
+telegram_status='pending'. The notifications.deliver_telegram task drains
+them in batches with deliver(): each batch is sent from one asyncio event
+loop over a pooled httpx.AsyncClient, so requests to the Bot API share
+keep-alive connections and run concurrently across chats.
+
+Telegram limits bots to roughly 30 messages per second overall and about
+one per second per chat. Both are enforced with token buckets
+(TELEGRAM_GLOBAL_RATE and TELEGRAM_CHAT_RATE); messages to the same chat
+are sent one after another, in order. The buckets live in the delivering
+process, so the task holds a lock and only one delivery runs at a time.
+
+No transaction is open while messages are on the wire. A batch is claimed
+in a short transaction by moving telegram_available_at TELEGRAM_LEASE_TIMEOUT
+ahead (a batch whose worker died is picked up again after that), sent, and
+the outcomes are written in a second short transaction.
+
+Outcomes are written back on the notification: 'sent', 'failed' (rejected
+by Telegram, e.g. the user blocked the bot, or out of attempts) or
+'skipped' (no chat id). Network and 5xx errors are retried after
+TELEGRAM_RETRY_DELAY, doubled per attempt, until TELEGRAM_MAX_ATTEMPTS;
+later messages to the same chat wait for the retried one. A 429 pauses the
+chat for the retry_after Telegram asks for: its messages get that
+telegram_available_at, so they drop out of the queue without holding up
+other chats.
+
+TELEGRAM_API_URL can point at a local stub server for testing.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import httpx
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from apps.core.cache import make_key
+
+from . import preferences
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+DELIVERY_DEBOUNCE_KEY = 'notifications:telegram:delivery-scheduled'
+
+# Per-message outcomes of a send
+SENT = 'sent'
+FAILED = 'failed'
+RETRY = 'retry'  # counts as an attempt
+DEFERRED = 'deferred'  # left pending without counting an attempt
+
+
+def is_configured():
+    return bool(getattr(settings, 'TELEGRAM_BOT_TOKEN', ''))
+
+
+def initial_status(user_id):
+    """telegram_status for a new notification of user_id"""
+    if is_configured() and preferences.get_mask(user_id) & preferences.TELEGRAM:
+        return 'pending'
+    return ''
+
+
+def initial_statuses(user_ids):
+    """{user_id: telegram_status} for new notifications of user_ids"""
+    if not is_configured():
+        return {user_id: '' for user_id in user_ids}
+    return {
+        user_id: 'pending' if mask & preferences.TELEGRAM else ''
+        for user_id, mask in preferences.get_masks(user_ids).items()
+    }
+
+
+def schedule_delivery():
+    """Ask a worker to send pending messages soon (at most once per second)"""
+    if not cache.add(DELIVERY_DEBOUNCE_KEY, True, timeout=1):
+        return
+    from .tasks import deliver_telegram
+    try:
+        deliver_telegram.delay()
+    except Exception as e:
+        # The periodic delivery will pick the messages up
+        logger.warning(f"Could not enqueue Telegram delivery: {e}")
+
+
+def _paused_key(chat_id):
+    return make_key('notifications', 'telegram', 'paused', chat_id)
+
+
+def _pause(chat_id, until):
+    """Hold back chat_id's messages, including ones created later, until `until`"""
+    seconds = max(int((until - timezone.now()).total_seconds()), 1)
+    cache.set(_paused_key(chat_id), until.timestamp(), seconds)
+
+
+def _paused_until(chat_ids):
+    """{chat_id: datetime the pause ends} for paused chats among chat_ids"""
+    keys = {_paused_key(chat_id): chat_id for chat_id in chat_ids}
+    return {
+        keys[key]: datetime.fromtimestamp(until, tz=dt_timezone.utc)
+        for key, until in cache.get_many(list(keys)).items()
+    }
+
+
+def format_message(notification):
+    title, message = notification.render()
+    return f'{title}\n\n{message}'
+
+
+# ==========================================
+# Sending
+# ==========================================
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second, with bursts of up to `capacity`"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = None
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if self.updated is not None:
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def _error(response):
+    try:
+        body = response.json()
+    except ValueError:
+        return f'HTTP {response.status_code}', {}
+    return f"HTTP {response.status_code}: {body.get('description', '')}", body.get('parameters') or {}
+
+
+async def _send_chat(client, global_bucket, chat_id, messages, results, paused):
+    """Send one chat's messages in order, stopping at the first that must be retried"""
+    chat_bucket = TokenBucket(getattr(settings, 'TELEGRAM_CHAT_RATE', 1))
+    for index, (notification_id, text) in enumerate(messages):
+        await chat_bucket.acquire()
+        await global_bucket.acquire()
+        try:
+            response = await client.post('sendMessage', json={'chat_id': chat_id, 'text': text})
+        except httpx.HTTPError as e:
+            outcome = (RETRY, f'{type(e).__name__}: {e}')
+        else:
+            if response.status_code == 200:
+                results[notification_id] = (SENT, '')
+                continue
+            error, parameters = _error(response)
+            if response.status_code == 429:
+                paused[chat_id] = int(parameters.get('retry_after', 1))
+                outcome = (DEFERRED, error)
+            elif response.status_code >= 500:
+                outcome = (RETRY, error)
+            else:
+                # Rejected for good (bot blocked, chat not found, bad request)
+                results[notification_id] = (FAILED, error)
+                continue
+
+        # Later messages wait for this one so the chat sees them in order
+        results[notification_id] = outcome
+        for later_id, _ in messages[index + 1:]:
+            results[later_id] = (DEFERRED, '')
+        return
+
+
+async def send_batch(chats):
+    """
+    Send {chat_id: [(notification_id, text), ...]} to Telegram.
+
+    Returns:
+        tuple: ({notification_id: (outcome, error)}, {chat_id: seconds to pause})
+    """
+    results = {}
+    paused = {}
+    global_bucket = TokenBucket(getattr(settings, 'TELEGRAM_GLOBAL_RATE', 25))
+    max_connections = getattr(settings, 'TELEGRAM_MAX_CONNECTIONS', 20)
+
+    async with httpx.AsyncClient(
+        base_url=f"{settings.TELEGRAM_API_URL}/bot{settings.TELEGRAM_BOT_TOKEN}/",
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        timeout=getattr(settings, 'TELEGRAM_TIMEOUT', 10)
+    ) as client:
+        await asyncio.gather(*(
+            _send_chat(client, global_bucket, chat_id, messages, results, paused)
+            for chat_id, messages in chats.items()
+        ))
+    return results, paused
+
+
+# ==========================================
+# Batches
+# ==========================================
+
+def deliver(batch_size=None):
+    """
+    Send one batch of pending Telegram messages.
+
+    Returns:
+        dict: counts of sent, retried, deferred, failed and skipped notifications
+    """
+    result = {'sent': 0, 'retried': 0, 'deferred': 0, 'failed': 0, 'skipped': 0}
+    if not is_configured():
+        return result
+
+    notifications = _claim(batch_size or getattr(settings, 'TELEGRAM_BATCH_SIZE', 200), result)
+    if not notifications:
+        return result
+
+    chats = defaultdict(list)
+    for notification in notifications:
+        chats[notification.chat_id].append((notification.pk, format_message(notification)))
+
+    outcomes, paused = asyncio.run(send_batch(chats))
+    _record(notifications, outcomes, paused, result)
+    return result
+
+
+def _claim(batch_size, result):
+    """
+    Lease up to batch_size due notifications (short transaction).
+    Those without a chat id are marked skipped, those of paused chats are
+    moved to the end of the pause.
+
+    Returns:
+        list: leased notifications to send, with chat_id annotated
+    """
+    now = timezone.now()
+    lease_until = now + timedelta(seconds=getattr(settings, 'TELEGRAM_LEASE_TIMEOUT', 300))
+
+    with transaction.atomic():
+        notifications = list(
+            Notification.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(telegram_status='pending', telegram_available_at__lte=now)
+            .annotate(chat_id=F('user__notification_preferences__telegram_chat_id'))
+            .order_by('id')[:batch_size]
+        )
+        if not notifications:
+            return []
+
+        paused = _paused_until({n.chat_id for n in notifications if n.chat_id})
+        claimed = []
+        for notification in notifications:
+            if not notification.chat_id:
+                notification.telegram_status = 'skipped'
+                result['skipped'] += 1
+            elif notification.chat_id in paused:
+                notification.telegram_available_at = paused[notification.chat_id]
+                result['deferred'] += 1
+            else:
+                notification.telegram_available_at = lease_until
+                claimed.append(notification)
+
+        # bulk_update leaves updated_at alone, so delivery does not show up in delta sync
+        Notification.objects.bulk_update(notifications, ['telegram_status', 'telegram_available_at'])
+
+    return claimed
+
+
+def _record(notifications, outcomes, paused, result):
+    """Write the outcomes of a sent batch back (short transaction) and pause rate-limited chats"""
+    max_attempts = getattr(settings, 'TELEGRAM_MAX_ATTEMPTS', 5)
+    retry_delay = getattr(settings, 'TELEGRAM_RETRY_DELAY', 30)
+    now = timezone.now()
+    # When each chat's held-back messages may go again
+    resume_at = {chat_id: now + timedelta(seconds=seconds) for chat_id, seconds in paused.items()}
+
+    for notification in notifications:
+        outcome, error = outcomes.get(notification.pk, (DEFERRED, ''))
+        if outcome == SENT:
+            notification.telegram_status = 'sent'
+            notification.telegram_sent_at = now
+            notification.telegram_error = ''
+            result['sent'] += 1
+            continue
+
+        if outcome == DEFERRED:
+            # Behind a retried message or in a rate-limited chat; the id order keeps them in sequence
+            if error:
+                notification.telegram_error = error[:255]
+            notification.telegram_available_at = resume_at.get(notification.chat_id, now)
+            result['deferred'] += 1
+            continue
+
+        notification.telegram_error = error[:255]
+        notification.telegram_attempts += 1
+        if outcome == FAILED or notification.telegram_attempts >= max_attempts:
+            notification.telegram_status = 'failed'
+            result['failed'] += 1
+            logger.error(f"Telegram message for notification {notification.pk} failed: {error}")
+        else:
+            notification.telegram_available_at = now + timedelta(
+                seconds=retry_delay * 2 ** (notification.telegram_attempts - 1)
+            )
+            resume_at.setdefault(notification.chat_id, notification.telegram_available_at)
+            result['retried'] += 1
+            logger.warning(f"Telegram message for notification {notification.pk} will be retried: {error}")
+
+    with transaction.atomic():
+        Notification.objects.bulk_update(
+            notifications,
+            ['telegram_status', 'telegram_attempts', 'telegram_sent_at', 'telegram_error', 'telegram_available_at']
+        )
+
+    for chat_id, until in resume_at.items():
+        if chat_id in paused:
+            _pause(chat_id, until)
+            logger.warning(f"Telegram rate limited chat {chat_id} for {paused[chat_id]}s")
@@ -0,0 +1,649 @@
+import asyncio
+import json
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
+
+import redis
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient, APITestCase
+
+from apps.users.models import User
+from . import catalog, counters, feed, preferences, realtime, telegram
+from .models import Broadcast, BroadcastReceipt, Notification, NotificationPreference
+from .services import NotificationService
+from .tasks import deliver_telegram, reconcile_unread_counters
+
+
+class RealtimePushTests(TestCase):
+    """Bulk notifications reach Redis in one pipelined round trip"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(username=f'user{i}', email=f'user{i}@example.com', password='pass12345')
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        realtime._down_until = 0.0
+        patcher = mock.patch.object(realtime, '_get_client')
+        self.client = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.pipeline = self.client.pipeline.return_value
+
+    def cancel_orders(self, count):
+        orders = [
+            SimpleNamespace(user_id=self.users[i % 3].pk, order_id=f'GT-{i:06d}')
+            for i in range(count)
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            return NotificationService.notify_orders_cancelled(orders, reason='Not paid')
+
+    def test_bulk_notifications_are_published_in_one_round_trip(self):
+        created = self.cancel_orders(30)
+
+        self.assertEqual(len(created), 30)
+        self.client.pipeline.assert_called_once_with(transaction=False)
+        self.assertEqual(self.pipeline.publish.call_count, 30)
+        self.pipeline.execute.assert_called_once_with()
+        channels = {call.args[0] for call in self.pipeline.publish.call_args_list}
+        self.assertEqual(channels, {realtime.user_channel(user.pk) for user in self.users})
+
+    def test_publishes_pause_after_a_redis_failure(self):
+        self.pipeline.execute.side_effect = redis.ConnectionError('down')
+
+        self.cancel_orders(5)
+        self.cancel_orders(5)
+
+        # The second batch is dropped without touching the socket
+        self.pipeline.execute.assert_called_once_with()
+
+        realtime._down_until = 0.0
+        self.pipeline.execute.side_effect = None
+        self.cancel_orders(5)
+        self.assertEqual(self.pipeline.execute.call_count, 2)
+
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    SSE_HEARTBEAT=60,
+)
+class RealtimeStreamTests(TestCase):
+    """Broadcast pushes: after commit, only to users who see broadcasts; single-use tickets"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader', email='reader@example.com', password='pass12345')
+
+    def setUp(self):
+        cache.clear()
+        realtime._down_until = 0.0
+        patcher = mock.patch.object(realtime, '_send')
+        self.send = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_broadcast(self):
+        return Broadcast.objects.create(title='Maintenance', message='Tonight')
+
+    def test_broadcast_is_pushed_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            broadcast = self.create_broadcast()
+            self.send.assert_not_called()
+
+        [(channel, message)] = self.send.call_args.args[0]
+        self.assertEqual(channel, realtime.BROADCAST_CHANNEL)
+        self.assertEqual(
+            json.loads(message),
+            {'event': 'broadcast', 'type': 'SYSTEM',
+             'data': {'id': -broadcast.pk, 'title': 'Maintenance', 'is_important': False}}
+        )
+
+    def test_rolled_back_broadcast_is_not_pushed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    self.create_broadcast()
+                    raise RuntimeError('admin save failed')
+
+        self.send.assert_not_called()
+
+    def first_event(self, mask):
+        """First event a stream of self.user forwards after a broadcast and an untyped message"""
+        cache.set(preferences._key(self.user.pk), mask)
+
+        async def run():
+            stream = realtime.event_stream(self.user.pk)
+            await stream.__anext__()  # retry: line
+            hub = realtime.get_hub()
+            hub.dispatch(realtime.BROADCAST_CHANNEL, realtime._encode('broadcast', {'id': -1}, 'SYSTEM'))
+            hub.dispatch(realtime.BROADCAST_CHANNEL, realtime._encode('notice', {'id': 2}))
+            try:
+                return await stream.__anext__()
+            finally:
+                await stream.aclose()
+
+        async def listen(hub):
+            pass
+
+        with mock.patch.object(realtime.StreamHub, '_listen', listen):
+            return asyncio.run(run())
+
+    def test_stream_forwards_broadcasts_to_users_who_see_them(self):
+        self.assertEqual(self.first_event(preferences.DEFAULT_MASK), 'event: broadcast\ndata: {"id": -1}\n\n')
+
+    def test_stream_skips_broadcasts_when_system_notifications_are_off(self):
+        mask = preferences.DEFAULT_MASK & ~preferences.SYSTEM
+        self.assertEqual(self.first_event(mask), 'event: notice\ndata: {"id": 2}\n\n')
+
+    def test_stream_ticket_is_single_use(self):
+        ticket = realtime.issue_ticket(self.user)
+
+        self.assertEqual(asyncio.run(realtime.aresolve_ticket(ticket)), self.user.pk)
+        self.assertIsNone(asyncio.run(realtime.aresolve_ticket(ticket)))
+        self.assertIsNone(asyncio.run(realtime.aresolve_ticket('made-up')))
+
+
+class BotAPIStub(ThreadingHTTPServer):
+    """
+    Local Telegram Bot API: answers sendMessage per chat from `responses`
+    ({chat_id: (status, body)}, 200 by default) and records what it got.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), BotAPIHandler)
+        self.responses = {}
+        self.received = []
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class BotAPIHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.received.append((payload['chat_id'], payload['text']))
+        status, body = self.server.responses.get(payload['chat_id'], (200, {'ok': True, 'result': {}}))
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@override_settings(
+    # Chat pauses live in the cache; keep them off a shared Redis
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    TELEGRAM_BOT_TOKEN='test-token',
+    TELEGRAM_CHAT_RATE=100,
+    TELEGRAM_GLOBAL_RATE=1000,
+    TELEGRAM_RETRY_DELAY=30,
+    TELEGRAM_LEASE_TIMEOUT=300,
+)
+class TelegramDeliveryTests(TransactionTestCase):
+    """deliver() against a local Bot API stub, with no transaction open while sending"""
+
+    def setUp(self):
+        cache.clear()
+        self.api = BotAPIStub()
+        self.api.start()
+        self.addCleanup(self.api.stop)
+        api_url = override_settings(TELEGRAM_API_URL=self.api.url)
+        api_url.enable()
+        self.addCleanup(api_url.disable)
+
+        self.chats = {}
+        for name in ('alice', 'bob', 'carol'):
+            user = User.objects.create_user(username=name, email=f'{name}@example.com', password='pass12345')
+            NotificationPreference.objects.filter(user=user).update(
+                telegram_enabled=True, telegram_chat_id=f'chat-{name}'
+            )
+            self.chats[name] = user
+
+        send_batch = telegram.send_batch
+
+        async def send_outside_transaction(chats):
+            self.assertFalse(connection.in_atomic_block, 'send_batch ran inside a transaction')
+            return await send_batch(chats)
+
+        patcher = mock.patch.object(telegram, 'send_batch', send_outside_transaction)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def notify(self, name, text):
+        return Notification.objects.create(
+            user=self.chats[name], title=text, message='Body', telegram_status='pending'
+        )
+
+    def test_batch_is_sent_in_order_per_chat(self):
+        for i in range(3):
+            for name in self.chats:
+                self.notify(name, f'{name} {i}')
+
+        result = telegram.deliver()
+
+        self.assertEqual(result['sent'], 9)
+        self.assertFalse(Notification.objects.exclude(telegram_status='sent').exists())
+        for name in self.chats:
+            texts = [text.split('\n')[0] for chat_id, text in self.api.received if chat_id == f'chat-{name}']
+            self.assertEqual(texts, [f'{name} {i}' for i in range(3)])
+
+    def test_rate_limited_chat_does_not_stall_other_chats(self):
+        self.api.responses['chat-alice'] = (429, {
+            'ok': False, 'description': 'Too Many Requests', 'parameters': {'retry_after': 60},
+        })
+        # The paused chat's messages come first in id order and fill the first batch
+        first = [self.notify('alice', f'alice {i}') for i in range(2)]
+        for name in ('bob', 'carol'):
+            for i in range(2):
+                self.notify(name, f'{name} {i}')
+
+        totals = deliver_telegram(batch_size=2)
+
+        self.assertEqual(totals['sent'], 4)
+        self.assertEqual(Notification.objects.filter(telegram_status='sent').count(), 4)
+        # Only the first alice message reached Telegram; both wait out retry_after without an attempt
+        self.assertEqual([chat for chat, _ in self.api.received].count('chat-alice'), 1)
+        resume = timezone.now() + timedelta(seconds=55)
+        for notification in Notification.objects.filter(pk__in=[n.pk for n in first]):
+            self.assertEqual((notification.telegram_status, notification.telegram_attempts), ('pending', 0))
+            self.assertGreater(notification.telegram_available_at, resume)
+
+        # A message created during the pause is held back at claim time without a request
+        later = self.notify('alice', 'alice later')
+        self.assertEqual(telegram.deliver()['deferred'], 1)
+        later.refresh_from_db()
+        self.assertGreater(later.telegram_available_at, resume)
+        self.assertEqual([chat for chat, _ in self.api.received].count('chat-alice'), 1)
+
+    def test_server_error_is_retried_with_backoff_in_order(self):
+        self.api.responses['chat-bob'] = (502, {'ok': False, 'description': 'Bad Gateway'})
+        failing = self.notify('bob', 'bob 0')
+        waiting = self.notify('bob', 'bob 1')
+        self.notify('carol', 'carol 0')
+
+        before = timezone.now()
+        result = telegram.deliver()
+
+        self.assertEqual((result['sent'], result['retried'], result['deferred']), (1, 1, 1))
+        failing.refresh_from_db()
+        waiting.refresh_from_db()
+        self.assertEqual((failing.telegram_attempts, failing.telegram_status), (1, 'pending'))
+        self.assertIn('502', failing.telegram_error)
+        self.assertGreaterEqual(failing.telegram_available_at, before + timedelta(seconds=30))
+        # The later message waits for the retried one and has not used an attempt
+        self.assertEqual(waiting.telegram_attempts, 0)
+        self.assertEqual(waiting.telegram_available_at, failing.telegram_available_at)
+
+        # Nothing is due until the backoff passes
+        self.assertFalse(any(telegram.deliver().values()))
+
+        self.api.responses.clear()
+        Notification.objects.filter(pk__in=[failing.pk, waiting.pk]).update(telegram_available_at=timezone.now())
+        self.assertEqual(telegram.deliver()['sent'], 2)
+        self.assertEqual(
+            [text.split('\n')[0] for chat, text in self.api.received if chat == 'chat-bob'][-2:],
+            ['bob 0', 'bob 1']
+        )
+
+    def test_claimed_batch_is_leased(self):
+        notification = self.notify('carol', 'carol 0')
+        claimed = telegram._claim(10, dict.fromkeys(('skipped', 'deferred'), 0))
+        self.assertEqual([n.pk for n in claimed], [notification.pk])
+
+        # Another run does not pick the leased row up until the lease runs out
+        self.assertFalse(any(telegram.deliver().values()))
+        Notification.objects.filter(pk=notification.pk).update(telegram_available_at=timezone.now())
+        self.assertEqual(telegram.deliver()['sent'], 1)
+
+    def test_missing_chat_id_is_skipped(self):
+        NotificationPreference.objects.filter(user=self.chats['alice']).update(telegram_chat_id='')
+        notification = self.notify('alice', 'alice 0')
+
+        self.assertEqual(telegram.deliver()['skipped'], 1)
+        notification.refresh_from_db()
+        self.assertEqual(notification.telegram_status, 'skipped')
+        self.assertEqual(self.api.received, [])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class NotificationFeedTests(APITestCase):
+    """Broadcasts share the feed under negative ids; read/dismiss state stays per user"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader', email='reader@example.com', password='pass12345')
+        cls.other = User.objects.create_user(username='other', email='other@example.com', password='pass12345')
+        User.objects.update(date_joined=timezone.now() - timedelta(days=1))
+        cls.user.refresh_from_db()
+        cls.old_broadcast = Broadcast.objects.create(title='Before you joined', message='Old')
+        Broadcast.objects.filter(pk=cls.old_broadcast.pk).update(created_at=timezone.now() - timedelta(days=2))
+        cls.broadcast = Broadcast.objects.create(title='Maintenance', message='Tonight')
+        cls.notification = Notification.objects.create(user=cls.user, title='Hello', message='Hi')
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(realtime, '_send')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.force_authenticate(self.user)
+
+    def feed_ids(self, user):
+        self.client.force_authenticate(user)
+        return [item['id'] for item in self.client.get(reverse('notification-list')).data['results']]
+
+    def test_feed_merges_broadcasts_under_negative_ids(self):
+        self.assertEqual(self.feed_ids(self.user), [self.notification.pk, -self.broadcast.pk])
+
+        response = self.client.get(reverse('notification-detail', args=[-self.broadcast.pk]))
+        self.assertEqual(response.data['title'], 'Maintenance')
+        for item_id in (-self.old_broadcast.pk, -9999, 'abc'):
+            self.assertEqual(self.client.get(reverse('notification-detail', args=[item_id])).status_code, 404)
+
+    def test_mark_as_read_accepts_broadcast_ids(self):
+        self.assertEqual(self.client.get(reverse('notification-unread-count')).data['count'], 2)
+
+        # Counters are adjusted once the change commits
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('notification-mark-as-read'), {
+                'notification_ids': [self.notification.pk, -self.broadcast.pk, -self.old_broadcast.pk, -9999],
+            }, format='json')
+
+        # Broadcasts the user cannot see are ignored
+        self.assertEqual(response.data['updated_count'], 2)
+        self.assertEqual(
+            list(BroadcastReceipt.objects.values_list('user', 'broadcast', 'is_dismissed')),
+            [(self.user.pk, self.broadcast.pk, False)]
+        )
+        self.assertEqual(self.client.get(reverse('notification-unread-count')).data['count'], 0)
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.get(reverse('notification-unread-count')).data['count'], 1)
+
+    def test_deleting_a_broadcast_dismisses_it_for_this_user_only(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(reverse('notification-detail', args=[-self.broadcast.pk]))
+
+        self.assertEqual(response.status_code, 204)
+        self.assertTrue(Broadcast.objects.filter(pk=self.broadcast.pk).exists())
+        self.assertEqual(self.feed_ids(self.user), [self.notification.pk])
+        self.assertEqual(self.feed_ids(self.other), [-self.broadcast.pk])
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(reverse('notification-unread-count')).data['count'], 1)
+
+        # Dismissing a broadcast the user never saw, or one that does not exist, is a 404
+        for item_id in (-self.old_broadcast.pk, -9999):
+            self.assertEqual(self.client.delete(reverse('notification-detail', args=[item_id])).status_code, 404)
+        self.assertEqual(BroadcastReceipt.objects.count(), 1)
+
+    def test_malformed_cursor_is_400(self):
+        for since in ('abc', '1_x', 'x_1', '1', f'{10 ** 30}_1'):
+            with self.subTest(since=since):
+                response = self.client.get(reverse('notification-recent'), {'since': since})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data, {'detail': 'Invalid cursor.'})
+
+    def test_cursor_stays_behind_the_lag_horizon(self):
+        Notification.objects.filter(pk=self.notification.pk).update(updated_at=timezone.now() - timedelta(minutes=10))
+        fresh = Notification.objects.create(user=self.user, title='Just now', message='Fresh')
+        start = feed.encode_cursor(self.user.date_joined, 0)
+
+        with override_settings(SYNC_CURSOR_LAG=60):
+            items, cursor, has_more = feed.changes_since(self.user, start, limit=10)
+            self.assertEqual([item.pk for item in items], [self.notification.pk, -self.broadcast.pk, fresh.pk])
+            self.assertFalse(has_more)
+            # Held back at now - SYNC_CURSOR_LAG, so rows saved within it are read again on the next poll
+            position, _ = feed.decode_cursor(cursor)
+            self.assertLess(position, fresh.updated_at - timedelta(seconds=59))
+            self.assertGreater(position, Notification.objects.get(pk=self.notification.pk).updated_at)
+            items, _, _ = feed.changes_since(self.user, cursor, limit=10)
+            self.assertEqual([item.pk for item in items], [-self.broadcast.pk, fresh.pk])
+
+            self.assertLess(feed.decode_cursor(feed.current_cursor(self.user))[0], fresh.updated_at)
+
+    def test_cursor_follows_the_last_row_while_paging(self):
+        with override_settings(SYNC_CURSOR_LAG=60):
+            items, cursor, has_more = feed.changes_since(self.user, feed.encode_cursor(self.user.date_joined, 0), 1)
+
+        self.assertTrue(has_more)
+        self.assertEqual(feed.decode_cursor(cursor), (items[0].updated_at, items[0].pk))
+
+        items, unchanged, has_more = feed.changes_since(self.user, feed.encode_cursor(timezone.now(), 0), 10)
+        self.assertEqual((items, has_more), ([], False))
+
+
+class NotificationCatalogTests(TestCase):
+    """Templated notifications render in the reader's locale, with fallbacks"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader', email='reader@example.com', password='pass12345')
+
+    def setUp(self):
+        catalog._render.cache_clear()
+        self.addCleanup(catalog._render.cache_clear)
+
+    def test_locale_is_normalized(self):
+        for value, locale in (('vi', 'vi'), ('zh-CN', 'cn'), ('en_US', 'en'), (' VI ', 'vi'), ('fr', None), ('', None)):
+            self.assertEqual(catalog.normalize_locale(value), locale)
+
+    def test_locale_comes_from_lang_then_accept_language(self):
+        factory = RequestFactory()
+        self.assertEqual(catalog.get_locale(factory.get('/', {'lang': 'cn'}, HTTP_ACCEPT_LANGUAGE='vi')), 'cn')
+        self.assertEqual(catalog.get_locale(factory.get('/', {'lang': 'fr'}, HTTP_ACCEPT_LANGUAGE='vi')), 'vi')
+        self.assertEqual(catalog.get_locale(factory.get('/', HTTP_ACCEPT_LANGUAGE='fr-FR, zh;q=0.8, vi;q=0.9')), 'cn')
+        self.assertEqual(catalog.get_locale(factory.get('/', HTTP_ACCEPT_LANGUAGE='fr')), 'en')
+        self.assertEqual(catalog.get_locale(None), 'en')
+
+    def test_unknown_locale_and_missing_translation_fall_back_to_english(self):
+        english = ('Order Cancelled', 'Your order #GT-1 has been cancelled.')
+        self.assertEqual(catalog.render('order_cancelled', {'order_id': 'GT-1'}, 'fr'), english)
+
+        with mock.patch.dict(catalog.TEMPLATES, {'test_only': {'en': ('Title', 'Hello {name}')}}):
+            self.assertEqual(catalog.render('test_only', {'name': 'Ann'}, 'vi'), ('Title', 'Hello Ann'))
+
+    def test_reason_is_appended_in_the_locale(self):
+        title, message = catalog.render('order_cancelled', {'order_id': 'GT-1', 'reason': 'Timeout'}, 'vi')
+        self.assertEqual(title, 'Đơn hàng đã hủy')
+        self.assertTrue(message.endswith(' Lý do: Timeout'))
+
+    def test_missing_params_render_empty(self):
+        self.assertEqual(
+            catalog.render('order_refunded', {'order_id': 'GT-1'}),
+            ('Order Refunded', 'Your order #GT-1 has been refunded. $ USD has been added to your wallet.')
+        )
+
+    def test_unknown_template_falls_back_to_stored_text(self):
+        notification = Notification(user=self.user, title='Stored', message='Text', template_key='removed_key')
+        self.assertIsNone(catalog.render('removed_key', {}))
+        self.assertEqual(notification.render('vi'), ('Stored', 'Text'))
+
+    def test_api_renders_in_the_request_locale(self):
+        with mock.patch.object(realtime, '_send'):
+            NotificationService.notify_order_refunded(self.user, 'GT-1', '5')
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        response = client.get(reverse('notification-list'), HTTP_ACCEPT_LANGUAGE='vi-VN,vi;q=0.9')
+
+        item = response.data['results'][0]
+        self.assertEqual(item['title'], 'Đơn hàng đã hoàn tiền')
+        self.assertIn('5 USD', item['message'])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class UnreadCounterTests(TestCase):
+    """Cached unread counts: rebuilt from the table on a miss, adjusted after commit"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader', email='reader@example.com', password='pass12345')
+        User.objects.filter(pk=cls.user.pk).update(date_joined=timezone.now() - timedelta(days=1))
+        cls.user.refresh_from_db()
+        for i in range(2):
+            Notification.objects.create(user=cls.user, title=f'Note {i}', message='Hi')
+        cls.broadcast = Broadcast.objects.create(title='Maintenance', message='Tonight')
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(realtime, '_send')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def unread(self):
+        return counters.get_unread_count(self.user)
+
+    def test_count_is_built_once_then_read_from_the_cache(self):
+        self.assertEqual(self.unread(), 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.unread(), 3)
+
+    def test_new_notification_adjusts_the_counter_after_commit(self):
+        self.unread()
+        with self.captureOnCommitCallbacks(execute=True):
+            NotificationService.create_notification(self.user, title='New', message='Hi')
+            self.assertEqual(self.unread(), 3)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.unread(), 4)
+
+    def test_rolled_back_change_leaves_the_counter_alone(self):
+        self.unread()
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    NotificationService.create_notification(self.user, title='New', message='Hi')
+                    raise RuntimeError('request failed')
+
+        self.assertEqual(self.unread(), 3)
+
+    def test_missing_or_negative_counter_is_rebuilt_on_read(self):
+        # Adjusting a counter nobody cached does not create it
+        counters._apply(self.user.pk, 5)
+        self.assertIsNone(cache.get(counters._unread_key(self.user.pk)))
+
+        self.unread()
+        counters._apply(self.user.pk, -3)
+        self.assertIsNone(cache.get(counters._unread_key(self.user.pk)))
+        self.assertEqual(self.unread(), 3)
+
+    def test_broadcast_changes_reach_every_counter(self):
+        self.unread()
+        with self.captureOnCommitCallbacks(execute=True):
+            Broadcast.objects.create(title='Sale', message='Tomorrow')
+        self.assertEqual(self.unread(), 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            NotificationService.mark_as_read(self.user, [-self.broadcast.pk])
+        self.assertEqual(self.unread(), 3)
+
+    def test_reconcile_rewrites_drifted_counters(self):
+        cache.set(counters._unread_key(self.user.pk), 99)
+
+        self.assertEqual(reconcile_unread_counters(), {'reconciled': 1})
+
+        self.assertEqual(self.unread(), 3)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PreferenceMaskTests(TestCase):
+    """Opt-in checks read a cached bitmask that follows every saved preference"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(username=f'user{i}', email=f'user{i}@example.com', password='pass12345')
+            for i in range(3)
+        ]
+        NotificationPreference.objects.filter(user=cls.users[0]).update(order_enabled=False, telegram_enabled=True)
+        # Users without a preferences row get the defaults
+        NotificationPreference.objects.filter(user=cls.users[2]).delete()
+
+    def setUp(self):
+        cache.clear()
+
+    def ids(self):
+        return [user.pk for user in self.users]
+
+    def test_mask_matches_the_fields(self):
+        self.assertEqual(preferences.to_mask(NotificationPreference()), preferences.DEFAULT_MASK)
+        mask = preferences.to_mask(NotificationPreference.objects.get(user=self.users[0]))
+        self.assertEqual(mask, preferences.DEFAULT_MASK & ~preferences.ORDER | preferences.TELEGRAM)
+
+    def test_masks_cost_one_query_then_none(self):
+        with self.assertNumQueries(1):
+            masks = preferences.get_masks(self.ids())
+        self.assertEqual(masks, {
+            self.users[0].pk: preferences.DEFAULT_MASK & ~preferences.ORDER | preferences.TELEGRAM,
+            self.users[1].pk: preferences.DEFAULT_MASK,
+            self.users[2].pk: preferences.DEFAULT_MASK,
+        })
+
+        with self.assertNumQueries(0):
+            self.assertEqual(preferences.enabled_user_ids(self.ids(), 'ORDER'), {self.users[1].pk, self.users[2].pk})
+            self.assertFalse(preferences.is_enabled(self.users[0].pk, 'ORDER'))
+            self.assertTrue(preferences.is_enabled(self.users[0].pk, 'DEPOSIT'))
+            # Types without a preference are always sent
+            self.assertTrue(preferences.is_enabled(self.users[0].pk, 'PROMO'))
+            self.assertEqual(preferences.enabled_user_ids(self.ids(), 'PROMO'), set(self.ids()))
+
+    def test_saved_preference_replaces_the_mask_after_commit(self):
+        user = self.users[1]
+        self.assertTrue(preferences.is_enabled(user.pk, 'SYSTEM'))
+        preference = NotificationPreference.objects.get(user=user)
+        preference.system_enabled = False
+
+        with self.captureOnCommitCallbacks(execute=True):
+            preference.save()
+            self.assertTrue(preferences.is_enabled(user.pk, 'SYSTEM'))
+
+        with self.assertNumQueries(0):
+            self.assertFalse(preferences.is_enabled(user.pk, 'SYSTEM'))
+
+    def test_rolled_back_save_keeps_the_mask(self):
+        user = self.users[1]
+        preferences.get_mask(user.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    preference = NotificationPreference.objects.get(user=user)
+                    preference.order_enabled = False
+                    preference.save()
+                    raise RuntimeError('form failed')
+
+        self.assertTrue(preferences.is_enabled(user.pk, 'ORDER'))
+
+    def test_deleted_preference_falls_back_to_the_defaults(self):
+        user = self.users[0]
+        self.assertFalse(preferences.is_enabled(user.pk, 'ORDER'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            NotificationPreference.objects.get(user=user).delete()
+
+        self.assertEqual(preferences.get_mask(user.pk), preferences.DEFAULT_MASK)
+
+    def test_disabled_type_creates_no_notification(self):
+        with mock.patch.object(realtime, '_send'):
+            for user in self.users[:2]:
+                NotificationService.create_notification(user, title='Order', notification_type='ORDER')
+        self.assertEqual(list(Notification.objects.values_list('user', flat=True)), [self.users[1].pk])
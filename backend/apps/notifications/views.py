@@ -2,8 +2,9 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Q
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 
+from . import counters, feed, realtime
 from .models import Notification, NotificationPreference
 from .serializers import (
     NotificationSerializer,
@@ -12,9 +13,10 @@ from .serializers import (
     UnreadCountSerializer
 )
 from .services import NotificationService
+from apps.core.mixins import SparseFieldsetsViewMixin
 
 
-class NotificationViewSet(viewsets.ModelViewSet):
+class NotificationViewSet(SparseFieldsetsViewMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing user notifications.
 
@@ -26,6 +28,10 @@ class NotificationViewSet(viewsets.ModelViewSet):
     mark_all_read: Mark all notifications as read
     recent: Get recent notifications for dropdown
     preferences: Get/update notification preferences
+    stream_ticket: Get a ticket for the realtime stream
+
+    Broadcasts appear in list/recent/important with negative ids; deleting
+    one dismisses it for the current user only.
     """
 
     serializer_class = NotificationSerializer
@@ -42,10 +48,44 @@ class NotificationViewSet(viewsets.ModelViewSet):
 
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        """Notifications merged with broadcasts, newest first"""
+        notifications = NotificationService.get_feed(
+            request.user,
+            notification_type=request.query_params.get('notification_type')
+        )
+
+        page = self.paginate_queryset(notifications)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = self.get_serializer(notifications, many=True)
+        return Response(serializer.data)
+
+    def get_object(self):
+        try:
+            instance = feed.get_item(self.request.user, self.kwargs[self.lookup_field])
+        except ValueError:
+            instance = None
+        if instance is None:
+            raise Http404
+        return instance
+
+    def perform_update(self, serializer):
+        if serializer.instance.pk > 0:
+            was_read = serializer.instance.is_read
+            instance = serializer.save()
+            if instance.is_read != was_read:
+                counters.adjust(instance.user_id, -1 if instance.is_read else 1)
+        elif serializer.validated_data.get('is_read'):
+            # Broadcasts only track read state per user
+            NotificationService.mark_as_read(self.request.user, [serializer.instance.pk])
+            serializer.instance.is_read = True
+
     def perform_destroy(self, instance):
         """Only allow users to delete their own notifications"""
-        if instance.user == self.request.user:
-            instance.delete()
+        NotificationService.delete_notification(self.request.user, instance.pk)
 
     @action(detail=False, methods=['get'])
     def unread_count(self, request):
@@ -97,10 +137,38 @@ class NotificationViewSet(viewsets.ModelViewSet):
         """
         GET /api/notifications/recent/
         Get recent notifications for dropdown (default 10)
+
+        GET /api/notifications/recent/?since=<cursor>
+        Only notifications created or updated after cursor (default 50),
+        oldest change first. Pass the returned cursor on the next call;
+        repeat right away while has_more is true.
         """
-        limit = int(request.query_params.get('limit', 10))
+        since = request.query_params.get('since')
+        limit = int(request.query_params.get('limit', 50 if since else 10))
         limit = min(limit, 50)  # Max 50
 
+        if since:
+            try:
+                notifications, cursor, has_more = NotificationService.get_changes(
+                    request.user,
+                    since,
+                    limit=limit
+                )
+            except ValueError:
+                return Response(
+                    {'detail': 'Invalid cursor.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            serializer = self.get_serializer(notifications, many=True)
+            return Response({
+                'results': serializer.data,
+                'cursor': cursor,
+                'has_more': has_more,
+                'unread_count': NotificationService.get_unread_count(request.user)
+            })
+
+        # Taken first so nothing saved while the page is read is skipped
+        cursor = NotificationService.get_sync_cursor(request.user)
         notifications = NotificationService.get_recent_notifications(
             request.user,
             limit=limit
@@ -109,6 +177,7 @@ class NotificationViewSet(viewsets.ModelViewSet):
 
         return Response({
             'results': serializer.data,
+            'cursor': cursor,
             'unread_count': NotificationService.get_unread_count(request.user)
         })
 
@@ -118,15 +187,23 @@ class NotificationViewSet(viewsets.ModelViewSet):
         GET /api/notifications/important/
         Get unread important notifications (for toast display)
         """
-        notifications = Notification.objects.filter(
-            user=request.user,
-            is_read=False,
-            is_important=True
+        notifications = NotificationService.get_feed(
+            request.user,
+            unread=True,
+            important=True
         )[:5]
 
         serializer = self.get_serializer(notifications, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['post'])
+    def stream_ticket(self, request):
+        """
+        POST /api/notifications/stream_ticket/
+        Short-lived ticket for GET /api/notifications/stream/?ticket=...
+        """
+        return Response({'ticket': realtime.issue_ticket(request.user)})
+
     @action(detail=False, methods=['get', 'put', 'patch'])
     def preferences(self, request):
         """
@@ -150,3 +227,22 @@ class NotificationViewSet(viewsets.ModelViewSet):
         serializer.save()
 
         return Response(serializer.data)
+
+
+async def notification_stream(request):
+    """
+    GET /api/notifications/stream/?ticket=...
+    Server-Sent Events: notification, broadcast and order_status events
+    for the ticket's user. Served by the ASGI app.
+    """
+    user_id = await realtime.aresolve_ticket(request.GET.get('ticket'))
+    if user_id is None:
+        return JsonResponse({'detail': 'Invalid or expired stream ticket.'}, status=401)
+
+    response = StreamingHttpResponse(
+        realtime.event_stream(user_id),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -3,7 +3,8 @@ from django.utils import timezone
 from django.utils.html import format_html
 from django.db import transaction
 from .models import Order, OrderStatusLog, OrderAttachment
-from apps.wallets.models import WalletTransaction
+from apps.wallets.services import WalletLedger
+from .services import OrderStateMachine, OrderTransitionError
 
 
 class OrderStatusLogInline(admin.TabularInline):
@@ -80,94 +81,100 @@ class OrderAdmin(admin.ModelAdmin):
 
     def mark_as_processing(self, request, queryset):
         """Mark orders as processing"""
+        updated = 0
         for order in queryset.filter(status='paid'):
-            old_status = order.status
-            order.status = 'processing'
-            order.processed_by = request.user
-            order.save()
-
-            OrderStatusLog.objects.create(
-                order=order,
-                old_status=old_status,
-                new_status='processing',
-                changed_by=request.user,
-                note='Admin bắt đầu xử lý đơn hàng'
-            )
-
-        self.message_user(request, f'{queryset.count()} đơn hàng đã chuyển sang đang xử lý')
+            try:
+                OrderStateMachine.transition(
+                    order,
+                    'processing',
+                    expected='paid',
+                    changed_by=request.user,
+                    note='Admin bắt đầu xử lý đơn hàng',
+                    processed_by=request.user
+                )
+                updated += 1
+            except OrderTransitionError:
+                # Status changed meanwhile
+                continue
+
+        self.message_user(request, f'{updated} đơn hàng đã chuyển sang đang xử lý')
 
     mark_as_processing.short_description = 'Đánh dấu là đang xử lý'
 
     def mark_as_completed(self, request, queryset):
         """Mark orders as completed"""
+        updated = 0
         for order in queryset.filter(status='processing'):
-            old_status = order.status
-            order.status = 'completed'
-            order.processed_by = request.user
-            order.completed_at = timezone.now()
-            order.save()
-
-            OrderStatusLog.objects.create(
-                order=order,
-                old_status=old_status,
-                new_status='completed',
-                changed_by=request.user,
-                note='Admin hoàn thành đơn hàng'
-            )
-
-        self.message_user(request, f'{queryset.count()} đơn hàng đã hoàn thành')
+            try:
+                OrderStateMachine.transition(
+                    order,
+                    'completed',
+                    expected='processing',
+                    changed_by=request.user,
+                    note='Admin hoàn thành đơn hàng',
+                    processed_by=request.user,
+                    completed_at=timezone.now()
+                )
+                updated += 1
+            except OrderTransitionError:
+                continue
+
+        self.message_user(request, f'{updated} đơn hàng đã hoàn thành')
 
     mark_as_completed.short_description = 'Đánh dấu là hoàn thành'
 
-    @transaction.atomic
     def mark_as_canceled(self, request, queryset):
         """Mark orders as canceled with refund for paid orders"""
         canceled_count = 0
         refunded_count = 0
         refunded_total = 0
 
-        for order in queryset.exclude(status__in=['completed', 'canceled', 'refunded']):
+        for order in queryset.exclude(status__in=['completed', 'canceled', 'refunded']).select_related('user'):
             old_status = order.status
             refund_note = ''
 
-            # Refund if order was paid (both wallet and crypto payments deduct from wallet)
-            if old_status == 'paid' and order.payment_method in ['wallet', 'crypto']:
-                try:
-                    wallet = order.user.wallet
-                    balance_before = wallet.balance
-                    wallet.add_balance(order.price)
-
-                    # Create refund transaction
-                    WalletTransaction.objects.create(
-                        user=order.user,
-                        transaction_type='refund',
-                        amount=order.price,
-                        balance_before=balance_before,
-                        balance_after=wallet.balance,
-                        description=f'Refund for canceled order {order.order_id} (Admin)',
-                        reference_id=str(order.order_id)
-                    )
-                    refunded_count += 1
-                    refunded_total += float(order.price)
-                    refund_note = f' - Hoàn tiền ${order.price} vào ví'
-                except Exception as e:
-                    self.message_user(
-                        request,
-                        f'Lỗi hoàn tiền cho đơn {order.order_id}: {str(e)}',
-                        level='error'
+            try:
+                # Refund and status change commit together, or not at all
+                with transaction.atomic():
+                    # Refund if order was paid (both wallet and crypto payments deduct from wallet)
+                    if old_status == 'paid' and order.payment_method in ['wallet', 'crypto']:
+                        # Credit wallet and create refund transaction; an order
+                        # already refunded is not credited twice (unique reference)
+                        refund = WalletLedger.credit(
+                            order.user,
+                            order.price,
+                            'refund',
+                            f'Refund for canceled order {order.order_id} (Admin)',
+                            reference_id=str(order.order_id)
+                        )
+                        if refund.applied:
+                            refund_note = f' - Hoàn tiền ${order.price} vào ví'
+
+                    OrderStateMachine.transition(
+                        order,
+                        'canceled',
+                        expected=old_status,
+                        changed_by=request.user,
+                        note=f'Admin hủy đơn hàng{refund_note}'
                     )
-                    continue
-
-            order.status = 'canceled'
-            order.save()
-
-            OrderStatusLog.objects.create(
-                order=order,
-                old_status=old_status,
-                new_status='canceled',
-                changed_by=request.user,
-                note=f'Admin hủy đơn hàng{refund_note}'
-            )
+            except OrderTransitionError as e:
+                self.message_user(
+                    request,
+                    f'Không thể hủy đơn {order.order_id}: {str(e)}',
+                    level='error'
+                )
+                continue
+            except Exception as e:
+                self.message_user(
+                    request,
+                    f'Lỗi hoàn tiền cho đơn {order.order_id}: {str(e)}',
+                    level='error'
+                )
+                continue
+
+            if refund_note:
+                refunded_count += 1
+                refunded_total += float(order.price)
             canceled_count += 1
 
         message = f'{canceled_count} đơn hàng đã bị hủy'
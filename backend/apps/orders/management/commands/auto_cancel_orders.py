@@ -1,8 +1,6 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from django.db import transaction
-from datetime import timedelta
-from apps.orders.models import Order, OrderStatusLog
+from apps.orders.services import OrderAutoCancelService
 
 
 class Command(BaseCommand):
@@ -15,67 +13,61 @@ class Command(BaseCommand):
             default=12,
             help='Number of hours after which unpaid orders will be canceled (default: 12)'
         )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=None,
+            help='Number of orders canceled per transaction (default: AUTO_CANCEL_CHUNK_SIZE)'
+        )
         parser.add_argument(
             '--dry-run',
             action='store_true',
             help='Show which orders would be canceled without actually canceling them'
         )
 
-    @transaction.atomic
     def handle(self, *args, **options):
         hours = options['hours']
         dry_run = options['dry_run']
 
         # Calculate the cutoff time
-        cutoff_time = timezone.now() - timedelta(hours=hours)
+        cutoff_time = OrderAutoCancelService.get_cutoff(hours)
 
         # Find all pending_payment orders older than cutoff time
-        orders_to_cancel = Order.objects.filter(
-            status='pending_payment',
-            created_at__lt=cutoff_time
-        )
-
-        count = orders_to_cancel.count()
-
-        if count == 0:
-            self.stdout.write(
-                self.style.SUCCESS(f'No unpaid orders older than {hours} hours found.')
-            )
-            return
+        orders_to_cancel = OrderAutoCancelService.stale_orders(cutoff_time)
 
         if dry_run:
+            count = orders_to_cancel.count()
+            if count == 0:
+                self.stdout.write(
+                    self.style.SUCCESS(f'No unpaid orders older than {hours} hours found.')
+                )
+                return
+
             self.stdout.write(
                 self.style.WARNING(f'[DRY RUN] Would cancel {count} unpaid orders:')
             )
-            for order in orders_to_cancel:
-                age = timezone.now() - order.created_at
-                hours_old = age.total_seconds() / 3600
+            now = timezone.now()
+            rows = orders_to_cancel.order_by('created_at').values_list(
+                'order_id', 'user__email', 'created_at', 'price'
+            )
+            for order_id, email, created_at, price in rows.iterator(chunk_size=2000):
+                hours_old = (now - created_at).total_seconds() / 3600
                 self.stdout.write(
-                    f'  - Order {order.order_id} ({order.user.email}) - '
-                    f'Created {hours_old:.1f} hours ago - ${order.price}'
+                    f'  - Order {order_id} ({email}) - '
+                    f'Created {hours_old:.1f} hours ago - ${price}'
                 )
             return
 
-        # Cancel the orders
-        canceled_count = 0
-        for order in orders_to_cancel:
-            old_status = order.status
-            order.status = 'canceled'
-            order.save()
-
-            # Create status log
-            OrderStatusLog.objects.create(
-                order=order,
-                old_status=old_status,
-                new_status='canceled',
-                changed_by=None,  # System action
-                note=f'Auto-canceled: Order not paid within {hours} hours'
-            )
+        canceled_count = OrderAutoCancelService.cancel_unpaid_orders(
+            hours=hours,
+            chunk_size=options['chunk_size']
+        )
 
-            canceled_count += 1
+        if canceled_count == 0:
             self.stdout.write(
-                f'Canceled order {order.order_id} ({order.user.email})'
+                self.style.SUCCESS(f'No unpaid orders older than {hours} hours found.')
             )
+            return
 
         self.stdout.write(
             self.style.SUCCESS(
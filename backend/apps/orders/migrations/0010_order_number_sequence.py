@@ -0,0 +1,65 @@
+# Generated by Django 5.0 on 2026-10-16 21:00
+
+import re
+
+from django.db import migrations, models
+
+# Frozen copies of apps.orders.numbering as of this migration
+ORDER_NUMBER_SEQUENCE = 'orders_order_number_seq'
+ORDER_ID_PATTERN = re.compile(r'^GT-(\d+)$')
+
+
+def last_order_number(order_model):
+    """Highest GT-XXXXXX number already used (0 if none)"""
+    last = 0
+    for order_id in order_model.objects.filter(order_id__startswith='GT-').values_list('order_id', flat=True):
+        match = ORDER_ID_PATTERN.match(order_id)
+        if match:
+            last = max(last, int(match.group(1)))
+    return last
+
+
+def seed_order_number_counter(apps, schema_editor):
+    """Start numbering after the highest existing GT-XXXXXX order"""
+    Order = apps.get_model('orders', 'Order')
+    OrderNumberSequence = apps.get_model('orders', 'OrderNumberSequence')
+
+    next_number = last_order_number(Order) + 1
+
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE SEQUENCE IF NOT EXISTS {ORDER_NUMBER_SEQUENCE} START WITH {next_number}'
+        )
+    else:
+        OrderNumberSequence.objects.update_or_create(
+            name='order',
+            defaults={'next_value': next_number}
+        )
+
+
+def drop_order_number_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP SEQUENCE IF EXISTS {ORDER_NUMBER_SEQUENCE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_remove_order_server_alter_order_package_in_game_unit_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderNumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Tên')),
+                ('next_value', models.BigIntegerField(default=1, verbose_name='Giá trị tiếp theo')),
+            ],
+            options={
+                'verbose_name': 'Bộ đếm mã đơn hàng',
+                'verbose_name_plural': 'Bộ đếm mã đơn hàng',
+            },
+        ),
+        migrations.RunPython(seed_order_number_counter, drop_order_number_sequence),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.0 on 2026-10-16 21:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0006_game_introduction'),
+        ('orders', '0010_order_number_sequence'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status', 'pending_payment')), fields=['created_at'], name='order_pending_payment_idx'),
+        ),
+    ]
@@ -1,14 +1,15 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
-from apps.core.models import TimeStampedModel
+from apps.core.models import ChangeTrackingMixin, TimeStampedModel
 from apps.games.models import Game, GamePackage
-from django.db import transaction
 
 User = get_user_model()
 
 
-class Order(TimeStampedModel):
+class Order(ChangeTrackingMixin, TimeStampedModel):
     """Model for orders"""
+    tracked_fields = ('status',)
+
     STATUS_CHOICES = [
         ('pending_payment', 'Chờ thanh toán'),
         ('paid', 'Đã thanh toán'),
@@ -80,6 +81,12 @@ class Order(TimeStampedModel):
             models.Index(fields=['-created_at']),
             models.Index(fields=['status']),
             models.Index(fields=['user', '-created_at']),
+            # Auto-cancel scan: only unpaid orders are indexed
+            models.Index(
+                fields=['created_at'],
+                condition=models.Q(status='pending_payment'),
+                name='order_pending_payment_idx'
+            ),
         ]
 
     def __str__(self):
@@ -94,28 +101,34 @@ class Order(TimeStampedModel):
         """Override save to generate order_id"""
         if not self.order_id:
             self.order_id = self._generate_order_id()
-        super().save(*args, **kwargs)
+        # Outbox events written by post_save commit together with the row
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     @classmethod
     def _generate_order_id(cls):
         """Generate unique order ID in format GT-XXXXXX"""
-        with transaction.atomic():
-            # Get last order ID
-            last_order = cls.objects.select_for_update().order_by('-id').first()
-
-            if last_order and last_order.order_id.startswith('GT-'):
-                # Extract number from last order_id
-                try:
-                    last_number = int(last_order.order_id.split('-')[1])
-                    next_number = last_number + 1
-                except (IndexError, ValueError):
-                    next_number = 1
-            else:
-                # First order or migrating from UUID
-                next_number = 1
-
-            # Format: GT-000001
-            return f"GT-{next_number:06d}"
+        from .numbering import order_number_allocator
+
+        # Format: GT-000001
+        return f"GT-{order_number_allocator.next_number():06d}"
+
+
+class OrderNumberSequence(models.Model):
+    """
+    Counter for hi-lo order number allocation.
+    Only used on databases without native sequences (SQLite); PostgreSQL
+    uses the orders_order_number_seq sequence instead.
+    """
+    name = models.CharField(max_length=50, unique=True, verbose_name='Tên')
+    next_value = models.BigIntegerField(default=1, verbose_name='Giá trị tiếp theo')
+
+    class Meta:
+        verbose_name = 'Bộ đếm mã đơn hàng'
+        verbose_name_plural = 'Bộ đếm mã đơn hàng'
+
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
 
 
 class OrderStatusLog(TimeStampedModel):
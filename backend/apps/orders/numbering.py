@@ -0,0 +1,108 @@
+"""
+Order number allocation
+
+PostgreSQL: numbers come from the orders_order_number_seq sequence, so each
+order costs one nextval() and never waits on another checkout.
+
+Other databases (SQLite in development): hi-lo allocation. Each process
+reserves a block of ORDER_NUMBER_BLOCK_SIZE numbers with one UPDATE on the
+OrderNumberSequence row and hands them out from memory. A block reserved
+inside a transaction is only kept once that transaction commits, since a
+rollback undoes the UPDATE. Numbers stay unique but are not strictly
+increasing across processes, and a restarted process leaves a gap of at
+most one block.
+"""
+import os
+import re
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+
+ORDER_NUMBER_SEQUENCE = 'orders_order_number_seq'
+ORDER_ID_PATTERN = re.compile(r'^GT-(\d+)$')
+
+
+def last_order_number(order_model):
+    """Highest GT-XXXXXX number already used (0 if none)"""
+    last = 0
+    for order_id in order_model.objects.filter(order_id__startswith='GT-').values_list('order_id', flat=True):
+        match = ORDER_ID_PATTERN.match(order_id)
+        if match:
+            last = max(last, int(match.group(1)))
+    return last
+
+
+class OrderNumberAllocator:
+    """Hands out order numbers; one shared instance per process"""
+
+    def __init__(self, name='order', block_size=None):
+        self.name = name
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = 0
+        self._limit = 0
+        self._pid = None
+
+    def next_number(self):
+        """Return the next unused order number"""
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT nextval(%s)', [ORDER_NUMBER_SEQUENCE])
+                return cursor.fetchone()[0]
+
+        with self._lock:
+            # A block reserved before fork() must not be reused by the children
+            if self._pid == os.getpid() and self._next < self._limit:
+                number = self._next
+                self._next += 1
+                return number
+
+        start, limit = self._reserve_block()
+        if connection.in_atomic_block:
+            # The reservation rolls back with the caller's transaction, and then
+            # another process gets the same block: only keep it once committed
+            transaction.on_commit(lambda: self._adopt(start + 1, limit))
+        else:
+            self._adopt(start + 1, limit)
+        return start
+
+    def _adopt(self, next_value, limit):
+        """Hand out the rest of a committed block from memory"""
+        with self._lock:
+            self._next = next_value
+            self._limit = limit
+            self._pid = os.getpid()
+
+    def _reserve_block(self):
+        """
+        Reserve block_size numbers on the counter row.
+
+        Returns:
+            tuple: (first number, end of the block (exclusive))
+        """
+        from .models import Order, OrderNumberSequence
+
+        block_size = self.block_size or getattr(settings, 'ORDER_NUMBER_BLOCK_SIZE', 20)
+        with transaction.atomic():
+            updated = OrderNumberSequence.objects.filter(name=self.name).update(
+                next_value=F('next_value') + block_size
+            )
+            if not updated:
+                # Counter row missing (e.g. flushed database): seed from existing orders
+                OrderNumberSequence.objects.get_or_create(
+                    name=self.name,
+                    defaults={'next_value': last_order_number(Order) + 1}
+                )
+                OrderNumberSequence.objects.filter(name=self.name).update(
+                    next_value=F('next_value') + block_size
+                )
+            limit = OrderNumberSequence.objects.filter(name=self.name).values_list(
+                'next_value', flat=True
+            ).get()
+
+        return limit - block_size, limit
+
+
+order_number_allocator = OrderNumberAllocator()
@@ -2,6 +2,7 @@ from rest_framework import serializers
 from django.conf import settings
 from .models import Order, OrderStatusLog, OrderAttachment
 from apps.games.serializers import GameListSerializer
+from apps.core.serializers import SparseFieldsetsMixin
 
 
 class OrderCreateSerializer(serializers.ModelSerializer):
@@ -86,22 +87,29 @@ class OrderStatusLogSerializer(serializers.ModelSerializer):
         fields = ['id', 'old_status', 'new_status', 'changed_by_email', 'note', 'created_at']
 
 
-class OrderSerializer(serializers.ModelSerializer):
-    """Serializer for Order"""
+class OrderListSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
+    """
+    Summary serializer for order lists: joined game fields, no status history.
+    The view must select_related('game', 'game_package') to stay at one query per page.
+    """
     game_name = serializers.CharField(source='game.name', read_only=True)
     game_image = serializers.ImageField(source='game.image', read_only=True)
     package_info = serializers.SerializerMethodField()
-    status_logs = OrderStatusLogSerializer(many=True, read_only=True)
 
     class Meta:
         model = Order
         fields = ['id', 'order_id', 'game_name', 'game_image', 'package_info',
-                  'game_uid', 'game_username', 'character_name',
-                  'amount', 'price', 'payment_method', 'status',
-                  'customer_note', 'admin_note', 'created_at', 'completed_at',
-                  'status_logs']
-        read_only_fields = ['id', 'order_id', 'price', 'status',
-                           'admin_note', 'created_at', 'completed_at']
+                  'game_uid', 'character_name', 'amount', 'price', 'payment_method',
+                  'status', 'created_at', 'completed_at']
+        read_only_fields = fields
+        field_sources = {
+            'package_info': (
+                'package_name_snapshot', 'package_type_snapshot',
+                'package_in_game_amount', 'package_in_game_unit',
+                'game_package__name', 'game_package__package_type',
+                'game_package__in_game_amount', 'game_package__in_game_unit_label',
+            ),
+        }
 
     def get_package_info(self, obj):
         """Get package information (from snapshot if available, else from package)"""
@@ -128,6 +136,22 @@ class OrderSerializer(serializers.ModelSerializer):
             return None
 
 
+class OrderSerializer(OrderListSerializer):
+    """Serializer for Order (detail, with status history)"""
+    status_logs = OrderStatusLogSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ['id', 'order_id', 'game_name', 'game_image', 'package_info',
+                  'game_uid', 'game_username', 'character_name',
+                  'amount', 'price', 'payment_method', 'status',
+                  'customer_note', 'admin_note', 'created_at', 'completed_at',
+                  'status_logs']
+        read_only_fields = ['id', 'order_id', 'price', 'status',
+                           'admin_note', 'created_at', 'completed_at']
+        field_sources = OrderListSerializer.Meta.field_sources
+
+
 class OrderPaymentSerializer(serializers.Serializer):
     """Serializer for order payment"""
     payment_method = serializers.ChoiceField(choices=['wallet', 'crypto'])
@@ -153,6 +177,17 @@ class OrderAttachmentSerializer(serializers.ModelSerializer):
         return None
 
 
+class OrderStaffListSerializer(OrderListSerializer):
+    """Summary serializer for the staff order list"""
+    user_email = serializers.CharField(source='user.email', read_only=True)
+
+    class Meta(OrderListSerializer.Meta):
+        fields = ['id', 'order_id', 'user_email', 'game_name', 'game_image', 'package_info',
+                  'game_uid', 'character_name', 'amount', 'price', 'payment_method',
+                  'status', 'created_at', 'completed_at']
+        read_only_fields = fields
+
+
 class OrderStaffSerializer(serializers.ModelSerializer):
     """Serializer for staff to view/manage orders"""
     game_name = serializers.CharField(source='game.name', read_only=True)
@@ -0,0 +1,264 @@
+"""
+Order Services
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from apps.core import outbox
+from apps.wallets.services import WalletLedger
+from .models import Order, OrderStatusLog
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class OrderTransitionError(Exception):
+    """Raised when an order cannot move to the requested status"""
+
+
+class OrderStatusConflict(OrderTransitionError):
+    """Raised when the order left the expected status before the update ran"""
+
+
+class OrderStateMachine:
+    """
+    Single entry point for order status changes.
+
+    A transition is one conditional UPDATE (``WHERE status = expected``) plus
+    the OrderStatusLog row and the order.status_changed outbox event, in one
+    transaction. No row lock is held while Python code runs: if another
+    request moved the order first, the UPDATE matches nothing and
+    OrderStatusConflict is raised instead of overwriting that change.
+    """
+
+    TRANSITIONS = {
+        'pending_payment': ('paid', 'canceled'),
+        'paid': ('processing', 'completed', 'canceled', 'refunded'),
+        'processing': ('completed', 'canceled', 'refunded'),
+        'completed': ('refunded',),
+        'canceled': ('refunded',),
+        'refunded': (),
+    }
+
+    @staticmethod
+    def can_transition(old_status, new_status):
+        """Check if new_status is reachable from old_status"""
+        return new_status in OrderStateMachine.TRANSITIONS.get(old_status, ())
+
+    @staticmethod
+    def transition(order, new_status, expected=None, changed_by=None, note='', **values):
+        """
+        Move order from `expected` (default: its loaded status) to new_status.
+        Extra keyword arguments are column values written by the same UPDATE.
+
+        Returns:
+            Order: the same instance, updated in memory
+
+        Raises:
+            OrderTransitionError: the transition is not allowed
+            OrderStatusConflict: the order is no longer in the expected status
+        """
+        expected = expected or order.status
+        if not OrderStateMachine.can_transition(expected, new_status):
+            raise OrderTransitionError(
+                f'Order {order.order_id} cannot change from {expected} to {new_status}'
+            )
+
+        now = timezone.now()
+        with transaction.atomic():
+            updated = Order.objects.filter(pk=order.pk, status=expected).update(
+                status=new_status,
+                updated_at=now,
+                **values
+            )
+            if not updated:
+                raise OrderStatusConflict(
+                    f'Order {order.order_id} is no longer {expected}'
+                )
+
+            OrderStatusLog.objects.create(
+                order_id=order.pk,
+                old_status=expected,
+                new_status=new_status,
+                changed_by=changed_by,
+                note=note
+            )
+            outbox.publish(
+                'order.status_changed',
+                order_id=order.pk,
+                old_status=expected,
+                new_status=new_status
+            )
+
+        order.status = new_status
+        order.updated_at = now
+        for field, value in values.items():
+            setattr(order, field, value)
+        # The row now matches the instance; a later save() must not re-publish
+        order._snapshot_tracked_fields()
+        return order
+
+    @staticmethod
+    def pay_from_wallet(order, payment_method, description, changed_by=None, note=''):
+        """
+        Debit the order total from the owner's wallet and mark the order paid.
+        The debit is rolled back if the order is no longer pending_payment.
+
+        Returns:
+            WalletTransaction, or None if the balance is insufficient
+
+        Raises:
+            OrderStatusConflict: the order was paid or canceled meanwhile
+        """
+        with transaction.atomic():
+            payment = WalletLedger.debit(
+                order.user,
+                order.total_amount,
+                'payment',
+                description,
+                reference_id=str(order.order_id)
+            )
+            if payment is None:
+                return None
+            if not payment.applied:
+                # The order's payment entry exists already (unique reference)
+                raise OrderStatusConflict(f'Order {order.order_id} is already paid')
+
+            OrderStateMachine.transition(
+                order,
+                'paid',
+                expected='pending_payment',
+                changed_by=changed_by,
+                note=note,
+                payment_method=payment_method
+            )
+        return payment
+
+
+class OrderAutoCancelService:
+    """
+    Cancel orders that stayed in pending_payment past the payment window.
+
+    Works in chunks of AUTO_CANCEL_CHUNK_SIZE orders. Each chunk is its own
+    transaction: one conditional UPDATE (only rows still pending_payment, so
+    an order paid meanwhile is left alone), then one bulk INSERT each of
+    status logs, order.status_changed outbox events and notifications. A
+    large backlog therefore never holds long locks or loads every order into
+    memory.
+    """
+
+    @staticmethod
+    def get_cutoff(hours=None):
+        """Orders created before this moment are considered unpaid"""
+        hours = hours or getattr(settings, 'AUTO_CANCEL_UNPAID_HOURS', 12)
+        return timezone.now() - timedelta(hours=hours)
+
+    @staticmethod
+    def stale_orders(cutoff):
+        """pending_payment orders created before cutoff (served by the partial index)"""
+        return Order.objects.filter(status='pending_payment', created_at__lt=cutoff)
+
+    @staticmethod
+    def cancel_unpaid_orders(hours=None, chunk_size=None, max_chunks=None, note=None):
+        """
+        Cancel stale unpaid orders chunk by chunk.
+
+        Returns:
+            int: number of orders canceled
+        """
+        hours = hours or getattr(settings, 'AUTO_CANCEL_UNPAID_HOURS', 12)
+        chunk_size = chunk_size or getattr(settings, 'AUTO_CANCEL_CHUNK_SIZE', 500)
+        cutoff = OrderAutoCancelService.get_cutoff(hours)
+        note = note or f'Auto-canceled: Order not paid within {hours} hours'
+
+        total = 0
+        chunks = 0
+        while max_chunks is None or chunks < max_chunks:
+            # Fewer cancellations than selected rows (locked or paid meanwhile)
+            # does not mean the backlog is done; only an empty selection does
+            selected, canceled = OrderAutoCancelService._cancel_chunk(cutoff, chunk_size, note)
+            if not selected:
+                break
+            chunks += 1
+            total += canceled
+
+        return total
+
+    @staticmethod
+    def _cancel_chunk(cutoff, chunk_size, note):
+        """
+        Cancel up to chunk_size orders in one transaction.
+
+        Returns:
+            tuple: (orders selected, orders canceled)
+        """
+        from apps.notifications.services import NotificationService
+
+        with transaction.atomic():
+            candidates = OrderAutoCancelService.stale_orders(cutoff).order_by('created_at', 'id')
+            if connection.features.has_select_for_update_skip_locked:
+                # Orders being paid right now are skipped instead of waited on
+                candidates = candidates.select_for_update(skip_locked=True)
+            ids = list(candidates.values_list('id', flat=True)[:chunk_size])
+            if not ids:
+                return 0, 0
+
+            orders = OrderAutoCancelService._cancel_rows(ids)
+            if not orders:
+                return len(ids), 0
+
+            OrderStatusLog.objects.bulk_create([
+                OrderStatusLog(
+                    order_id=order.id,
+                    old_status='pending_payment',
+                    new_status='canceled',
+                    changed_by=None,  # System action
+                    note=note
+                )
+                for order in orders
+            ])
+            outbox.publish_many([
+                ('order.status_changed', {
+                    'order_id': order.id,
+                    'old_status': 'pending_payment',
+                    'new_status': 'canceled',
+                    'notified': True,  # the bulk notification below covers it
+                })
+                for order in orders
+            ])
+            NotificationService.notify_orders_cancelled(orders, reason=note)
+
+        return len(ids), len(orders)
+
+    @staticmethod
+    def _cancel_rows(ids):
+        """
+        Cancel the given orders that are still pending_payment.
+
+        Returns the orders this UPDATE canceled (id, order_id and user_id
+        only), taken from the UPDATE itself: an order paid or canceled by
+        someone else in the meantime is never reported as ours.
+        """
+        now = timezone.now()
+        if not connection.features.can_return_columns_from_insert:
+            # No UPDATE ... RETURNING (MySQL): one conditional UPDATE per order
+            canceled = [
+                order_id for order_id in ids
+                if Order.objects.filter(id=order_id, status='pending_payment').update(
+                    status='canceled', updated_at=now
+                )
+            ]
+            return list(Order.objects.filter(id__in=canceled).only('id', 'order_id', 'user_id'))
+
+        table = connection.ops.quote_name(Order._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {table} SET status = %s, updated_at = %s '
+                f"WHERE id IN ({', '.join(['%s'] * len(ids))}) AND status = %s "
+                f'RETURNING id, order_id, user_id',
+                # Raw SQL: store datetimes the way the ORM does on this backend
+                ['canceled', connection.ops.adapt_datetimefield_value(now), *ids, 'pending_payment']
+            )
+            rows = cursor.fetchall()
+        return [Order(id=pk, order_id=order_id, user_id=user_id) for pk, order_id, user_id in sorted(rows)]
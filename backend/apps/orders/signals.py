@@ -1,30 +1,37 @@
 """
 Order Signals
-Auto-refund when order is canceled
+Publish order events to the outbox; auto-refund when order is canceled
 """
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_save
 from django.dispatch import receiver
-from .models import Order, OrderStatusLog
+from apps.core import outbox
+from .models import Order
+from .services import OrderStateMachine, OrderTransitionError
 from apps.wallets.services import WalletService
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-@receiver(pre_save, sender=Order)
-def track_order_status_change(sender, instance, **kwargs):
-    """Track old status before save"""
-    if instance.pk:
-        try:
-            instance._old_status = Order.objects.get(pk=instance.pk).status
-        except Order.DoesNotExist:
-            instance._old_status = None
-    else:
-        instance._old_status = None
+@receiver(post_save, sender=Order)
+def publish_order_events(sender, instance, created, **kwargs):
+    """Write order.created / order.status_changed events in the saving transaction"""
+    if created:
+        outbox.publish('order.created', order_id=instance.pk)
+        return
 
+    old_status = instance.get_previous_value('status')
+    if old_status and old_status != instance.status:
+        outbox.publish(
+            'order.status_changed',
+            order_id=instance.pk,
+            old_status=old_status,
+            new_status=instance.status
+        )
 
-@receiver(post_save, sender=Order)
-def auto_refund_on_cancel(sender, instance, created, **kwargs):
+
+@outbox.subscriber('order.status_changed')
+def auto_refund_on_cancel(payload):
     """
     Automatically refund payment when order is canceled or refunded
 
@@ -34,17 +41,18 @@ def auto_refund_on_cancel(sender, instance, created, **kwargs):
     3. Payment transaction exists
     4. No refund transaction exists yet (idempotent)
     """
-    # Skip if this is a new order
-    if created:
-        return
-
-    # Get old status
-    old_status = getattr(instance, '_old_status', None)
+    old_status = payload['old_status']
+    new_status = payload['new_status']
 
     # Check if status changed to canceled or refunded
-    if instance.status in ['canceled', 'refunded'] and old_status != instance.status:
+    if new_status in ['canceled', 'refunded']:
+        try:
+            instance = Order.objects.select_related('user').get(pk=payload['order_id'])
+        except Order.DoesNotExist:
+            return
+
         logger.info(
-            f"Order {instance.order_id} status changed from {old_status} to {instance.status}. "
+            f"Order {instance.order_id} status changed from {old_status} to {new_status}. "
             f"Checking refund eligibility..."
         )
 
@@ -55,7 +63,7 @@ def auto_refund_on_cancel(sender, instance, created, **kwargs):
             # Perform refund
             success, message, refund_transaction = WalletService.refund_order_payment(
                 instance,
-                reason=f'Order {instance.status} by admin'
+                reason=f'Order {new_status} by admin'
             )
 
             if success and refund_transaction:
@@ -66,9 +74,17 @@ def auto_refund_on_cancel(sender, instance, created, **kwargs):
                 )
 
                 # Update order status to 'refunded' if it was 'canceled'
-                if instance.status == 'canceled':
-                    Order.objects.filter(pk=instance.pk).update(status='refunded')
-                    logger.info(f"Order {instance.order_id} status updated to 'refunded'")
+                if new_status == 'canceled':
+                    try:
+                        OrderStateMachine.transition(
+                            instance,
+                            'refunded',
+                            expected='canceled',
+                            note=f'Auto-refund ${refund_transaction.amount} to wallet'
+                        )
+                        logger.info(f"Order {instance.order_id} status updated to 'refunded'")
+                    except OrderTransitionError as e:
+                        logger.warning(f"Order {instance.order_id} not marked refunded: {e}")
 
             elif success and not refund_transaction:
                 # No refund needed (already refunded or not paid via wallet)
@@ -0,0 +1,25 @@
+from celery import shared_task
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(name='orders.auto_cancel_unpaid_orders')
+def auto_cancel_unpaid_orders(hours=None, chunk_size=None, max_chunks=None):
+    """
+    Cancel pending_payment orders older than `hours` (default AUTO_CANCEL_UNPAID_HOURS).
+
+    This task is scheduled via Celery Beat; every chunk commits on its own.
+    """
+    from .services import OrderAutoCancelService
+
+    canceled_count = OrderAutoCancelService.cancel_unpaid_orders(
+        hours=hours,
+        chunk_size=chunk_size,
+        max_chunks=max_chunks
+    )
+
+    if canceled_count:
+        logger.info(f"Auto-canceled {canceled_count} unpaid orders")
+
+    return {'canceled_count': canceled_count}
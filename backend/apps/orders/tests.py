@@ -0,0 +1,379 @@
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipIf
+
+from django.db import OperationalError, connection, transaction
+from django.test import TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from apps.core.models import OutboxEvent
+from apps.games.models import Game, GamePackage
+from apps.notifications.models import Notification
+from apps.users.models import User
+from apps.wallets.models import UserWallet, WalletTransaction
+from apps.wallets.services import WalletLedger
+from .models import Order, OrderNumberSequence, OrderStatusLog
+from .numbering import OrderNumberAllocator
+from .services import OrderAutoCancelService, OrderStateMachine, OrderStatusConflict, OrderTransitionError
+from .views import StaffOrderDetailView
+
+
+class OrderQueryBudgetTests(APITestCase):
+    """List pages cost 1 COUNT + 1 SELECT whatever ?fields= / ?omit= ask for"""
+
+    PAGE = 20
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='pass12345')
+        cls.staff = User.objects.create_user(
+            username='staff', email='staff@example.com', password='pass12345', is_staff=True
+        )
+        game = Game.objects.create(name='Game', slug='game', description='Game')
+        package = GamePackage.objects.create(game=game, name='100 Gems', in_game_amount=100)
+        cls.orders = []
+        for i in range(cls.PAGE + 5):
+            order = Order.objects.create(
+                user=cls.user, game=game, game_uid=str(i), price=Decimal('10'),
+                # Half fall back to the joined package instead of the snapshot
+                game_package=package if i % 2 else None,
+            )
+            cls.orders.append(order)
+        for order in cls.orders[:3]:
+            OrderStatusLog.objects.create(
+                order=order, old_status='pending_payment', new_status='canceled', changed_by=cls.staff
+            )
+
+    def get_page(self, user, url, params=None):
+        self.client.force_authenticate(user)
+        with self.assertNumQueries(2):
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), self.PAGE)
+        return response.data['results']
+
+    def test_order_list(self):
+        results = self.get_page(self.user, reverse('orders:order_list'))
+        self.assertIn('package_info', results[0])
+
+    def test_order_list_sparse(self):
+        results = self.get_page(self.user, reverse('orders:order_list'), {'fields': 'order_id,status,game_name'})
+        self.assertEqual(set(results[0]), {'order_id', 'status', 'game_name'})
+
+        results = self.get_page(self.user, reverse('orders:order_list'), {'omit': 'package_info,game_image'})
+        self.assertNotIn('package_info', results[0])
+
+    def test_staff_order_list(self):
+        results = self.get_page(self.staff, reverse('orders:staff_order_list'))
+        self.assertEqual(results[0]['user_email'], 'buyer@example.com')
+
+    def test_staff_order_list_sparse(self):
+        results = self.get_page(self.staff, reverse('orders:staff_order_list'), {'fields': 'order_id,user_email'})
+        self.assertEqual(set(results[0]), {'order_id', 'user_email'})
+
+        results = self.get_page(self.staff, reverse('orders:staff_order_list'), {'omit': 'user_email'})
+        self.assertNotIn('user_email', results[0])
+
+    def test_order_detail(self):
+        order = self.orders[0]
+        self.client.force_authenticate(self.user)
+        # Order with game/package/user joined, then the status logs with changed_by
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('orders:order_detail', args=[order.order_id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['status_logs']), 1)
+
+
+
+class OrderStateMachineTests(APITestCase):
+    """Transitions are conditional UPDATEs; losers of a race get a conflict"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='pass12345')
+        cls.staff = User.objects.create_user(
+            username='staff', email='staff@example.com', password='pass12345', is_staff=True
+        )
+        cls.game = Game.objects.create(name='Game', slug='game', description='Game')
+
+    def setUp(self):
+        patcher = mock.patch('apps.core.outbox.schedule_relay')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.order = Order.objects.create(user=self.user, game=self.game, game_uid='1', price=Decimal('10'))
+
+    def move_row(self, status):
+        """Another request changes the order behind the loaded instance"""
+        Order.objects.filter(pk=self.order.pk).update(status=status)
+
+    def events(self):
+        return OutboxEvent.objects.filter(event_type='order.status_changed').count()
+
+    def test_transition_writes_log_and_event(self):
+        OrderStateMachine.transition(self.order, 'canceled', changed_by=self.user)
+
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, 'canceled')
+        self.assertEqual(self.order.status, 'canceled')
+        log = OrderStatusLog.objects.get(order=self.order)
+        self.assertEqual((log.old_status, log.new_status), ('pending_payment', 'canceled'))
+        self.assertEqual(self.events(), 1)
+
+    def test_disallowed_transition_raises(self):
+        self.move_row('completed')
+        self.order.refresh_from_db()
+
+        with self.assertRaises(OrderTransitionError) as raised:
+            OrderStateMachine.transition(self.order, 'paid')
+        self.assertNotIsInstance(raised.exception, OrderStatusConflict)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, 'completed')
+        self.assertFalse(OrderStatusLog.objects.filter(order=self.order).exists())
+
+    def test_stale_expected_status_raises_conflict(self):
+        self.move_row('canceled')
+
+        with self.assertRaises(OrderStatusConflict):
+            OrderStateMachine.transition(self.order, 'paid', expected='pending_payment')
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, 'canceled')
+        self.assertFalse(OrderStatusLog.objects.filter(order=self.order).exists())
+        self.assertEqual(self.events(), 0)
+
+    def test_staff_disallowed_transition_is_400(self):
+        self.move_row('refunded')
+        self.client.force_authenticate(self.staff)
+
+        response = self.client.patch(
+            reverse('orders:staff_order_detail', args=[self.order.order_id]), {'status': 'processing'}
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('status', response.data)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, 'refunded')
+
+    def test_staff_update_of_a_stale_order_is_409(self):
+        self.client.force_authenticate(self.staff)
+        get_object = StaffOrderDetailView.get_object
+
+        def load_then_cancel(view):
+            order = get_object(view)
+            self.move_row('canceled')
+            return order
+
+        with mock.patch.object(StaffOrderDetailView, 'get_object', load_then_cancel):
+            response = self.client.patch(
+                reverse('orders:staff_order_detail', args=[self.order.order_id]),
+                {'status': 'paid', 'admin_note': 'Paid by bank transfer'}
+            )
+
+        self.assertEqual(response.status_code, 409)
+        order = Order.objects.get(pk=self.order.pk)
+        self.assertEqual(order.status, 'canceled')
+        # Nor is the rest of the update saved
+        self.assertFalse(order.admin_note)
+
+    def test_second_payment_is_rejected(self):
+        WalletLedger.credit(self.user, 25, 'deposit', 'Top up')
+        self.client.force_authenticate(self.user)
+        url = reverse('orders:order_payment', args=[self.order.order_id])
+
+        self.assertEqual(self.client.post(url, {'payment_method': 'wallet'}).status_code, 200)
+        self.assertEqual(self.client.post(url, {'payment_method': 'wallet'}).status_code, 404)
+
+        self.assertEqual(UserWallet.objects.get(user=self.user).balance, Decimal('15'))
+        self.assertEqual(WalletTransaction.objects.filter(transaction_type='payment').count(), 1)
+
+    def test_payment_of_an_order_canceled_meanwhile_is_rolled_back(self):
+        WalletLedger.credit(self.user, 25, 'deposit', 'Top up')
+        self.move_row('canceled')
+
+        with self.assertRaises(OrderStatusConflict):
+            OrderStateMachine.pay_from_wallet(self.order, 'wallet', 'Payment')
+
+        self.assertEqual(UserWallet.objects.get(user=self.user).balance, Decimal('25'))
+        self.assertFalse(WalletTransaction.objects.filter(transaction_type='payment').exists())
+
+    def test_cancel_racing_a_payment_is_409(self):
+        self.client.force_authenticate(self.user)
+        transition = OrderStateMachine.transition
+
+        def paid_first(order, *args, **kwargs):
+            self.move_row('paid')
+            return transition(order, *args, **kwargs)
+
+        with mock.patch.object(OrderStateMachine, 'transition', side_effect=paid_first):
+            response = self.client.post(reverse('orders:order_cancel', args=[self.order.order_id]))
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, 'paid')
+
+
+class OrderAutoCancelTests(APITestCase):
+    """Only orders the conditional UPDATE itself canceled are logged and notified"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='pass12345')
+        cls.game = Game.objects.create(name='Game', slug='game', description='Game')
+
+    def setUp(self):
+        patcher = mock.patch('apps.core.outbox.schedule_relay')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_orders(self, count, hours_ago=24):
+        orders = [
+            Order.objects.create(user=self.user, game=self.game, game_uid=str(i), price=Decimal('10'))
+            for i in range(count)
+        ]
+        Order.objects.filter(pk__in=[order.pk for order in orders]).update(
+            created_at=timezone.now() - timedelta(hours=hours_ago)
+        )
+        return orders
+
+    def auto_canceled(self):
+        return set(OrderStatusLog.objects.filter(note__startswith='Auto-canceled').values_list('order_id', flat=True))
+
+    def test_stale_orders_are_canceled_in_chunks(self):
+        stale = self.create_orders(5)
+        recent = self.create_orders(1, hours_ago=1)
+
+        self.assertEqual(OrderAutoCancelService.cancel_unpaid_orders(hours=12, chunk_size=2), 5)
+
+        self.assertEqual(set(Order.objects.filter(status='canceled').values_list('pk', flat=True)),
+                         {order.pk for order in stale})
+        self.assertEqual(Order.objects.get(pk=recent[0].pk).status, 'pending_payment')
+        self.assertEqual(self.auto_canceled(), {order.pk for order in stale})
+        self.assertEqual(OutboxEvent.objects.filter(event_type='order.status_changed').count(), 5)
+        self.assertEqual(set(Notification.objects.values_list('order_id', flat=True)),
+                         {order.order_id for order in stale})
+
+    def test_orders_changed_by_others_meanwhile_are_not_reported(self):
+        WalletLedger.credit(self.user, 25, 'deposit', 'Top up')
+        paid, canceled, stale = self.create_orders(3)
+        cancel_rows = OrderAutoCancelService._cancel_rows
+
+        def others_first(ids):
+            # A payment and a customer cancel land between the SELECT and the UPDATE
+            OrderStateMachine.pay_from_wallet(paid, 'wallet', 'Payment')
+            OrderStateMachine.transition(canceled, 'canceled', expected='pending_payment', changed_by=self.user)
+            return cancel_rows(ids)
+
+        # Same clock for every writer, so updated_at cannot tell the rows apart
+        now = timezone.now()
+        with mock.patch('django.utils.timezone.now', return_value=now), \
+                mock.patch.object(OrderAutoCancelService, '_cancel_rows', side_effect=others_first):
+            self.assertEqual(OrderAutoCancelService.cancel_unpaid_orders(hours=12, max_chunks=1), 1)
+
+        self.assertEqual(Order.objects.get(pk=paid.pk).status, 'paid')
+        self.assertEqual(UserWallet.objects.get(user=self.user).balance, Decimal('15'))
+        self.assertEqual(self.auto_canceled(), {stale.pk})
+        self.assertEqual(list(Notification.objects.values_list('order_id', flat=True)), [stale.order_id])
+        self.assertEqual(OrderStatusLog.objects.filter(order=canceled).count(), 1)
+
+
+class OrderAutoCancelConcurrencyTests(TransactionTestCase):
+    """Payments racing the auto-cancel task: every order ends up paid or canceled, never both"""
+
+    ORDERS = 6
+
+    def setUp(self):
+        patcher = mock.patch('apps.core.outbox.schedule_relay')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Cancel notifications are pushed once their chunk commits
+        patcher = mock.patch('apps.notifications.realtime._send')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='pass12345')
+        game = Game.objects.create(name='Game', slug='game', description='Game')
+        self.orders = [
+            Order.objects.create(user=self.user, game=game, game_uid=str(i), price=Decimal('10'))
+            for i in range(self.ORDERS)
+        ]
+        Order.objects.update(created_at=timezone.now() - timedelta(hours=24))
+        WalletLedger.credit(self.user, 10 * self.ORDERS, 'deposit', 'Top up')
+
+    def retry_locked(self, func):
+        # SQLite's shared in-memory test database reports contention as a locked table
+        while True:
+            try:
+                return func()
+            except OperationalError as exc:
+                if 'locked' not in str(exc):
+                    raise
+
+    def test_payment_and_auto_cancel_never_both_win(self):
+        barrier = threading.Barrier(self.ORDERS + 1)
+        paid, canceled, errors = [], [], []
+
+        def pay(order):
+            try:
+                barrier.wait()
+                try:
+                    self.retry_locked(lambda: OrderStateMachine.pay_from_wallet(order, 'wallet', 'Payment'))
+                    paid.append(order.pk)
+                except OrderStatusConflict:
+                    pass
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        def auto_cancel():
+            try:
+                barrier.wait()
+                canceled.append(self.retry_locked(lambda: OrderAutoCancelService.cancel_unpaid_orders(hours=12)))
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=pay, args=(order,)) for order in self.orders]
+        threads.append(threading.Thread(target=auto_cancel))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        statuses = dict(Order.objects.values_list('pk', 'status'))
+        self.assertEqual({pk for pk, status in statuses.items() if status == 'paid'}, set(paid))
+        self.assertEqual(sum(canceled), self.ORDERS - len(paid))
+        # Canceled orders were never charged; each paid one was charged once
+        self.assertEqual(self.auto_canceled_ids(), {pk for pk, status in statuses.items() if status == 'canceled'})
+        self.assertEqual(UserWallet.objects.get(user=self.user).balance, Decimal(10 * (self.ORDERS - len(paid))))
+
+    def auto_canceled_ids(self):
+        return set(OrderStatusLog.objects.filter(new_status='canceled').values_list('order_id', flat=True))
+
+
+@skipIf(connection.vendor == 'postgresql', 'PostgreSQL numbers come from a sequence')
+class OrderNumberAllocatorTests(TransactionTestCase):
+    """Hi-lo blocks are only handed out from memory once their reservation commits"""
+
+    def test_block_is_reused_after_commit(self):
+        allocator = OrderNumberAllocator(block_size=5)
+
+        with transaction.atomic():
+            first = allocator.next_number()
+        with self.assertNumQueries(0):
+            self.assertEqual([allocator.next_number() for _ in range(4)], list(range(first + 1, first + 5)))
+
+    def test_block_is_dropped_when_the_outer_transaction_rolls_back(self):
+        allocator = OrderNumberAllocator(block_size=5)
+        other = OrderNumberAllocator(block_size=5)
+        counter = OrderNumberSequence.objects.get_or_create(name='order')[0].next_value
+
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                rolled_back = allocator.next_number()
+                raise RuntimeError('order create failed')
+        self.assertEqual(OrderNumberSequence.objects.get(name='order').next_value, counter)
+
+        # Another process reserves the rolled-back block again...
+        reissued = [other.next_number() for _ in range(5)]
+        self.assertEqual(reissued[0], rolled_back)
+        # ...so this one must not hand out the rest of it
+        self.assertNotIn(allocator.next_number(), reissued)
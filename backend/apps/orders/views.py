@@ -1,21 +1,59 @@
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework.exceptions import APIException, ValidationError
 from rest_framework.parsers import MultiPartParser, FormParser
 from django.db import transaction
+from django.db.models import Prefetch
 from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 from .models import Order, OrderStatusLog, OrderAttachment
 from .serializers import (
     OrderCreateSerializer,
+    OrderListSerializer,
     OrderSerializer,
     OrderPaymentSerializer,
     OrderAttachmentSerializer,
+    OrderStaffListSerializer,
     OrderStaffSerializer,
     OrderStaffUpdateSerializer
 )
-from apps.wallets.models import WalletTransaction
+from .services import OrderStateMachine, OrderTransitionError, OrderStatusConflict
+from apps.core.mixins import SparseFieldsetsViewMixin
+
+
+# Columns list endpoints never render
+ORDER_LIST_DEFERRED_FIELDS = [
+    'game_username', 'game_password', 'game_email', 'game_phone',
+    'payment_transaction_hash', 'customer_note', 'admin_note',
+    'game__description', 'game__introduction', 'game_package__description',
+]
+
+
+def order_list_queryset():
+    """
+    Orders shaped for the summary serializers.
+    Query budget per page: 1 COUNT + 1 SELECT (game and package joined;
+    enforced by OrderQueryBudgetTests).
+    """
+    return Order.objects.select_related('game', 'game_package').defer(*ORDER_LIST_DEFERRED_FIELDS)
+
+
+def order_detail_queryset():
+    """
+    Orders shaped for the detail serializers.
+    Query budget: 1 SELECT + 1 for status logs (+1 for attachments on staff detail).
+    """
+    return Order.objects.select_related('user', 'game', 'game_package').prefetch_related(
+        Prefetch('status_logs', queryset=OrderStatusLog.objects.select_related('changed_by'))
+    )
+
+
+class Conflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The order was changed by another request.'
+    default_code = 'conflict'
 
 
 class IsStaffUser(permissions.BasePermission):
@@ -33,9 +71,9 @@ class OrderCreateView(generics.CreateAPIView):
         serializer.save(user=self.request.user)
 
 
-class OrderListView(generics.ListAPIView):
-    """API endpoint for listing user orders"""
-    serializer_class = OrderSerializer
+class OrderListView(SparseFieldsetsViewMixin, generics.ListAPIView):
+    """API endpoint for listing user orders (summary, no status history)"""
+    serializer_class = OrderListSerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['status', 'payment_method', 'game']
@@ -44,27 +82,26 @@ class OrderListView(generics.ListAPIView):
     ordering = ['-created_at']
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        return order_list_queryset().filter(user=self.request.user)
 
 
-class OrderDetailView(generics.RetrieveAPIView):
-    """API endpoint for order detail"""
+class OrderDetailView(SparseFieldsetsViewMixin, generics.RetrieveAPIView):
+    """API endpoint for order detail (with status history)"""
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
     lookup_field = 'order_id'
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        return order_detail_queryset().filter(user=self.request.user)
 
 
 class OrderPaymentView(APIView):
     """API endpoint for order payment"""
     permission_classes = [permissions.IsAuthenticated]
 
-    @transaction.atomic
     def post(self, request, order_id):
         try:
-            order = Order.objects.select_for_update().get(
+            order = Order.objects.select_related('user').get(
                 order_id=order_id,
                 user=request.user,
                 status='pending_payment'
@@ -82,45 +119,26 @@ class OrderPaymentView(APIView):
         payment_method = serializer.validated_data['payment_method']
 
         if payment_method == 'wallet':
-            # Payment via internal wallet
-            wallet = request.user.wallet
-
-            if wallet.balance < order.price:
+            # Payment via internal wallet: deduct balance and mark the order paid
+            try:
+                payment = OrderStateMachine.pay_from_wallet(
+                    order,
+                    'wallet',
+                    f'Payment for order {order.order_id}',
+                    changed_by=request.user,
+                    note='Paid via internal wallet'
+                )
+            except OrderStatusConflict:
+                return Response(
+                    {'error': 'Order not found or cannot be paid'},
+                    status=status.HTTP_409_CONFLICT
+                )
+            if payment is None:
                 return Response(
                     {'error': 'Insufficient wallet balance'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            # Deduct balance
-            balance_before = wallet.balance
-            wallet.subtract_balance(order.price)
-
-            # Create transaction record
-            WalletTransaction.objects.create(
-                user=request.user,
-                transaction_type='payment',
-                amount=order.price,
-                balance_before=balance_before,
-                balance_after=wallet.balance,
-                description=f'Payment for order {order.order_id}',
-                reference_id=str(order.order_id)
-            )
-
-            # Update order status
-            old_status = order.status
-            order.status = 'paid'
-            order.payment_method = 'wallet'
-            order.save()
-
-            # Log status change
-            OrderStatusLog.objects.create(
-                order=order,
-                old_status=old_status,
-                new_status='paid',
-                changed_by=request.user,
-                note='Paid via internal wallet'
-            )
-
             return Response({
                 'message': 'Payment successful',
                 'order_id': str(order.order_id),
@@ -130,8 +148,10 @@ class OrderPaymentView(APIView):
         elif payment_method == 'crypto':
             # Crypto payment flow: User needs to create a CryptoDeposit
             # Order stays in pending_payment until CryptoDeposit is confirmed by admin
-            order.payment_method = 'crypto'
-            order.save()
+            Order.objects.filter(pk=order.pk, status='pending_payment').update(
+                payment_method='crypto',
+                updated_at=timezone.now()
+            )
 
             return Response({
                 'message': 'Please create a crypto deposit to complete payment',
@@ -148,10 +168,9 @@ class OrderCancelView(APIView):
     """API endpoint for canceling order - Users can cancel pending_payment orders only"""
     permission_classes = [permissions.IsAuthenticated]
 
-    @transaction.atomic
     def post(self, request, order_id):
         try:
-            order = Order.objects.select_for_update().get(
+            order = Order.objects.get(
                 order_id=order_id,
                 user=request.user
             )
@@ -169,18 +188,19 @@ class OrderCancelView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        old_status = order.status
-        order.status = 'canceled'
-        order.save()
-
-        # Log status change
-        OrderStatusLog.objects.create(
-            order=order,
-            old_status=old_status,
-            new_status='canceled',
-            changed_by=request.user,
-            note='Customer canceled unpaid order'
-        )
+        try:
+            OrderStateMachine.transition(
+                order,
+                'canceled',
+                expected='pending_payment',
+                changed_by=request.user,
+                note='Customer canceled unpaid order'
+            )
+        except OrderStatusConflict:
+            return Response(
+                {'error': 'Cannot cancel this order. Its status has just changed, please reload.'},
+                status=status.HTTP_409_CONFLICT
+            )
 
         return Response({
             'message': 'Order canceled successfully',
@@ -190,9 +210,9 @@ class OrderCancelView(APIView):
 
 # ============== STAFF VIEWS ==============
 
-class StaffOrderListView(generics.ListAPIView):
-    """API endpoint for staff to list all orders"""
-    serializer_class = OrderStaffSerializer
+class StaffOrderListView(SparseFieldsetsViewMixin, generics.ListAPIView):
+    """API endpoint for staff to list all orders (summary)"""
+    serializer_class = OrderStaffListSerializer
     permission_classes = [permissions.IsAuthenticated, IsStaffUser]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['status', 'payment_method', 'game']
@@ -201,14 +221,20 @@ class StaffOrderListView(generics.ListAPIView):
     ordering = ['-created_at']
 
     def get_queryset(self):
-        return Order.objects.all().select_related('user', 'game', 'game_package')
+        return order_list_queryset().select_related('user')
 
 
 class StaffOrderDetailView(generics.RetrieveUpdateAPIView):
     """API endpoint for staff to view and update order"""
     permission_classes = [permissions.IsAuthenticated, IsStaffUser]
     lookup_field = 'order_id'
-    queryset = Order.objects.all()
+
+    def get_queryset(self):
+        if self.request.method in ['PUT', 'PATCH']:
+            return Order.objects.all()
+        return order_detail_queryset().prefetch_related(
+            Prefetch('attachments', queryset=OrderAttachment.objects.select_related('uploaded_by'))
+        )
 
     def get_serializer_class(self):
         if self.request.method in ['PUT', 'PATCH']:
@@ -217,27 +243,29 @@ class StaffOrderDetailView(generics.RetrieveUpdateAPIView):
 
     @transaction.atomic
     def perform_update(self, serializer):
-        order = self.get_object()
-        old_status = order.status
-        new_status = serializer.validated_data.get('status', old_status)
+        order = serializer.instance
+        new_status = serializer.validated_data.pop('status', order.status)
 
-        instance = serializer.save()
-
-        # Log status change if status changed
-        if old_status != new_status:
+        if new_status != order.status:
+            values = {}
             # Update completed_at if status is completed
             if new_status == 'completed':
-                instance.completed_at = timezone.now()
-                instance.processed_by = self.request.user
-                instance.save()
-
-            OrderStatusLog.objects.create(
-                order=instance,
-                old_status=old_status,
-                new_status=new_status,
-                changed_by=self.request.user,
-                note=f'Status updated by staff'
-            )
+                values = {'completed_at': timezone.now(), 'processed_by': self.request.user}
+            try:
+                OrderStateMachine.transition(
+                    order,
+                    new_status,
+                    changed_by=self.request.user,
+                    note='Status updated by staff',
+                    **values
+                )
+            except OrderStatusConflict as e:
+                raise Conflict(str(e))
+            except OrderTransitionError as e:
+                raise ValidationError({'status': str(e)})
+
+        if serializer.validated_data:
+            serializer.save()
 
 
 class OrderAttachmentUploadView(generics.CreateAPIView):
@@ -144,7 +144,7 @@ class ForgotPasswordView(APIView):
                 # Generate reset token
                 reset_token = PasswordResetToken.generate_token(user)
 
-                # Send email
+                # Queue email (delivered by the core.deliver_emails task)
                 try:
                     send_password_reset_email(user, reset_token)
                 except Exception as e:
@@ -183,7 +183,7 @@ class ResetPasswordView(APIView):
         if serializer.is_valid():
             user = serializer.save()
 
-            # Send confirmation email
+            # Queue confirmation email
             try:
                 send_password_changed_email(user)
             except Exception as e:
@@ -1,9 +1,27 @@
+import io
+from datetime import datetime
+
+from django import forms
 from django.contrib import admin
+from django.db.models import Exists, OuterRef
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from django.utils.html import format_html
-from django.db import transaction
-from .models import UserWallet, Deposit, WalletTransaction, CryptoDeposit
-from apps.orders.models import OrderStatusLog
+from .models import UserWallet, Deposit, WalletTransaction, CryptoDeposit, ChainTransfer
+from apps.orders.services import OrderStateMachine, OrderStatusConflict
+from . import reconciliation
+from .services import CryptoDepositSettlement, WalletLedger
+
+
+class ReconcileStatementForm(forms.Form):
+    """Upload form for reconciling a CSV statement of chain transfers"""
+    statement = forms.FileField(
+        help_text='CSV export (TronScan, exchange) with transaction hash and amount columns'
+    )
+    include_matched = forms.BooleanField(
+        required=False,
+        help_text='Also list matched rows (the report can be as long as the statement)'
+    )
 
 
 @admin.register(UserWallet)
@@ -65,18 +83,14 @@ class DepositAdmin(admin.ModelAdmin):
 
         for deposit in queryset.filter(status='pending'):
             try:
-                # Get or create wallet for user
-                wallet, created = UserWallet.objects.get_or_create(user=deposit.user)
-                if created:
-                    self.message_user(request, f'Created wallet for user {deposit.user.email}', level='warning')
-
-                # Get balance before
-                balance_before = wallet.balance
-
                 # Add balance to user wallet FIRST (before changing status)
-                wallet.add_balance(deposit.amount)
-                # Refresh wallet from database to get updated balance
-                wallet.refresh_from_db()
+                WalletLedger.credit(
+                    deposit.user,
+                    deposit.amount,
+                    'deposit',
+                    f'Deposit confirmed: ${deposit.amount} USD',
+                    reference_id=str(deposit.id)
+                )
 
                 # Update deposit status
                 deposit.status = 'confirmed'
@@ -84,17 +98,6 @@ class DepositAdmin(admin.ModelAdmin):
                 deposit.processed_at = timezone.now()
                 deposit.save()
 
-                # Create transaction record
-                WalletTransaction.objects.create(
-                    user=deposit.user,
-                    transaction_type='deposit',
-                    amount=deposit.amount,
-                    balance_before=balance_before,
-                    balance_after=wallet.balance,
-                    description=f'Deposit confirmed: ${deposit.amount} USD',
-                    reference_id=str(deposit.id)
-                )
-
                 confirmed_count += 1
 
             except Exception as e:
@@ -128,10 +131,11 @@ class DepositAdmin(admin.ModelAdmin):
 class CryptoDepositAdmin(admin.ModelAdmin):
     """Admin for CryptoDeposit model with auto-payment"""
     list_display = ['id', 'user', 'amount', 'colored_status', 'related_order_display', 'tx_hash_short', 'created_at']
-    list_filter = ['status', 'auto_paid_order', 'created_at']
+    list_filter = ['status', 'chain_status', 'auto_paid_order', 'created_at']
     search_fields = ['user__email', 'tx_hash', 'from_address', 'related_order__order_id']
     raw_id_fields = ['user', 'related_order', 'verified_by']
-    readonly_fields = ['created_at', 'updated_at', 'verified_at', 'auto_paid_order']
+    readonly_fields = ['created_at', 'updated_at', 'verified_at', 'auto_paid_order',
+                       'chain_status', 'chain_checks', 'chain_next_check_at', 'chain_error']
 
     def colored_status(self, obj):
         """Display status with colored badge"""
@@ -164,152 +168,44 @@ class CryptoDepositAdmin(admin.ModelAdmin):
         ('Verification', {
             'fields': ('verified_by', 'verified_at', 'admin_note', 'auto_paid_order')
         }),
+        ('On-chain Verification', {
+            'fields': ('chain_status', 'chain_checks', 'chain_next_check_at', 'chain_error'),
+            'description': 'Checked automatically; deposits that match the chain are confirmed'
+        }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)
         }),
     )
 
-    actions = ['confirm_crypto_deposits', 'reject_crypto_deposits']
+    actions = ['confirm_crypto_deposits', 'reject_crypto_deposits', 'recheck_on_chain']
 
     def save_model(self, request, obj, form, change):
         """Handle status change when saving via form"""
         if change:  # Only for updates, not new objects
-            # Get the old status before saving
-            old_obj = CryptoDeposit.objects.get(pk=obj.pk)
-            old_status = old_obj.status
+            # Old status as loaded from the database (no extra query)
+            old_status = obj.get_previous_value('status')
             new_status = obj.status
 
             # If status changed to 'confirmed' from 'pending_verification'
             if old_status == 'pending_verification' and new_status == 'confirmed':
-                # Set verification details
-                obj.verified_by = request.user
-                obj.verified_at = timezone.now()
-
-                # Save the object first
+                # Save the other edits first; the settlement confirms the deposit,
+                # credits the wallet and auto-pays the related order
+                obj.status = old_status
                 super().save_model(request, obj, form, change)
 
-                # Now handle wallet credit and auto-pay
-                with transaction.atomic():
-                    # 1. Get or create wallet
-                    wallet, created = UserWallet.objects.get_or_create(user=obj.user)
-                    balance_before = wallet.balance
-
-                    # 2. Add balance to wallet
-                    wallet.add_balance(obj.amount)
-                    wallet.refresh_from_db()
-
-                    # 3. Create wallet transaction for deposit
-                    WalletTransaction.objects.create(
-                        user=obj.user,
-                        transaction_type='deposit',
-                        amount=obj.amount,
-                        balance_before=balance_before,
-                        balance_after=wallet.balance,
-                        description=f'Crypto deposit confirmed: ${obj.amount} USDT',
-                        reference_id=f'crypto_deposit_{obj.id}'
-                    )
-
-                    # 4. Auto-pay related order if exists
-                    if obj.related_order_id:
-                        from apps.orders.models import Order
-                        try:
-                            order = Order.objects.get(id=obj.related_order_id)
-                            if order.status == 'pending_payment':
-                                # Check if order already has a confirmed payment
-                                existing_confirmed = CryptoDeposit.objects.filter(
-                                    related_order=order,
-                                    status='confirmed'
-                                ).exclude(id=obj.id).exists()
-
-                                if existing_confirmed:
-                                    self.message_user(
-                                        request,
-                                        f'⚠️ Deposit confirmed but Order #{order.order_id} was already paid by another deposit. '
-                                        f'Balance ${obj.amount} added to wallet.',
-                                        level='warning'
-                                    )
-                                else:
-                                    order_total = order.total_amount
-
-                                    # Check if wallet has enough balance
-                                    wallet.refresh_from_db()
-                                    if wallet.balance >= order_total:
-                                        balance_before_payment = wallet.balance
-                                        if wallet.subtract_balance(order_total):
-                                            wallet.refresh_from_db()
-
-                                            # Update order status
-                                            old_order_status = order.status
-                                            order.status = 'paid'
-                                            order.payment_method = 'crypto'
-                                            order.save()
-
-                                            # Create OrderStatusLog
-                                            OrderStatusLog.objects.create(
-                                                order=order,
-                                                old_status=old_order_status,
-                                                new_status='paid',
-                                                changed_by=request.user,
-                                                note=f'Auto-paid via crypto deposit #{obj.id}'
-                                            )
-
-                                            # Create payment transaction
-                                            WalletTransaction.objects.create(
-                                                user=obj.user,
-                                                transaction_type='payment',
-                                                amount=order_total,
-                                                balance_before=balance_before_payment,
-                                                balance_after=wallet.balance,
-                                                description=f'Auto-payment for Order #{order.order_id}',
-                                                reference_id=order.order_id
-                                            )
-
-                                            # Mark deposit as auto-paid
-                                            obj.auto_paid_order = True
-                                            obj.save()
-
-                                            self.message_user(
-                                                request,
-                                                f'✅ Deposit confirmed & Order #{order.order_id} auto-paid (${order_total})',
-                                                level='success'
-                                            )
-                                        else:
-                                            self.message_user(
-                                                request,
-                                                f'⚠️ Deposit confirmed but failed to deduct for Order #{order.order_id}',
-                                                level='warning'
-                                            )
-                                    else:
-                                        self.message_user(
-                                            request,
-                                            f'⚠️ Deposit confirmed but insufficient balance for Order #{order.order_id}. '
-                                            f'Need ${order_total}, have ${wallet.balance}',
-                                            level='warning'
-                                        )
-                            else:
-                                self.message_user(
-                                    request,
-                                    f'✅ Deposit confirmed. Order #{order.order_id} status is {order.status}. '
-                                    f'Balance ${obj.amount} added to wallet.',
-                                    level='success'
-                                )
-                        except Order.DoesNotExist:
-                            self.message_user(
-                                request,
-                                f'⚠️ Deposit confirmed but related order not found',
-                                level='warning'
-                            )
-                    else:
-                        self.message_user(
-                            request,
-                            f'✅ Deposit confirmed. Balance added: ${obj.amount}',
-                            level='success'
-                        )
+                results = CryptoDepositSettlement.confirm([obj.pk], verified_by=request.user)
+                for deposit, outcome, order in results:
+                    obj.status = deposit.status
+                    obj.verified_by = deposit.verified_by
+                    obj.verified_at = deposit.verified_at
+                    obj.auto_paid_order = deposit.auto_paid_order
+                    level, message = self._settlement_message(deposit, outcome, order)
+                    self.message_user(request, message, level=level)
                 return  # Already saved above
 
             # If status changed to 'rejected' from 'pending_verification'
-            elif old_status == 'pending_verification' and new_status == 'rejected':
+            if old_status == 'pending_verification' and new_status == 'rejected':
                 # Set verification details
                 obj.verified_by = request.user
                 obj.verified_at = timezone.now()
@@ -323,18 +219,13 @@ class CryptoDepositAdmin(admin.ModelAdmin):
                     try:
                         order = Order.objects.get(id=obj.related_order_id)
                         if order.status == 'pending_payment':
-                            old_order_status = order.status
-                            order.status = 'canceled'
-                            order.admin_note = (order.admin_note or '') + f'\nAuto-canceled: Crypto deposit #{obj.id} rejected.'
-                            order.save()
-
-                            # Create OrderStatusLog
-                            OrderStatusLog.objects.create(
-                                order=order,
-                                old_status=old_order_status,
-                                new_status='canceled',
+                            OrderStateMachine.transition(
+                                order,
+                                'canceled',
+                                expected='pending_payment',
                                 changed_by=request.user,
-                                note=f'Auto-canceled due to crypto deposit #{obj.id} rejection'
+                                note=f'Auto-canceled due to crypto deposit #{obj.id} rejection',
+                                admin_note=(order.admin_note or '') + f'\nAuto-canceled: Crypto deposit #{obj.id} rejected.'
                             )
 
                             self.message_user(
@@ -348,6 +239,12 @@ class CryptoDepositAdmin(admin.ModelAdmin):
                                 f'❌ Deposit rejected. Order #{order.order_id} status is {order.status} (not auto-canceled)',
                                 level='info'
                             )
+                    except OrderStatusConflict:
+                        self.message_user(
+                            request,
+                            f'❌ Deposit rejected. Order #{order.order_id} changed status meanwhile (not auto-canceled)',
+                            level='info'
+                        )
                     except Order.DoesNotExist:
                         self.message_user(
                             request,
@@ -376,149 +273,60 @@ class CryptoDepositAdmin(admin.ModelAdmin):
         return obj.tx_hash
     tx_hash_short.short_description = 'TX Hash'
 
-    @transaction.atomic
     def confirm_crypto_deposits(self, request, queryset):
         """Confirm crypto deposits and auto-pay related orders"""
-        confirmed_count = 0
-        error_count = 0
-
-        for deposit in queryset.filter(status='pending_verification'):
-            try:
-                # 1. Get or create wallet
-                wallet, created = UserWallet.objects.get_or_create(user=deposit.user)
-                balance_before = wallet.balance
-
-                # 2. Add balance to wallet
-                wallet.add_balance(deposit.amount)
-                wallet.refresh_from_db()
-
-                # 3. Update deposit status
-                deposit.status = 'confirmed'
-                deposit.verified_by = request.user
-                deposit.verified_at = timezone.now()
-                deposit.save()
-
-                # 4. Create wallet transaction
-                WalletTransaction.objects.create(
-                    user=deposit.user,
-                    transaction_type='deposit',
-                    amount=deposit.amount,
-                    balance_before=balance_before,
-                    balance_after=wallet.balance,
-                    description=f'Crypto deposit confirmed: ${deposit.amount} USDT',
-                    reference_id=f'crypto_deposit_{deposit.id}'
-                )
-
-                # 5. Auto-pay related order if exists and not yet paid
-                if deposit.related_order_id:
-                    # Refresh order from database to get latest status
-                    from apps.orders.models import Order
-                    try:
-                        order = Order.objects.get(id=deposit.related_order_id)
-                    except Order.DoesNotExist:
-                        self.message_user(
-                            request,
-                            f'⚠️ Deposit confirmed but related order not found',
-                            level='warning'
-                        )
-                        confirmed_count += 1
-                        continue
-
-                    if order.status == 'pending_payment':
-                        # Check if order already has a confirmed payment
-                        existing_confirmed = CryptoDeposit.objects.filter(
-                            related_order=order,
-                            status='confirmed'
-                        ).exclude(id=deposit.id).exists()
-
-                        if existing_confirmed:
-                            self.message_user(
-                                request,
-                                f'⚠️ Deposit confirmed but Order #{order.order_id} was already paid by another deposit. '
-                                f'Balance ${deposit.amount} added to wallet.',
-                                level='warning'
-                            )
-                        else:
-                            order_total = order.total_amount
-
-                            # Check if wallet has enough balance
-                            wallet.refresh_from_db()
-                            if wallet.balance >= order_total:
-                                # Deduct from wallet
-                                balance_before_payment = wallet.balance
-                                if wallet.subtract_balance(order_total):
-                                    wallet.refresh_from_db()
-
-                                    # Update order status to paid
-                                    old_status = order.status
-                                    order.status = 'paid'
-                                    order.payment_method = 'crypto'
-                                    order.save()
-
-                                    # Create OrderStatusLog
-                                    OrderStatusLog.objects.create(
-                                        order=order,
-                                        old_status=old_status,
-                                        new_status='paid',
-                                        changed_by=request.user,
-                                        note=f'Auto-paid via crypto deposit #{deposit.id}'
-                                    )
-
-                                    # Create payment transaction
-                                    WalletTransaction.objects.create(
-                                        user=deposit.user,
-                                        transaction_type='payment',
-                                        amount=order_total,
-                                        balance_before=balance_before_payment,
-                                        balance_after=wallet.balance,
-                                        description=f'Auto-payment for Order #{order.order_id}',
-                                        reference_id=order.order_id
-                                    )
-
-                                    # Mark deposit as auto-paid
-                                    deposit.auto_paid_order = True
-                                    deposit.save()
-
-                                    self.message_user(
-                                        request,
-                                        f'✅ Deposit confirmed & Order #{order.order_id} auto-paid (${order_total})',
-                                        level='success'
-                                    )
-                                else:
-                                    self.message_user(
-                                        request,
-                                        f'⚠️ Deposit confirmed but failed to pay Order #{order.order_id}',
-                                        level='warning'
-                                    )
-                            else:
-                                self.message_user(
-                                    request,
-                                    f'⚠️ Deposit confirmed but insufficient balance for Order #{order.order_id}. '
-                                    f'Need ${order_total}, have ${wallet.balance}',
-                                    level='warning'
-                                )
-                    else:
-                        self.message_user(
-                            request,
-                            f'ℹ️ Deposit confirmed. Order #{order.order_id} status is {order.status}. '
-                            f'Balance ${deposit.amount} added to wallet.',
-                            level='info'
-                        )
-
-                confirmed_count += 1
-
-            except Exception as e:
-                error_count += 1
-                self.message_user(
-                    request,
-                    f'❌ Error confirming deposit {deposit.id}: {str(e)}',
-                    level='error'
-                )
-
-        if confirmed_count > 0:
-            self.message_user(request, f'✅ {confirmed_count} crypto deposits confirmed')
-        if error_count > 0:
-            self.message_user(request, f'❌ {error_count} deposits failed', level='error')
+        deposit_ids = list(queryset.filter(status='pending_verification').values_list('id', flat=True))
+        try:
+            results = CryptoDepositSettlement.confirm(deposit_ids, verified_by=request.user)
+        except Exception as e:
+            # Chunks committed before the failure stay confirmed
+            self.message_user(request, f'❌ Error confirming deposits: {str(e)}', level='error')
+            return
+
+        auto_paid = 0
+        skipped = 0
+        for deposit, outcome, order in results:
+            if outcome == CryptoDepositSettlement.AUTO_PAID:
+                auto_paid += 1
+            elif outcome != CryptoDepositSettlement.CONFIRMED:
+                skipped += outcome == CryptoDepositSettlement.ALREADY_CREDITED
+                level, message = self._settlement_message(deposit, outcome, order)
+                self.message_user(request, message, level=level)
+
+        if len(results) > skipped:
+            message = f'✅ {len(results) - skipped} crypto deposits confirmed'
+            if auto_paid:
+                message += f', {auto_paid} orders auto-paid'
+            self.message_user(request, message)
+
+    def _settlement_message(self, deposit, outcome, order):
+        """(level, message) describing one settled deposit"""
+        S = CryptoDepositSettlement
+        if outcome == S.AUTO_PAID:
+            return 'success', f'✅ Deposit confirmed & Order #{order.order_id} auto-paid (${order.total_amount})'
+        if outcome == S.ALREADY_PAID:
+            return 'warning', (
+                f'⚠️ Deposit confirmed but Order #{order.order_id} was already paid by another deposit. '
+                f'Balance ${deposit.amount} added to wallet.'
+            )
+        if outcome == S.INSUFFICIENT:
+            return 'warning', (
+                f'⚠️ Deposit confirmed but insufficient balance for Order #{order.order_id}. '
+                f'Need ${order.total_amount}'
+            )
+        if outcome == S.ORDER_NOT_PENDING:
+            return 'info', (
+                f'ℹ️ Deposit confirmed. Order #{order.order_id} status is {order.status}. '
+                f'Balance ${deposit.amount} added to wallet.'
+            )
+        if outcome == S.ORDER_MISSING:
+            return 'warning', '⚠️ Deposit confirmed but related order not found'
+        if outcome == S.ALREADY_CREDITED:
+            return 'error', (
+                f'⛔ Deposit #{deposit.id} skipped: its wallet credit already exists in the ledger. '
+                f'It was not credited again and is still pending verification.'
+            )
+        return 'success', f'✅ Deposit confirmed. Balance added: ${deposit.amount}'
 
     confirm_crypto_deposits.short_description = '✅ Confirm selected crypto deposits'
 
@@ -540,21 +348,16 @@ class CryptoDepositAdmin(admin.ModelAdmin):
                 try:
                     order = Order.objects.get(id=deposit.related_order_id)
                     if order.status == 'pending_payment':
-                        old_order_status = order.status
-                        order.status = 'canceled'
-                        order.admin_note = (order.admin_note or '') + f'\nAuto-canceled: Crypto deposit #{deposit.id} rejected.'
-                        order.save()
-
-                        # Create OrderStatusLog
-                        OrderStatusLog.objects.create(
-                            order=order,
-                            old_status=old_order_status,
-                            new_status='canceled',
+                        OrderStateMachine.transition(
+                            order,
+                            'canceled',
+                            expected='pending_payment',
                             changed_by=request.user,
-                            note=f'Auto-canceled due to crypto deposit #{deposit.id} rejection'
+                            note=f'Auto-canceled due to crypto deposit #{deposit.id} rejection',
+                            admin_note=(order.admin_note or '') + f'\nAuto-canceled: Crypto deposit #{deposit.id} rejected.'
                         )
                         canceled_orders += 1
-                except Order.DoesNotExist:
+                except (Order.DoesNotExist, OrderStatusConflict):
                     pass
 
             rejected_count += 1
@@ -566,6 +369,66 @@ class CryptoDepositAdmin(admin.ModelAdmin):
 
     reject_crypto_deposits.short_description = '❌ Reject selected crypto deposits'
 
+    def recheck_on_chain(self, request, queryset):
+        """Queue deposits for another round of on-chain verification"""
+        updated = queryset.filter(status='pending_verification').update(
+            chain_status='pending',
+            chain_checks=0,
+            chain_next_check_at=timezone.now(),
+            chain_error=''
+        )
+        self.message_user(request, f'🔄 {updated} crypto deposits queued for on-chain verification')
+
+    recheck_on_chain.short_description = '🔄 Re-check selected deposits on chain'
+
+    def get_urls(self):
+        from django.urls import path
+        urls = super().get_urls()
+        custom_urls = [
+            path(
+                'reconcile/',
+                self.admin_site.admin_view(self.reconcile_statement_view),
+                name='wallets_cryptodeposit_reconcile'
+            ),
+        ]
+        return custom_urls + urls
+
+    def reconcile_statement_view(self, request):
+        """Upload a statement and download the reconciliation report as CSV"""
+        from django.shortcuts import render
+
+        if request.method == 'POST':
+            form = ReconcileStatementForm(request.POST, request.FILES)
+            if form.is_valid():
+                # Read straight from the uploaded (temporary) file, one line at a time
+                statement = io.TextIOWrapper(form.cleaned_data['statement'].file, encoding='utf-8-sig', newline='')
+                try:
+                    rows = reconciliation.read_statement(statement)
+                except (reconciliation.StatementError, UnicodeDecodeError) as e:
+                    form.add_error('statement', f'Cannot read the statement: {e}')
+                else:
+                    include = reconciliation.RESULTS
+                    if not form.cleaned_data['include_matched']:
+                        include = (reconciliation.AMOUNT_MISMATCH, reconciliation.UNMATCHED)
+                    response = StreamingHttpResponse(
+                        reconciliation.report_lines(reconciliation.reconcile(rows), include),
+                        content_type='text/csv'
+                    )
+                    response['Content-Disposition'] = 'attachment; filename="reconciliation.csv"'
+                    return response
+        else:
+            form = ReconcileStatementForm()
+
+        return render(
+            request,
+            'admin/wallets/cryptodeposit/reconcile_statement.html',
+            {
+                'form': form,
+                'title': 'Reconcile Statement',
+                'opts': self.model._meta,
+            }
+        )
+
 
 @admin.register(WalletTransaction)
 class WalletTransactionAdmin(admin.ModelAdmin):
@@ -575,3 +438,48 @@ class WalletTransactionAdmin(admin.ModelAdmin):
     search_fields = ['user__email', 'description', 'reference_id']
     raw_id_fields = ['user']
     readonly_fields = ['created_at', 'updated_at']
+
+
+class ClaimedFilter(admin.SimpleListFilter):
+    """Whether a crypto deposit was submitted for the transfer"""
+    title = 'claimed by a deposit'
+    parameter_name = 'claimed'
+
+    def lookups(self, request, model_admin):
+        return [('yes', 'Yes'), ('no', 'No')]
+
+    def queryset(self, request, queryset):
+        if self.value() in ('yes', 'no'):
+            return queryset.filter(claimed=self.value() == 'yes')
+        return queryset
+
+
+@admin.register(ChainTransfer)
+class ChainTransferAdmin(admin.ModelAdmin):
+    """Read-only view of transfers found by the transfer indexer"""
+    list_display = ['tx_hash', 'amount', 'from_address', 'block_time', 'claimed']
+    list_filter = [ClaimedFilter]
+    search_fields = ['tx_hash', 'from_address']
+    readonly_fields = ['tx_hash', 'block_timestamp', 'contract', 'from_address', 'to_address', 'amount',
+                       'created_at', 'updated_at']
+
+    def get_queryset(self, request):
+        deposits = CryptoDeposit.objects.filter(tx_hash=OuterRef('tx_hash'))
+        return super().get_queryset(request).annotate(claimed=Exists(deposits))
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def block_time(self, obj):
+        return datetime.fromtimestamp(obj.block_timestamp / 1000, tz=timezone.get_current_timezone())
+    block_time.short_description = 'Block Time'
+    block_time.admin_order_field = 'block_timestamp'
+
+    def claimed(self, obj):
+        return obj.claimed
+    claimed.boolean = True
+    claimed.short_description = 'Claimed'
+    claimed.admin_order_field = 'claimed'
@@ -0,0 +1,244 @@
+"""
+TRON chain access
+
+Crypto deposits are checked against the chain through a client class named
+by TRON_CHAIN_CLIENT. The default TronGridClient reads transaction receipts
+from a TRON full node's HTTP API: TronGrid by default, or any node (or a
+local fake node) at TRON_API_URL. Its requests share one pooled
+httpx.AsyncClient.
+
+A client is an async context manager with two methods:
+
+    async def get_receipt(self, tx_hash):
+        # None while the transaction is unknown or not yet solidified, else
+        # {'tx_hash': ..., 'success': bool, 'block': int,
+        #  'transfers': [{'contract': ..., 'from': ..., 'to': ..., 'value': int}]}
+        # with base58 addresses and raw token amounts.
+
+    async def get_transfers(self, address, contract, min_timestamp, fingerprint=None):
+        # One page of confirmed TRC20 transfers of contract to address made
+        # at or after min_timestamp (ms), oldest first:
+        # ([{'tx_hash': ..., 'timestamp': int, 'contract': ..., 'from': ...,
+        #    'to': ..., 'value': int}], fingerprint of the next page or None)
+
+Both raise ChainError when the node cannot be asked.
+
+fetch_receipts() looks up many hashes with at most TRON_MAX_CONCURRENCY
+requests in flight. Solidified receipts never change, so they are kept in
+a per-process LRU cache (TRON_RECEIPT_CACHE_SIZE entries, each for
+TRON_RECEIPT_CACHE_TTL seconds); missing ones are asked again next time.
+
+fetch_transfers() pages through get_transfers() for the transfer indexer
+(apps.wallets.indexer).
+
+A fake node has to answer POST /walletsolidity/gettransactioninfobyid
+({"value": tx_hash}) and GET /v1/accounts/<address>/transactions/trc20 the
+way a real one does.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+
+import httpx
+from django.conf import settings
+from django.utils.module_loading import import_string
+from tronpy.keys import to_base58check_address
+
+# keccak256('Transfer(address,address,uint256)')
+TRANSFER_TOPIC = 'ddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef'
+
+
+class ChainError(Exception):
+    """The node could not be asked (network error, rate limit, bad response)"""
+
+
+def _address(hex_value):
+    """Base58 address for a hex address or a 32-byte log topic"""
+    return to_base58check_address('41' + hex_value[-40:])
+
+
+# ==========================================
+# Clients
+# ==========================================
+
+class TronGridClient:
+    """Receipts and transfers from a TRON node HTTP API (TronGrid or compatible)"""
+
+    def __init__(self):
+        headers = {}
+        if settings.TRON_API_KEY:
+            headers['TRON-PRO-API-KEY'] = settings.TRON_API_KEY
+        max_connections = getattr(settings, 'TRON_MAX_CONCURRENCY', 10)
+        self.client = httpx.AsyncClient(
+            base_url=getattr(settings, 'TRON_API_URL', 'https://api.trongrid.io'),
+            headers=headers,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=getattr(settings, 'TRON_TIMEOUT', 10)
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.client.aclose()
+
+    async def request(self, method, path, **kwargs):
+        try:
+            response = await self.client.request(method, path, **kwargs)
+        except httpx.HTTPError as e:
+            raise ChainError(f'{type(e).__name__}: {e}') from e
+        if response.status_code != 200:
+            raise ChainError(f'HTTP {response.status_code}: {response.text[:200]}')
+        try:
+            return response.json()
+        except ValueError as e:
+            raise ChainError(f'Invalid JSON from node: {e}') from e
+
+    async def get_receipt(self, tx_hash):
+        # The solidity node only knows irreversible (confirmed) transactions
+        info = await self.request('POST', '/walletsolidity/gettransactioninfobyid', json={'value': tx_hash})
+        if not info:
+            return None
+
+        transfers = []
+        for log in info.get('log', []):
+            topics = log.get('topics', [])
+            if len(topics) != 3 or topics[0] != TRANSFER_TOPIC:
+                continue
+            transfers.append({
+                'contract': _address(log['address']),
+                'from': _address(topics[1]),
+                'to': _address(topics[2]),
+                'value': int(log.get('data') or '0', 16),
+            })
+
+        return {
+            'tx_hash': tx_hash,
+            'success': info.get('result') != 'FAILED' and info.get('receipt', {}).get('result') == 'SUCCESS',
+            'block': info.get('blockNumber'),
+            'transfers': transfers,
+        }
+
+    async def get_transfers(self, address, contract, min_timestamp, fingerprint=None):
+        params = {
+            'only_to': 'true',
+            'only_confirmed': 'true',
+            'contract_address': contract,
+            'min_timestamp': min_timestamp,
+            'order_by': 'block_timestamp,asc',
+            'limit': getattr(settings, 'TRON_INDEXER_PAGE_SIZE', 200),
+        }
+        if fingerprint:
+            params['fingerprint'] = fingerprint
+        body = await self.request('GET', f'/v1/accounts/{address}/transactions/trc20', params=params)
+
+        transfers = [
+            {
+                'tx_hash': item['transaction_id'],
+                'timestamp': item['block_timestamp'],
+                'contract': item['token_info']['address'],
+                'from': item['from'],
+                'to': item['to'],
+                'value': int(item['value']),
+            }
+            for item in body.get('data', [])
+            if item.get('type') == 'Transfer'
+        ]
+        return transfers, (body.get('meta') or {}).get('fingerprint')
+
+
+def get_client():
+    return import_string(getattr(settings, 'TRON_CHAIN_CLIENT', 'apps.wallets.chain.TronGridClient'))()
+
+
+# ==========================================
+# Receipt cache
+# ==========================================
+
+class ReceiptCache:
+    """LRU cache whose entries also expire after `ttl` seconds"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+receipt_cache = ReceiptCache(
+    getattr(settings, 'TRON_RECEIPT_CACHE_SIZE', 1024),
+    getattr(settings, 'TRON_RECEIPT_CACHE_TTL', 3600)
+)
+
+
+async def fetch_receipts(tx_hashes):
+    """
+    Receipts for tx_hashes, looked up concurrently.
+
+    Returns:
+        dict: {tx_hash: receipt dict, None (not confirmed) or ChainError}
+    """
+    receipts = {}
+    missing = []
+    for tx_hash in tx_hashes:
+        receipt = receipt_cache.get(tx_hash)
+        if receipt is None:
+            missing.append(tx_hash)
+        else:
+            receipts[tx_hash] = receipt
+    if not missing:
+        return receipts
+
+    semaphore = asyncio.Semaphore(getattr(settings, 'TRON_MAX_CONCURRENCY', 10))
+
+    async def fetch(client, tx_hash):
+        async with semaphore:
+            try:
+                receipt = await client.get_receipt(tx_hash)
+            except ChainError as e:
+                receipts[tx_hash] = e
+                return
+        receipts[tx_hash] = receipt
+        if receipt is not None:
+            receipt_cache.set(tx_hash, receipt)
+
+    async with get_client() as client:
+        await asyncio.gather(*(fetch(client, tx_hash) for tx_hash in missing))
+    return receipts
+
+
+async def fetch_transfers(address, contract, min_timestamp, max_pages):
+    """
+    Transfers of contract to address since min_timestamp, oldest first.
+
+    Returns:
+        tuple: (transfers, True if every page was read)
+    """
+    transfers = []
+    fingerprint = None
+    async with get_client() as client:
+        for _ in range(max_pages):
+            page, fingerprint = await client.get_transfers(address, contract, min_timestamp, fingerprint)
+            transfers.extend(page)
+            if not fingerprint:
+                return transfers, True
+    return transfers, False
@@ -0,0 +1,141 @@
+"""
+USDT TRC20 transfer indexer
+
+Instead of asking the chain about every deposit's tx_hash, sync() reads
+all confirmed USDT transfers to ADMIN_USDT_TRC20_ADDRESS since the last
+run, page by page, and stores them in ChainTransfer (one row per
+transaction). The position is kept in a ChainCursor as the latest block
+timestamp seen; each run re-reads TRON_INDEXER_OVERLAP seconds before it,
+so transfers sharing the cursor's block are never missed (duplicates are
+ignored on insert).
+
+A run reads at most TRON_INDEXER_MAX_PAGES pages. After downtime the task
+keeps calling sync() until it has caught up, so a backfill costs one
+request per page of transfers rather than one per deposit. A new cursor
+starts TRON_INDEXER_BACKFILL_HOURS in the past.
+
+match() then checks every pending deposit whose tx_hash is in the table
+against its transfer in one pass (see verification.record); matching ones
+are settled, or left for review when they carry no sender address.
+Transfers no deposit claims stay in the table for admins to look at.
+"""
+import asyncio
+from collections import OrderedDict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import chain, verification
+from .models import ChainCursor, ChainTransfer, CryptoDeposit
+
+
+def is_enabled():
+    return getattr(settings, 'TRON_INDEXER_ENABLED', True) and bool(settings.ADMIN_USDT_TRC20_ADDRESS)
+
+
+def _cursor_name(address):
+    return f'usdt-trc20:{address}'
+
+
+def _rows(transfers, contract):
+    """ChainTransfer rows for fetched transfers, amounts of one transaction summed"""
+    rows = OrderedDict()
+    for transfer in transfers:
+        if transfer['contract'] != contract:
+            continue
+        amount = Decimal(transfer['value']).scaleb(-verification.USDT_DECIMALS)
+        row = rows.get(transfer['tx_hash'])
+        if row is None:
+            rows[transfer['tx_hash']] = ChainTransfer(
+                tx_hash=transfer['tx_hash'],
+                block_timestamp=transfer['timestamp'],
+                contract=transfer['contract'],
+                from_address=transfer['from'],
+                to_address=transfer['to'],
+                amount=amount
+            )
+        else:
+            row.amount += amount
+    return list(rows.values())
+
+
+def sync(max_pages=None):
+    """
+    Index transfers since the cursor.
+
+    Returns:
+        dict: number of transfers fetched and whether the scan caught up
+    """
+    address = settings.ADMIN_USDT_TRC20_ADDRESS
+    contract = getattr(settings, 'TRON_USDT_CONTRACT', 'TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t')
+    max_pages = max_pages or getattr(settings, 'TRON_INDEXER_MAX_PAGES', 50)
+    overlap_ms = getattr(settings, 'TRON_INDEXER_OVERLAP', 60) * 1000
+
+    backfill = timezone.now() - timedelta(hours=getattr(settings, 'TRON_INDEXER_BACKFILL_HOURS', 72))
+    cursor, _ = ChainCursor.objects.get_or_create(
+        name=_cursor_name(address),
+        defaults={'position': int(backfill.timestamp() * 1000)}
+    )
+
+    transfers, complete = asyncio.run(
+        chain.fetch_transfers(address, contract, max(cursor.position - overlap_ms, 0), max_pages)
+    )
+    rows = _rows(transfers, contract)
+
+    with transaction.atomic():
+        ChainTransfer.objects.bulk_create(rows, batch_size=500, ignore_conflicts=True)
+        if transfers:
+            # Only moves forward, even if the node returned older pages
+            position = max(cursor.position, max(transfer['timestamp'] for transfer in transfers))
+            ChainCursor.objects.filter(pk=cursor.pk).update(position=position, updated_at=timezone.now())
+
+    return {'fetched': len(rows), 'complete': complete}
+
+
+def _receipt(transfer):
+    """Receipt-shaped view of an indexed transfer for verification.check()"""
+    return {
+        'tx_hash': transfer.tx_hash,
+        'success': True,  # only confirmed, successful transfers are indexed
+        'block': None,
+        'transfers': [{
+            'contract': transfer.contract,
+            'from': transfer.from_address,
+            'to': transfer.to_address,
+            'value': int(transfer.amount.scaleb(verification.USDT_DECIMALS)),
+        }],
+    }
+
+
+def match(batch_size=None):
+    """
+    Verify pending deposits whose transaction has been indexed.
+
+    Returns:
+        dict: counts of confirmed, mismatched and review deposits
+    """
+    batch_size = batch_size or getattr(settings, 'TRON_VERIFY_BATCH_SIZE', 100)
+    totals = {'confirmed': 0, 'mismatched': 0, 'review': 0}
+
+    # Deposits that ran out of lookups are picked up too once their transfer shows up
+    indexed = CryptoDeposit.objects.filter(
+        status='pending_verification',
+        chain_status__in=['pending', 'not_found'],
+        tx_hash__in=ChainTransfer.objects.values('tx_hash')
+    ).order_by('id')
+
+    # Every recorded deposit leaves the queryset (confirmed, mismatch or review)
+    while True:
+        deposits = list(indexed[:batch_size])
+        if not deposits:
+            break
+        transfers = ChainTransfer.objects.filter(tx_hash__in=[deposit.tx_hash for deposit in deposits])
+        result = verification.record(deposits, {transfer.tx_hash: _receipt(transfer) for transfer in transfers})
+        totals['confirmed'] += result['confirmed']
+        totals['mismatched'] += result['mismatched']
+        totals['review'] += result['review']
+
+    return totals
@@ -0,0 +1,64 @@
+import csv
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from apps.wallets import reconciliation
+
+
+class Command(BaseCommand):
+    help = 'Reconcile a CSV statement of chain transfers against crypto and wallet deposits'
+
+    def add_arguments(self, parser):
+        parser.add_argument('statement', help='Path to the CSV statement')
+        parser.add_argument(
+            '--output-dir',
+            default='.',
+            help='Directory for matched.csv, amount_mismatch.csv and unmatched.csv (default: current directory)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Rows looked up per query (default: RECONCILIATION_BATCH_SIZE)'
+        )
+
+    def handle(self, *args, **options):
+        output_dir = options['output_dir']
+        os.makedirs(output_dir, exist_ok=True)
+
+        counts = dict.fromkeys(reconciliation.RESULTS, 0)
+        started = time.monotonic()
+
+        # utf-8-sig drops the byte order mark spreadsheet exports start with
+        with open(options['statement'], newline='', encoding='utf-8-sig') as statement:
+            try:
+                rows = reconciliation.read_statement(statement)
+            except reconciliation.StatementError as e:
+                raise CommandError(str(e))
+
+            reports = {
+                result: open(os.path.join(output_dir, f'{result}.csv'), 'w', newline='', encoding='utf-8')
+                for result in reconciliation.RESULTS
+            }
+            try:
+                writers = {result: csv.writer(report) for result, report in reports.items()}
+                for writer in writers.values():
+                    writer.writerow(reconciliation.REPORT_FIELDS)
+
+                for line, result, row, record in reconciliation.reconcile(rows, batch_size=options['batch_size']):
+                    writers[result].writerow(reconciliation.report_row(line, result, row, record))
+                    counts[result] += 1
+            finally:
+                for report in reports.values():
+                    report.close()
+
+        elapsed = time.monotonic() - started
+        total = sum(counts.values())
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Reconciled {total} rows in {elapsed:.1f}s: {counts["matched"]} matched, '
+                f'{counts["amount_mismatch"]} amount mismatches, {counts["unmatched"]} unmatched. '
+                f'Reports written to {os.path.abspath(output_dir)}'
+            )
+        )
@@ -0,0 +1,74 @@
+import time
+
+from django.core.management.base import BaseCommand
+from apps.wallets import indexer, verification
+
+
+class Command(BaseCommand):
+    help = 'Index transfers and verify pending crypto deposits on the TRON chain, reporting throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Number of deposits looked up per batch (default: TRON_VERIFY_BATCH_SIZE)'
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            default=None,
+            help='Stop after this many batches (default: until no deposit is due)'
+        )
+
+    def handle(self, *args, **options):
+        if indexer.is_enabled():
+            self.index()
+
+        max_batches = options['max_batches']
+        totals = {'confirmed': 0, 'retried': 0, 'mismatched': 0, 'review': 0, 'not_found': 0}
+        batches = 0
+
+        started = time.monotonic()
+        while max_batches is None or batches < max_batches:
+            result = verification.verify(batch_size=options['batch_size'])
+            if not any(result.values()):
+                break
+            batches += 1
+            for key, value in result.items():
+                totals[key] += value
+        elapsed = time.monotonic() - started
+
+        checked = sum(totals.values())
+        if checked == 0:
+            self.stdout.write(self.style.SUCCESS('No crypto deposits due for verification.'))
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Checked {checked} crypto deposits in {batches} batches, {elapsed:.2f}s '
+                f'({checked / elapsed:.1f}/s): {totals["confirmed"]} confirmed, '
+                f'{totals["retried"]} to retry, {totals["mismatched"]} mismatched, '
+                f'{totals["review"]} for manual review, {totals["not_found"]} not found'
+            )
+        )
+
+    def index(self):
+        started = time.monotonic()
+        fetched = syncs = 0
+        while True:
+            result = indexer.sync()
+            fetched += result['fetched']
+            syncs += 1
+            if result['complete']:
+                break
+        matched = indexer.match()
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Read {fetched} transfers in {syncs} syncs, {elapsed:.2f}s: '
+                f'{matched["confirmed"]} deposits confirmed, {matched["mismatched"]} mismatched, '
+                f'{matched["review"]} for manual review'
+            )
+        )
@@ -0,0 +1,40 @@
+# Generated by Django 5.0 on 2026-10-16 22:53
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallets', '0004_cryptodeposit'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cryptodeposit',
+            name='chain_checks',
+            field=models.PositiveIntegerField(default=0, verbose_name='Chain Checks'),
+        ),
+        migrations.AddField(
+            model_name='cryptodeposit',
+            name='chain_error',
+            field=models.CharField(blank=True, max_length=255, verbose_name='Chain Error'),
+        ),
+        migrations.AddField(
+            model_name='cryptodeposit',
+            name='chain_next_check_at',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now, null=True, verbose_name='Next Chain Check'),
+        ),
+        migrations.AddField(
+            model_name='cryptodeposit',
+            name='chain_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('confirmed', 'Confirmed on chain'), ('mismatch', 'Does not match'), ('not_found', 'Not found')], default='pending', max_length=20, verbose_name='Chain Status'),
+        ),
+        migrations.AddIndex(
+            model_name='cryptodeposit',
+            index=models.Index(condition=models.Q(('chain_status', 'pending'), ('status', 'pending_verification')), fields=['chain_next_check_at'], name='cryptodeposit_chain_pending'),
+        ),
+    ]
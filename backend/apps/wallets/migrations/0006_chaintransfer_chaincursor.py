@@ -0,0 +1,45 @@
+# Generated by Django 5.0 on 2026-10-16 22:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallets', '0005_cryptodeposit_chain_verification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChainCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=150, unique=True, verbose_name='Name')),
+                ('position', models.BigIntegerField(default=0, verbose_name='Position')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+            ],
+            options={
+                'verbose_name': 'Chain Cursor',
+                'verbose_name_plural': 'Chain Cursors',
+            },
+        ),
+        migrations.CreateModel(
+            name='ChainTransfer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('tx_hash', models.CharField(max_length=255, unique=True, verbose_name='Transaction Hash')),
+                ('block_timestamp', models.BigIntegerField(db_index=True, verbose_name='Block Timestamp (ms)')),
+                ('contract', models.CharField(max_length=100, verbose_name='Token Contract')),
+                ('from_address', models.CharField(max_length=100, verbose_name='From Address')),
+                ('to_address', models.CharField(max_length=100, verbose_name='To Address')),
+                ('amount', models.DecimalField(decimal_places=6, max_digits=30, verbose_name='Amount (USDT)')),
+            ],
+            options={
+                'verbose_name': 'Chain Transfer (USDT TRC20)',
+                'verbose_name_plural': 'Chain Transfers (USDT TRC20)',
+                'ordering': ['-block_timestamp'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-16 23:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallets', '0006_chaintransfer_chaincursor'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='deposit',
+            name='transaction_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=255, null=True, verbose_name='Transaction Hash'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.0 on 2026-10-16 23:08
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicates(apps, schema_editor):
+    """Stop with a readable list instead of an IntegrityError"""
+    WalletTransaction = apps.get_model('wallets', 'WalletTransaction')
+    duplicates = list(
+        WalletTransaction.objects.filter(reference_id__gt='')
+        .values('user_id', 'transaction_type', 'reference_id')
+        .annotate(entries=Count('id'))
+        .filter(entries__gt=1)
+        .order_by('user_id')[:20]
+    )
+    if duplicates:
+        listed = '\n'.join(
+            f"  user {row['user_id']}, {row['transaction_type']} {row['reference_id']}: {row['entries']} entries"
+            for row in duplicates
+        )
+        raise RuntimeError(
+            'Duplicate wallet transactions must be resolved (and the balances '
+            f'corrected) before the unique reference constraint can be added:\n{listed}'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallets', '0007_deposit_transaction_hash_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='wallettransaction',
+            constraint=models.UniqueConstraint(condition=models.Q(('reference_id__gt', '')), fields=('user', 'transaction_type', 'reference_id'), name='wallettransaction_unique_reference'),
+        ),
+    ]
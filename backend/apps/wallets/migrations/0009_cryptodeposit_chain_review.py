@@ -0,0 +1,23 @@
+# Generated by Django 5.0 on 2026-10-16 23:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallets', '0008_wallettransaction_unique_reference'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cryptodeposit',
+            name='chain_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('confirmed', 'Confirmed on chain'), ('mismatch', 'Does not match'), ('not_found', 'Not found'), ('review', 'Needs manual review')], default='pending', max_length=20, verbose_name='Chain Status'),
+        ),
+        migrations.AlterField(
+            model_name='cryptodeposit',
+            name='from_address',
+            field=models.CharField(blank=True, help_text='Sender wallet address (required for on-chain auto-confirmation)', max_length=100, verbose_name='From Address'),
+        ),
+    ]
@@ -1,6 +1,8 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.contrib.auth import get_user_model
-from apps.core.models import TimeStampedModel
+from django.utils import timezone
+from apps.core.models import ChangeTrackingMixin, TimeStampedModel
 from decimal import Decimal
 
 User = get_user_model()
@@ -20,21 +22,31 @@ class UserWallet(TimeStampedModel):
         return f"Wallet of {self.user.email}"
 
     def add_balance(self, amount):
-        """Add balance"""
-        self.balance += Decimal(str(amount))
-        self.save()
+        """
+        Add balance (atomic UPDATE, no ledger entry).
+        Use WalletLedger.credit() for anything that must appear in the history.
+        """
+        amount = Decimal(str(amount))
+        UserWallet.objects.filter(pk=self.pk).update(balance=F('balance') + amount)
+        self.refresh_from_db(fields=['balance'])
 
     def subtract_balance(self, amount):
-        """Subtract balance"""
-        if self.balance >= Decimal(str(amount)):
-            self.balance -= Decimal(str(amount))
-            self.save()
-            return True
-        return False
+        """
+        Subtract balance if sufficient (atomic conditional UPDATE, no ledger entry).
+        Use WalletLedger.debit() for anything that must appear in the history.
+        """
+        amount = Decimal(str(amount))
+        updated = UserWallet.objects.filter(pk=self.pk, balance__gte=amount).update(
+            balance=F('balance') - amount
+        )
+        self.refresh_from_db(fields=['balance'])
+        return bool(updated)
 
 
-class Deposit(TimeStampedModel):
+class Deposit(ChangeTrackingMixin, TimeStampedModel):
     """Model for deposit transactions"""
+    tracked_fields = ('status',)
+
     STATUS_CHOICES = [
         ('pending', 'Pending'),
         ('confirmed', 'Confirmed'),
@@ -46,7 +58,8 @@ class Deposit(TimeStampedModel):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name='Status')
 
     # Transaction details
-    transaction_hash = models.CharField(max_length=255, blank=True, null=True, verbose_name='Transaction Hash')
+    transaction_hash = models.CharField(max_length=255, blank=True, null=True, db_index=True,
+                                        verbose_name='Transaction Hash')
     from_address = models.CharField(max_length=255, blank=True, null=True, verbose_name='From Address')
     to_address = models.CharField(max_length=255, blank=True, null=True, verbose_name='To Address')
 
@@ -64,6 +77,11 @@ class Deposit(TimeStampedModel):
     def __str__(self):
         return f"{self.user.email} - ${self.amount} USD - {self.status}"
 
+    def save(self, *args, **kwargs):
+        """Save in a transaction so post_save outbox events commit with the row"""
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 
 class WalletTransaction(TimeStampedModel):
     """Model for wallet transaction history"""
@@ -88,16 +106,27 @@ class WalletTransaction(TimeStampedModel):
         verbose_name = 'Wallet Transaction History'
         verbose_name_plural = 'Wallet Transaction History'
         ordering = ['-created_at']
+        constraints = [
+            # One entry per reference: an order is paid once and refunded once,
+            # a deposit credited once. Entries without a reference are exempt.
+            models.UniqueConstraint(
+                fields=['user', 'transaction_type', 'reference_id'],
+                condition=models.Q(reference_id__gt=''),
+                name='wallettransaction_unique_reference'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.email} - {self.transaction_type} - ${self.amount}"
 
 
-class CryptoDeposit(TimeStampedModel):
+class CryptoDeposit(ChangeTrackingMixin, TimeStampedModel):
     """
     Model for cryptocurrency deposits (USDT TRC20).
     Used for both: direct wallet deposits and order payments.
     """
+    tracked_fields = ('status',)
+
     STATUS_CHOICES = [
         ('pending_verification', 'Chờ xác minh'),
         ('confirmed', 'Đã xác nhận'),
@@ -131,7 +160,7 @@ class CryptoDeposit(TimeStampedModel):
         max_length=100,
         blank=True,
         verbose_name='From Address',
-        help_text='Sender wallet address (optional)'
+        help_text='Sender wallet address (required for on-chain auto-confirmation)'
     )
     to_address = models.CharField(
         max_length=100,
@@ -185,6 +214,36 @@ class CryptoDeposit(TimeStampedModel):
         help_text='Whether this deposit auto-paid the related order'
     )
 
+    # On-chain verification (apps.wallets.verification)
+    CHAIN_STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('confirmed', 'Confirmed on chain'),
+        ('mismatch', 'Does not match'),
+        ('not_found', 'Not found'),
+        ('review', 'Needs manual review'),
+    ]
+    chain_status = models.CharField(
+        max_length=20,
+        choices=CHAIN_STATUS_CHOICES,
+        default='pending',
+        verbose_name='Chain Status'
+    )
+    chain_checks = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Chain Checks'
+    )
+    chain_next_check_at = models.DateTimeField(
+        default=timezone.now,
+        null=True,
+        blank=True,
+        verbose_name='Next Chain Check'
+    )
+    chain_error = models.CharField(
+        max_length=255,
+        blank=True,
+        verbose_name='Chain Error'
+    )
+
     class Meta:
         verbose_name = 'Crypto Deposit (USDT TRC20)'
         verbose_name_plural = 'Crypto Deposits (USDT TRC20)'
@@ -192,8 +251,74 @@ class CryptoDeposit(TimeStampedModel):
         indexes = [
             models.Index(fields=['status', '-created_at']),
             models.Index(fields=['user', '-created_at']),
+            # Deposits waiting for the verification worker
+            models.Index(
+                fields=['chain_next_check_at'],
+                condition=models.Q(status='pending_verification', chain_status='pending'),
+                name='cryptodeposit_chain_pending'
+            ),
         ]
 
     def __str__(self):
         order_info = f" (Order #{self.related_order.order_id})" if self.related_order else ""
         return f"{self.user.email} - ${self.amount} USDT{order_info} - {self.get_status_display()}"
+
+    def save(self, *args, **kwargs):
+        """Save in a transaction so post_save outbox events commit with the row"""
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class ChainTransfer(TimeStampedModel):
+    """
+    Confirmed USDT TRC20 transfer to our receiving address, written by the
+    transfer indexer (apps.wallets.indexer). One row per transaction.
+    """
+    tx_hash = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='Transaction Hash'
+    )
+    block_timestamp = models.BigIntegerField(
+        db_index=True,
+        verbose_name='Block Timestamp (ms)'
+    )
+    contract = models.CharField(
+        max_length=100,
+        verbose_name='Token Contract'
+    )
+    from_address = models.CharField(
+        max_length=100,
+        verbose_name='From Address'
+    )
+    to_address = models.CharField(
+        max_length=100,
+        verbose_name='To Address'
+    )
+    amount = models.DecimalField(
+        max_digits=30,
+        decimal_places=6,
+        verbose_name='Amount (USDT)'
+    )
+
+    class Meta:
+        verbose_name = 'Chain Transfer (USDT TRC20)'
+        verbose_name_plural = 'Chain Transfers (USDT TRC20)'
+        ordering = ['-block_timestamp']
+
+    def __str__(self):
+        return f"{self.tx_hash} - {self.amount} USDT from {self.from_address}"
+
+
+class ChainCursor(models.Model):
+    """How far a chain scan has got (a block timestamp in ms)"""
+    name = models.CharField(max_length=150, unique=True, verbose_name='Name')
+    position = models.BigIntegerField(default=0, verbose_name='Position')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Updated At')
+
+    class Meta:
+        verbose_name = 'Chain Cursor'
+        verbose_name_plural = 'Chain Cursors'
+
+    def __str__(self):
+        return f"{self.name}: {self.position}"
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from apps.core.serializers import SparseFieldsetsMixin
 from .models import UserWallet, Deposit, WalletTransaction, CryptoDeposit
 
 
@@ -50,6 +51,8 @@ class CryptoDepositCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = CryptoDeposit
         fields = ['amount', 'tx_hash', 'from_address', 'related_order']
+        # The sender ties a public transaction to the user claiming it
+        extra_kwargs = {'from_address': {'required': True, 'allow_blank': False}}
 
     def validate_amount(self, value):
         if value <= 0:
@@ -72,7 +75,7 @@ class CryptoDepositCreateSerializer(serializers.ModelSerializer):
         return value
 
 
-class CryptoDepositSerializer(serializers.ModelSerializer):
+class CryptoDepositSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     """Serializer for CryptoDeposit"""
     user_email = serializers.CharField(source='user.email', read_only=True)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
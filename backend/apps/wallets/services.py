@@ -2,12 +2,163 @@
 Wallet Services
 """
 from decimal import Decimal
-from django.db import transaction
-from .models import UserWallet, WalletTransaction
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from apps.core import outbox
+from .models import CryptoDeposit, UserWallet, WalletTransaction
 import logging
 
 logger = logging.getLogger(__name__)
 
+CENT = Decimal('0.01')
+
+
+class WalletLedger:
+    """
+    Atomic balance mutations for user wallets.
+
+    Every credit/debit is a single conditional UPDATE on the wallet row
+    (``balance >= amount`` for debits), so no row lock is held across Python
+    code and concurrent payments can never lose an update. The matching
+    WalletTransaction row is written from the balance returned by that same
+    UPDATE, which keeps balance_before/balance_after exact.
+    """
+
+    @staticmethod
+    def credit(user, amount, transaction_type, description, reference_id=None):
+        """
+        Add amount to the user's wallet and record the ledger entry.
+        Creates the wallet if the user does not have one yet.
+
+        Returns:
+            WalletTransaction; if an entry with the same reference already
+            exists nothing is applied and that entry is returned
+            (``applied`` is False)
+        """
+        amount = Decimal(str(amount))
+        entry = WalletLedger._apply(user, amount, transaction_type, description, reference_id)
+        if entry is None:
+            UserWallet.objects.get_or_create(user=user)
+            entry = WalletLedger._apply(user, amount, transaction_type, description, reference_id)
+        return entry
+
+    @staticmethod
+    def debit(user, amount, transaction_type, description, reference_id=None):
+        """
+        Subtract amount from the user's wallet if the balance covers it.
+
+        Returns:
+            WalletTransaction (the existing one, ``applied`` False, if the
+            reference was already debited), or None if the balance is
+            insufficient (or the user has no wallet)
+        """
+        amount = Decimal(str(amount))
+        return WalletLedger._apply(user, -amount, transaction_type, description, reference_id)
+
+    @staticmethod
+    def find(user, transaction_type, reference_id):
+        """The entry recorded for a reference, or None (one unique index probe)"""
+        try:
+            return WalletTransaction.objects.get(
+                user=user, transaction_type=transaction_type, reference_id=reference_id
+            )
+        except WalletTransaction.DoesNotExist:
+            return None
+
+    @staticmethod
+    def _apply(user, delta, transaction_type, description, reference_id):
+        """
+        Run the conditional UPDATE and insert the ledger row.
+
+        Entries with a reference_id are inserted with ON CONFLICT DO NOTHING
+        against wallettransaction_unique_reference. When the insert is
+        skipped the savepoint is rolled back, so the balance change goes with
+        it, and the entry already recorded for the reference is returned.
+        """
+        now = timezone.now()
+        # Raw SQL: store datetimes the way the ORM does on this backend
+        stamp = connection.ops.adapt_datetimefield_value(now)
+        wallet_table = connection.ops.quote_name(UserWallet._meta.db_table)
+        tx_table = connection.ops.quote_name(WalletTransaction._meta.db_table)
+        guard = ' AND balance >= %s' if delta < 0 else ''
+        update_params = [delta, stamp, user.pk] + ([-delta] if delta < 0 else [])
+        update_sql = (
+            f'UPDATE {wallet_table} SET balance = balance + %s, updated_at = %s '
+            f'WHERE user_id = %s{guard}'
+        )
+        insert_columns = (
+            f'{tx_table} (created_at, updated_at, user_id, transaction_type, amount, '
+            f'balance_before, balance_after, description, reference_id)'
+        )
+        # Same predicate as the partial unique index, so it can be the arbiter
+        on_conflict = (
+            " ON CONFLICT (user_id, transaction_type, reference_id) WHERE reference_id > '' DO NOTHING"
+            if reference_id else ''
+        )
+
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                if connection.vendor == 'postgresql':
+                    # One statement: the CTE updates the wallet and feeds the INSERT
+                    cursor.execute(
+                        f'WITH updated AS ({update_sql} RETURNING balance) '
+                        f'INSERT INTO {insert_columns} '
+                        f'SELECT %s, %s, %s, %s, %s, balance - %s, balance, %s, %s FROM updated'
+                        f'{on_conflict} RETURNING id, balance_after',
+                        update_params + [stamp, stamp, user.pk, transaction_type, abs(delta),
+                                         delta, description, reference_id]
+                    )
+                    row = cursor.fetchone()
+                else:
+                    # Backends without data-modifying CTEs (SQLite): UPDATE ...
+                    # RETURNING followed by the INSERT
+                    if connection.features.can_return_columns_from_insert:
+                        cursor.execute(f'{update_sql} RETURNING balance', update_params)
+                        updated = cursor.fetchone()
+                    else:
+                        cursor.execute(update_sql, update_params)
+                        updated = None
+                        if cursor.rowcount:
+                            updated = UserWallet.objects.filter(user=user).values_list('balance').first()
+                    row = None
+                    if updated is not None:
+                        balance_after = Decimal(str(updated[0])).quantize(CENT)
+                        cursor.execute(
+                            f'INSERT INTO {insert_columns} VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s){on_conflict}',
+                            [stamp, stamp, user.pk, transaction_type, abs(delta),
+                             balance_after - delta, balance_after, description, reference_id]
+                        )
+                        if cursor.rowcount == 1:
+                            row = (cursor.lastrowid, balance_after)
+            if row is None:
+                # Nothing to keep: no wallet, insufficient balance or a duplicate
+                transaction.set_rollback(True)
+
+        if row is None:
+            existing = WalletLedger.find(user, transaction_type, reference_id) if reference_id else None
+            if existing is not None:
+                existing.applied = False
+            return existing
+
+        entry_id, balance_after = row
+        balance_after = Decimal(str(balance_after)).quantize(CENT)
+        entry = WalletTransaction(
+            id=entry_id,
+            created_at=now,
+            updated_at=now,
+            user=user,
+            transaction_type=transaction_type,
+            amount=abs(delta),
+            balance_before=balance_after - delta,
+            balance_after=balance_after,
+            description=description,
+            reference_id=reference_id,
+        )
+        entry.applied = True
+        return entry
+
 
 class WalletService:
     """Service for wallet operations"""
@@ -36,59 +187,283 @@ class WalletService:
             return (False, f'Order status is {order.status}. Cannot refund.', None)
 
         # Check if already refunded (idempotent check)
-        existing_refund = WalletTransaction.objects.filter(
-            user=order.user,
-            transaction_type='refund',
-            reference_id=str(order.order_id)
-        ).first()
+        existing_refund = WalletLedger.find(order.user, 'refund', str(order.order_id))
 
         if existing_refund:
             logger.info(f"Order {order.order_id} already refunded. Transaction: {existing_refund.id}")
             return (True, 'Order already refunded.', existing_refund)
 
         # Check if there was a payment transaction
-        payment_transaction = WalletTransaction.objects.filter(
-            user=order.user,
-            transaction_type='payment',
-            reference_id=str(order.order_id)
-        ).first()
+        payment_transaction = WalletLedger.find(order.user, 'payment', str(order.order_id))
 
         if not payment_transaction:
             logger.warning(f"No payment transaction found for order {order.order_id}. No refund needed.")
             return (True, 'No payment transaction found. No refund needed.', None)
 
-        # Get user wallet with lock
-        try:
-            wallet = UserWallet.objects.select_for_update().get(user=order.user)
-        except UserWallet.DoesNotExist:
-            logger.error(f"Wallet not found for user {order.user.id}")
-            return (False, 'User wallet not found.', None)
-
         # Calculate refund amount (should equal payment amount)
         refund_amount = Decimal(str(order.price))
 
-        # Record balance before refund
-        balance_before = wallet.balance
-
-        # Add refund to wallet
-        wallet.add_balance(refund_amount)
-        wallet.refresh_from_db()  # Refresh to get updated balance
-
-        # Create refund transaction record
-        refund_transaction = WalletTransaction.objects.create(
-            user=order.user,
-            transaction_type='refund',
-            amount=refund_amount,
-            balance_before=balance_before,
-            balance_after=wallet.balance,
-            description=f'Refund for order {order.order_id} - {reason}',
+        # Credit wallet and record refund transaction in one step
+        refund_transaction = WalletLedger.credit(
+            order.user,
+            refund_amount,
+            'refund',
+            f'Refund for order {order.order_id} - {reason}',
             reference_id=str(order.order_id)
         )
 
+        # A concurrent refund got there first; the unique reference kept this one out
+        if not refund_transaction.applied:
+            logger.info(f"Order {order.order_id} already refunded. Transaction: {refund_transaction.id}")
+            return (True, 'Order already refunded.', refund_transaction)
+
         logger.info(
             f"Refund successful for order {order.order_id}. "
             f"Amount: ${refund_amount}, "
-            f"Balance: ${balance_before} -> ${wallet.balance}"
+            f"Balance: ${refund_transaction.balance_before} -> ${refund_transaction.balance_after}"
         )
 
         return (True, f'Refund successful. ${refund_amount} returned to wallet.', refund_transaction)
+
+
+class CryptoDepositSettlement:
+    """
+    Confirm a batch of crypto deposits and auto-pay their related orders.
+
+    Deposits are settled in chunks of DEPOSIT_SETTLEMENT_CHUNK_SIZE, each in
+    its own transaction. Within a chunk every wallet involved is locked
+    once, balances are worked out in Python, and the results are written
+    set-based: one UPDATE per table (bulk_update / conditional UPDATE) and
+    one INSERT each for ledger entries, order status logs and outbox events.
+    A deposit whose order is still pending_payment, not yet paid by another
+    deposit and covered by the wallet balance pays for that order.
+
+    Wallets are locked before orders, the same order pay_from_wallet takes
+    them in (ledger UPDATE, then the order's conditional UPDATE), so the two
+    cannot deadlock. Ledger references that already exist are left out of
+    the INSERT (wallettransaction_unique_reference): a deposit already
+    credited is skipped and left pending for an admin, an order with a
+    payment entry counts as already paid.
+    """
+
+    # Per-deposit outcomes
+    CONFIRMED = 'confirmed'
+    AUTO_PAID = 'auto_paid'
+    ALREADY_PAID = 'already_paid'
+    INSUFFICIENT = 'insufficient'
+    ORDER_NOT_PENDING = 'order_not_pending'
+    ORDER_MISSING = 'order_missing'
+    ALREADY_CREDITED = 'already_credited'  # skipped: the deposit's ledger credit exists
+
+    @staticmethod
+    def confirm(deposit_ids, verified_by=None, chunk_size=None):
+        """
+        Confirm the pending_verification deposits among deposit_ids.
+        Deposits that are no longer pending are ignored.
+
+        Returns:
+            list: (deposit, outcome, order) tuples, order None if the deposit has none
+        """
+        chunk_size = chunk_size or getattr(settings, 'DEPOSIT_SETTLEMENT_CHUNK_SIZE', 100)
+
+        # Group each user's deposits together so they usually share a chunk
+        ids = list(
+            CryptoDeposit.objects.filter(id__in=deposit_ids, status='pending_verification')
+            .order_by('user_id', 'id')
+            .values_list('id', flat=True)
+        )
+
+        results = []
+        for start in range(0, len(ids), chunk_size):
+            results.extend(CryptoDepositSettlement._confirm_chunk(ids[start:start + chunk_size], verified_by))
+        return results
+
+    @staticmethod
+    def _confirm_chunk(ids, verified_by):
+        # apps.orders.services imports this module
+        from apps.orders.models import Order, OrderStatusLog
+
+        S = CryptoDepositSettlement
+        now = timezone.now()
+
+        with transaction.atomic():
+            deposits = list(
+                CryptoDeposit.objects.select_for_update()
+                .filter(id__in=ids, status='pending_verification')
+                .order_by('user_id', 'id')
+            )
+            if not deposits:
+                return []
+
+            order_ids = {d.related_order_id for d in deposits if d.related_order_id}
+            # Wallets first (an order's owner never changes, so it is read unlocked)
+            order_users = set(Order.objects.filter(id__in=order_ids).values_list('user_id', flat=True))
+            wallets = S._lock_wallets({d.user_id for d in deposits} | order_users)
+            balances = {user_id: wallet.balance for user_id, wallet in wallets.items()}
+
+            orders = {
+                order.pk: order
+                for order in Order.objects.select_for_update().filter(id__in=order_ids).order_by('id')
+            }
+            # Orders some other deposit has already been confirmed for
+            paid_orders = set(
+                CryptoDeposit.objects.filter(related_order_id__in=order_ids, status='confirmed')
+                .values_list('related_order_id', flat=True)
+            )
+            credited, paid_orders_entries = S._existing_references(deposits, orders.values())
+
+            entries = []
+            status_logs = []
+            events = []
+            results = []
+            paid = []
+
+            for deposit in deposits:
+                if (deposit.user_id, S._reference(deposit)) in credited:
+                    results.append((deposit, S.ALREADY_CREDITED, None))
+                    logger.warning(
+                        f"Crypto deposit {deposit.pk} skipped: ledger entry {S._reference(deposit)} already exists"
+                    )
+                    continue
+
+                # Credit the deposit
+                before = balances[deposit.user_id]
+                balances[deposit.user_id] = before + deposit.amount
+                entries.append(WalletTransaction(
+                    user_id=deposit.user_id,
+                    transaction_type='deposit',
+                    amount=deposit.amount,
+                    balance_before=before,
+                    balance_after=balances[deposit.user_id],
+                    description=f'Crypto deposit confirmed: ${deposit.amount} USDT',
+                    reference_id=S._reference(deposit),
+                ))
+                deposit.status = 'confirmed'
+                deposit.verified_by = verified_by
+                deposit.verified_at = now
+                deposit.updated_at = now
+                events.append(('crypto_deposit.status_changed', {
+                    'deposit_id': deposit.pk,
+                    'old_status': 'pending_verification',
+                    'new_status': 'confirmed',
+                }))
+
+                if not deposit.related_order_id:
+                    results.append((deposit, S.CONFIRMED, None))
+                    continue
+
+                order = orders.get(deposit.related_order_id)
+                if order is None:
+                    results.append((deposit, S.ORDER_MISSING, None))
+                    continue
+                if order.status != 'pending_payment':
+                    results.append((deposit, S.ORDER_NOT_PENDING, order))
+                    continue
+                if order.pk in paid_orders or (order.user_id, str(order.order_id)) in paid_orders_entries:
+                    results.append((deposit, S.ALREADY_PAID, order))
+                    continue
+                # A confirmed deposit marks its order as paid for, as in the single-deposit flow
+                paid_orders.add(order.pk)
+
+                # Debit the order total from the owner's wallet if it covers it
+                total = order.total_amount
+                before = balances[order.user_id]
+                if before < total:
+                    results.append((deposit, S.INSUFFICIENT, order))
+                    continue
+                balances[order.user_id] = before - total
+                entries.append(WalletTransaction(
+                    user_id=order.user_id,
+                    transaction_type='payment',
+                    amount=total,
+                    balance_before=before,
+                    balance_after=balances[order.user_id],
+                    description=f'Auto-payment for Order #{order.order_id}',
+                    reference_id=str(order.order_id),
+                ))
+                status_logs.append(OrderStatusLog(
+                    order_id=order.pk,
+                    old_status='pending_payment',
+                    new_status='paid',
+                    changed_by=verified_by,
+                    note=f'Auto-paid via crypto deposit #{deposit.id}'
+                ))
+                events.append(('order.status_changed', {
+                    'order_id': order.pk,
+                    'old_status': 'pending_payment',
+                    'new_status': 'paid',
+                }))
+                order.status = 'paid'
+                order.payment_method = 'crypto'
+                deposit.auto_paid_order = True
+                paid.append(order.pk)
+                results.append((deposit, S.AUTO_PAID, order))
+
+            for user_id, wallet in wallets.items():
+                wallet.balance = balances[user_id]
+                wallet.updated_at = now
+            UserWallet.objects.bulk_update(wallets.values(), ['balance', 'updated_at'])
+            CryptoDeposit.objects.bulk_update(
+                [deposit for deposit in deposits if deposit.status == 'confirmed'],
+                ['status', 'verified_by', 'verified_at', 'auto_paid_order', 'updated_at']
+            )
+            if paid:
+                # Orders are locked above, so every one of them is still pending_payment
+                Order.objects.filter(id__in=paid, status='pending_payment').update(
+                    status='paid',
+                    payment_method='crypto',
+                    updated_at=now
+                )
+            WalletTransaction.objects.bulk_create(entries)
+            OrderStatusLog.objects.bulk_create(status_logs)
+            outbox.publish_many(events)
+
+        logger.info(
+            f"Settled {len(deposits)} crypto deposits for {len(wallets)} wallets, "
+            f"{len(paid)} orders auto-paid"
+        )
+        return results
+
+    @staticmethod
+    def _reference(deposit):
+        """reference_id of a crypto deposit's ledger credit"""
+        return f'crypto_deposit_{deposit.id}'
+
+    @staticmethod
+    def _existing_references(deposits, orders):
+        """
+        Ledger entries the chunk would duplicate, in one query.
+
+        Returns:
+            tuple: {(user_id, reference_id)} of deposit credits and of order payments
+        """
+        deposit_refs = [CryptoDepositSettlement._reference(deposit) for deposit in deposits]
+        order_refs = [str(order.order_id) for order in orders]
+        credited, payments = set(), set()
+        for user_id, transaction_type, reference_id in WalletTransaction.objects.filter(
+            Q(transaction_type='deposit', reference_id__in=deposit_refs)
+            | Q(transaction_type='payment', reference_id__in=order_refs)
+        ).values_list('user_id', 'transaction_type', 'reference_id'):
+            (credited if transaction_type == 'deposit' else payments).add((user_id, reference_id))
+        return credited, payments
+
+    @staticmethod
+    def _lock_wallets(user_ids):
+        """{user_id: UserWallet} locked for update, creating missing wallets"""
+        def lock():
+            return {
+                wallet.user_id: wallet
+                for wallet in UserWallet.objects.select_for_update()
+                .filter(user_id__in=user_ids)
+                .order_by('user_id')
+            }
+
+        wallets = lock()
+        missing = set(user_ids) - set(wallets)
+        if missing:
+            UserWallet.objects.bulk_create(
+                [UserWallet(user_id=user_id) for user_id in missing],
+                ignore_conflicts=True
+            )
+            wallets = lock()
+        return wallets
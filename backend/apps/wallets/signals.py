@@ -1,7 +1,8 @@
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
-from .models import UserWallet
+from apps.core import outbox
+from .models import UserWallet, Deposit, CryptoDeposit
 
 User = get_user_model()
 
@@ -11,3 +12,29 @@ def create_user_wallet(sender, instance, created, **kwargs):
     """Create wallet when user is created"""
     if created:
         UserWallet.objects.create(user=instance)
+
+
+@receiver(post_save, sender=Deposit)
+def publish_deposit_status_change(sender, instance, created, **kwargs):
+    """Write deposit.status_changed event in the saving transaction"""
+    old_status = instance.get_previous_value('status')
+    if not created and old_status and old_status != instance.status:
+        outbox.publish(
+            'deposit.status_changed',
+            deposit_id=instance.pk,
+            old_status=old_status,
+            new_status=instance.status
+        )
+
+
+@receiver(post_save, sender=CryptoDeposit)
+def publish_crypto_deposit_status_change(sender, instance, created, **kwargs):
+    """Write crypto_deposit.status_changed event in the saving transaction"""
+    old_status = instance.get_previous_value('status')
+    if not created and old_status and old_status != instance.status:
+        outbox.publish(
+            'crypto_deposit.status_changed',
+            deposit_id=instance.pk,
+            old_status=old_status,
+            new_status=instance.status
+        )
@@ -0,0 +1,55 @@
+from celery import shared_task
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(name='wallets.verify_crypto_deposits')
+def verify_crypto_deposits(batch_size=None, max_batches=20):
+    """
+    Index new transfers to the receiving address and settle the deposits
+    they match (see apps.wallets.indexer), then look the remaining due
+    deposits up one by one (see apps.wallets.verification).
+
+    This task should be scheduled via Celery Beat.
+    """
+    from django.core.cache import cache
+    from django.conf import settings
+    from . import chain, indexer, verification
+
+    if not getattr(settings, 'TRON_VERIFY_ENABLED', True):
+        return {'status': 'skipped', 'reason': 'disabled'}
+
+    # Lookups run without row locks: one verification at a time
+    lock_key = 'wallets:verification:running'
+    if not cache.add(lock_key, True, timeout=getattr(settings, 'TRON_VERIFY_LOCK_TIMEOUT', 300)):
+        return {'status': 'skipped', 'reason': 'already_running'}
+
+    totals = {'indexed': 0, 'confirmed': 0, 'retried': 0, 'mismatched': 0, 'review': 0, 'not_found': 0}
+    try:
+        if indexer.is_enabled():
+            # Catch up first (a backfill after downtime takes several runs of sync)
+            try:
+                for _ in range(max_batches):
+                    result = indexer.sync()
+                    totals['indexed'] += result['fetched']
+                    if result['complete']:
+                        break
+            except chain.ChainError as e:
+                # Whatever was indexed is kept; the next run resumes from the cursor
+                logger.warning(f"Transfer indexing stopped: {e}")
+            for key, value in indexer.match().items():
+                totals[key] += value
+
+        for _ in range(max_batches):
+            result = verification.verify(batch_size=batch_size)
+            for key, value in result.items():
+                totals[key] += value
+            if not any(result.values()):
+                break
+    finally:
+        cache.delete(lock_key)
+
+    if any(totals.values()):
+        logger.info(f"Crypto deposit verification: {totals}")
+    return totals
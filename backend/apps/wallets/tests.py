@@ -0,0 +1,653 @@
+import asyncio
+import csv
+import io
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.games.models import Game
+from apps.orders.models import Order
+from apps.orders.services import OrderStateMachine, OrderStatusConflict
+from apps.users.models import User
+from . import chain, indexer, reconciliation, verification
+from .models import ChainTransfer, CryptoDeposit, Deposit, UserWallet, WalletTransaction
+from .services import CryptoDepositSettlement, WalletLedger, WalletService
+
+ADMIN_ADDRESS = 'TAdminReceivingAddress00000000000'
+OTHER_ADDRESS = 'TSomeoneElsesAddress0000000000000'
+SENDER = 'TSenderAddress000000000000000000'
+CLAIMANT = 'TClaimantAddress0000000000000000'
+USDT = 'TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t'
+
+
+class FakeTronClient:
+    """
+    Chain client (TRON_CHAIN_CLIENT) answering from class-level data:
+    receipts by tx hash (a ChainError instance is raised) and indexed transfers.
+    """
+    receipts = {}
+    transfers = []
+    requests = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def get_receipt(self, tx_hash):
+        self.requests.append(tx_hash)
+        receipt = self.receipts.get(tx_hash)
+        if isinstance(receipt, chain.ChainError):
+            raise receipt
+        return receipt
+
+    async def get_transfers(self, address, contract, min_timestamp, fingerprint=None):
+        return [
+            transfer for transfer in self.transfers
+            if transfer['to'] == address and transfer['timestamp'] >= min_timestamp
+        ], None
+
+    @classmethod
+    def reset(cls):
+        cls.receipts, cls.transfers, cls.requests = {}, [], []
+        chain.receipt_cache.clear()
+
+
+def usdt_receipt(tx_hash, amount, to=ADMIN_ADDRESS, success=True):
+    return {
+        'tx_hash': tx_hash,
+        'success': success,
+        'block': 1,
+        'transfers': [{'contract': USDT, 'from': SENDER, 'to': to, 'value': int(Decimal(amount) * 10 ** 6)}],
+    }
+
+
+class WalletLedgerTests(TestCase):
+    """Credits and debits run on the test database through the raw conditional UPDATE"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='holder', email='holder@example.com', password='pass12345')
+
+    def balance(self):
+        return UserWallet.objects.get(user=self.user).balance
+
+    def test_credit_creates_the_wallet_and_records_the_entry(self):
+        entry = WalletLedger.credit(self.user, '12.50', 'deposit', 'Top up')
+
+        self.assertTrue(entry.applied)
+        self.assertEqual((entry.balance_before, entry.balance_after), (Decimal('0'), Decimal('12.50')))
+        self.assertEqual(self.balance(), Decimal('12.50'))
+        stored = WalletTransaction.objects.get(pk=entry.pk)
+        self.assertEqual(
+            (stored.transaction_type, stored.amount, stored.balance_before, stored.balance_after),
+            ('deposit', Decimal('12.50'), Decimal('0'), Decimal('12.50'))
+        )
+        self.assertIsNotNone(stored.created_at)
+
+    def test_debit(self):
+        WalletLedger.credit(self.user, 20, 'deposit', 'Top up')
+
+        entry = WalletLedger.debit(self.user, '7.25', 'payment', 'Order')
+
+        self.assertEqual((entry.amount, entry.balance_before, entry.balance_after),
+                         (Decimal('7.25'), Decimal('20'), Decimal('12.75')))
+        self.assertEqual(self.balance(), Decimal('12.75'))
+
+    def test_insufficient_balance_returns_none(self):
+        WalletLedger.credit(self.user, 5, 'deposit', 'Top up')
+
+        self.assertIsNone(WalletLedger.debit(self.user, '5.01', 'payment', 'Order'))
+        self.assertEqual(self.balance(), Decimal('5'))
+        self.assertEqual(WalletTransaction.objects.filter(user=self.user).count(), 1)
+
+        # The whole balance can be spent
+        self.assertIsNotNone(WalletLedger.debit(self.user, 5, 'payment', 'Order'))
+        self.assertEqual(self.balance(), Decimal('0'))
+
+    def test_debit_without_a_wallet_returns_none(self):
+        UserWallet.objects.filter(user=self.user).delete()
+
+        self.assertIsNone(WalletLedger.debit(self.user, 1, 'payment', 'Order'))
+        self.assertFalse(WalletTransaction.objects.filter(user=self.user).exists())
+
+    def test_debit_reads_the_balance_from_the_row_not_the_instance(self):
+        WalletLedger.credit(self.user, 10, 'deposit', 'Top up')
+        stale = UserWallet.objects.get(user=self.user)
+        WalletLedger.debit(self.user, 8, 'payment', 'Elsewhere')
+
+        self.assertEqual(stale.balance, Decimal('10'))
+        self.assertIsNone(WalletLedger.debit(self.user, 8, 'payment', 'Order'))
+        self.assertEqual(self.balance(), Decimal('2'))
+
+    def test_balance_after_chain(self):
+        for amount in ('10', '-3', '4.5', '-11.5', '0.01'):
+            if amount.startswith('-'):
+                WalletLedger.debit(self.user, amount[1:], 'payment', 'Order')
+            else:
+                WalletLedger.credit(self.user, amount, 'deposit', 'Top up')
+
+        entries = list(WalletTransaction.objects.filter(user=self.user).order_by('id'))
+        self.assertEqual(len(entries), 5)
+        self.assertEqual(entries[0].balance_before, Decimal('0'))
+        for previous, entry in zip(entries, entries[1:]):
+            self.assertEqual(entry.balance_before, previous.balance_after)
+        for entry in entries:
+            sign = -1 if entry.transaction_type == 'payment' else 1
+            self.assertEqual(entry.balance_after - entry.balance_before, sign * entry.amount)
+        self.assertEqual(entries[-1].balance_after, self.balance())
+        self.assertEqual(self.balance(), Decimal('0.01'))
+
+
+class WalletLedgerReferenceTests(TestCase):
+    """An entry with a reference is applied once (wallettransaction_unique_reference)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='holder', email='holder@example.com', password='pass12345')
+        cls.game = Game.objects.create(name='Game', slug='game', description='Game')
+
+    def setUp(self):
+        patcher = mock.patch('apps.core.outbox.schedule_relay')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def balance(self):
+        return UserWallet.objects.get(user=self.user).balance
+
+    def test_repeated_reference_is_not_applied(self):
+        first = WalletLedger.credit(self.user, 10, 'deposit', 'Top up', reference_id='crypto_deposit_1')
+        again = WalletLedger.credit(self.user, 10, 'deposit', 'Top up', reference_id='crypto_deposit_1')
+
+        self.assertTrue(first.applied)
+        self.assertFalse(again.applied)
+        self.assertEqual(again.pk, first.pk)
+        self.assertEqual(self.balance(), Decimal('10'))
+
+        WalletLedger.debit(self.user, 4, 'payment', 'Order', reference_id='GT-000001')
+        repeated = WalletLedger.debit(self.user, 4, 'payment', 'Order', reference_id='GT-000001')
+        self.assertFalse(repeated.applied)
+        self.assertEqual(self.balance(), Decimal('6'))
+        self.assertEqual(WalletTransaction.objects.filter(user=self.user).count(), 2)
+
+    def test_same_reference_with_another_type_is_applied(self):
+        WalletLedger.credit(self.user, 10, 'deposit', 'Top up')
+        WalletLedger.debit(self.user, 4, 'payment', 'Order', reference_id='GT-000001')
+
+        refund = WalletLedger.credit(self.user, 4, 'refund', 'Refund', reference_id='GT-000001')
+
+        self.assertTrue(refund.applied)
+        self.assertEqual(self.balance(), Decimal('10'))
+
+    def test_entries_without_a_reference_never_conflict(self):
+        for reference_id in (None, None, '', ''):
+            entry = WalletLedger.credit(self.user, 1, 'bonus', 'Bonus', reference_id=reference_id)
+            self.assertTrue(entry.applied)
+
+        self.assertEqual(self.balance(), Decimal('4'))
+        self.assertEqual(WalletTransaction.objects.filter(user=self.user, transaction_type='bonus').count(), 4)
+
+    def paid_order(self):
+        WalletLedger.credit(self.user, 25, 'deposit', 'Top up')
+        order = Order.objects.create(user=self.user, game=self.game, game_uid='1', price=Decimal('10'))
+        OrderStateMachine.pay_from_wallet(order, 'wallet', 'Payment')
+        return order
+
+    def test_second_wallet_payment_is_rejected(self):
+        order = self.paid_order()
+        # A stale instance that still thinks the order is unpaid
+        Order.objects.filter(pk=order.pk).update(status='pending_payment')
+
+        with self.assertRaises(OrderStatusConflict):
+            OrderStateMachine.pay_from_wallet(order, 'wallet', 'Payment')
+
+        self.assertEqual(self.balance(), Decimal('15'))
+        self.assertEqual(WalletTransaction.objects.filter(user=self.user, transaction_type='payment').count(), 1)
+
+    def test_second_refund_is_not_applied(self):
+        order = self.paid_order()
+        Order.objects.filter(pk=order.pk).update(status='canceled')
+        order.refresh_from_db()
+
+        success, _, refund = WalletService.refund_order_payment(order)
+        self.assertTrue(success and refund.applied)
+
+        success, message, again = WalletService.refund_order_payment(order)
+        self.assertTrue(success)
+        self.assertEqual((message, again.pk), ('Order already refunded.', refund.pk))
+        self.assertEqual(self.balance(), Decimal('25'))
+
+    def test_concurrent_refund_is_stopped_by_the_reference(self):
+        order = self.paid_order()
+        Order.objects.filter(pk=order.pk).update(status='canceled')
+        order.refresh_from_db()
+        WalletService.refund_order_payment(order)
+
+        find = WalletLedger.find
+        missed = []
+
+        def missed_refund(user, transaction_type, reference_id):
+            if transaction_type == 'refund' and not missed:
+                missed.append(reference_id)
+                return None
+            return find(user, transaction_type, reference_id)
+
+        # The other refund committed after this one looked: only the insert can catch it
+        with mock.patch.object(WalletLedger, 'find', side_effect=missed_refund):
+            success, message, refund = WalletService.refund_order_payment(order)
+
+        self.assertTrue(success)
+        self.assertEqual(message, 'Order already refunded.')
+        self.assertFalse(refund.applied)
+        self.assertEqual(self.balance(), Decimal('25'))
+        self.assertEqual(WalletTransaction.objects.filter(user=self.user, transaction_type='refund').count(), 1)
+
+
+class WalletLedgerConcurrencyTests(TransactionTestCase):
+    """Debits racing on one wallet from separate connections"""
+
+    def test_concurrent_debits_never_overdraw(self):
+        user = User.objects.create_user(username='racer', email='racer@example.com', password='pass12345')
+        WalletLedger.credit(user, 50, 'deposit', 'Top up')
+        barrier = threading.Barrier(10)
+        results, errors = [], []
+
+        def pay(i):
+            try:
+                barrier.wait()
+                while True:
+                    try:
+                        results.append(
+                            WalletLedger.debit(user, 10, 'payment', f'Order {i}', reference_id=f'order-{i}')
+                        )
+                        break
+                    except OperationalError as e:
+                        # SQLite's shared-cache test database reports lock
+                        # contention instead of waiting like a busy timeout
+                        if connection.vendor != 'sqlite' or 'locked' not in str(e):
+                            raise
+                        time.sleep(0.001)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=pay, args=(i,)) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sum(entry is not None for entry in results), 5)
+        self.assertEqual(UserWallet.objects.get(user=user).balance, Decimal('0'))
+        payments = WalletTransaction.objects.filter(user=user, transaction_type='payment')
+        self.assertEqual(
+            sorted(payments.values_list('balance_after', flat=True)),
+            [Decimal('0'), Decimal('10'), Decimal('20'), Decimal('30'), Decimal('40')]
+        )
+
+
+class CryptoDepositSettlementTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.game = Game.objects.create(name='Game', slug='game', description='Game')
+        cls.users = [
+            User.objects.create_user(username=f'user{i}', email=f'user{i}@example.com', password='pass12345')
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        patcher = mock.patch('apps.core.outbox.schedule_relay')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def deposit(self, user, amount, order=None, tx_hash=None):
+        return CryptoDeposit.objects.create(
+            user=user, amount=Decimal(amount), tx_hash=tx_hash or f'hash-{CryptoDeposit.objects.count()}',
+            to_address='TAddress', related_order=order
+        )
+
+    def balance(self, user):
+        return UserWallet.objects.get(user=user).balance
+
+    def test_chunk_credits_and_auto_pays(self):
+        order = Order.objects.create(user=self.users[0], game=self.game, game_uid='1', price=Decimal('10'))
+        deposits = [self.deposit(self.users[0], '15', order), self.deposit(self.users[1], '5')]
+
+        results = CryptoDepositSettlement.confirm([d.pk for d in deposits])
+
+        self.assertEqual(
+            [outcome for _, outcome, _ in results],
+            [CryptoDepositSettlement.AUTO_PAID, CryptoDepositSettlement.CONFIRMED]
+        )
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'paid')
+        self.assertEqual(self.balance(self.users[0]), Decimal('5'))
+        self.assertEqual(self.balance(self.users[1]), Decimal('5'))
+
+    def test_already_credited_deposit_is_skipped_without_failing_the_chunk(self):
+        credited = self.deposit(self.users[0], '20')
+        others = [self.deposit(self.users[1], '5'), self.deposit(self.users[2], '7')]
+        # Confirmed once, then moved back to pending_verification in the admin
+        CryptoDepositSettlement.confirm([credited.pk])
+        CryptoDeposit.objects.filter(pk=credited.pk).update(status='pending_verification')
+
+        results = CryptoDepositSettlement.confirm([credited.pk] + [d.pk for d in others])
+
+        outcomes = {deposit.pk: outcome for deposit, outcome, _ in results}
+        self.assertEqual(outcomes[credited.pk], CryptoDepositSettlement.ALREADY_CREDITED)
+        self.assertEqual({outcomes[d.pk] for d in others}, {CryptoDepositSettlement.CONFIRMED})
+        # Not credited twice and left for review; the rest of the chunk went through
+        self.assertEqual(self.balance(self.users[0]), Decimal('20'))
+        self.assertEqual(CryptoDeposit.objects.get(pk=credited.pk).status, 'pending_verification')
+        self.assertEqual(self.balance(self.users[1]), Decimal('5'))
+        self.assertEqual(CryptoDeposit.objects.filter(status='confirmed').count(), 2)
+
+    def test_order_with_a_payment_entry_counts_as_paid(self):
+        order = Order.objects.create(user=self.users[0], game=self.game, game_uid='1', price=Decimal('10'))
+        WalletLedger.credit(self.users[0], 10, 'deposit', 'Top up')
+        WalletLedger.debit(self.users[0], 10, 'payment', 'Paid elsewhere', reference_id=str(order.order_id))
+        deposit = self.deposit(self.users[0], '10', order)
+
+        [(_, outcome, _)] = CryptoDepositSettlement.confirm([deposit.pk])
+
+        self.assertEqual(outcome, CryptoDepositSettlement.ALREADY_PAID)
+        self.assertEqual(self.balance(self.users[0]), Decimal('10'))
+        self.assertEqual(
+            WalletTransaction.objects.filter(transaction_type='payment', reference_id=str(order.order_id)).count(), 1
+        )
+
+
+@override_settings(
+    TRON_CHAIN_CLIENT='apps.wallets.tests.FakeTronClient',
+    ADMIN_USDT_TRC20_ADDRESS=ADMIN_ADDRESS,
+    TRON_USDT_CONTRACT=USDT,
+    TRON_VERIFY_RETRY_DELAY=60,
+    TRON_VERIFY_MAX_CHECKS=3,
+)
+class ChainVerificationTests(TestCase):
+    """verify() and the indexer end to end against a fake TRON node client"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='payer', email='payer@example.com', password='pass12345')
+
+    def setUp(self):
+        FakeTronClient.reset()
+        patcher = mock.patch('apps.core.outbox.schedule_relay')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def deposit(self, tx_hash, amount, to_address=ADMIN_ADDRESS, from_address=SENDER):
+        return CryptoDeposit.objects.create(
+            user=self.user, amount=Decimal(amount), tx_hash=tx_hash,
+            from_address=from_address, to_address=to_address
+        )
+
+    def test_matching_transfer_settles_the_deposit(self):
+        deposit = self.deposit('tx-ok', '25')
+        FakeTronClient.receipts['tx-ok'] = usdt_receipt('tx-ok', '25')
+
+        self.assertEqual(
+            verification.verify(),
+            {'confirmed': 1, 'retried': 0, 'mismatched': 0, 'review': 0, 'not_found': 0}
+        )
+
+        deposit.refresh_from_db()
+        self.assertEqual((deposit.status, deposit.chain_status), ('confirmed', 'confirmed'))
+        self.assertEqual(UserWallet.objects.get(user=self.user).balance, Decimal('25'))
+
+    def test_transfer_to_an_edited_to_address_is_not_settled(self):
+        # to_address was changed on the row to where the money actually went
+        deposit = self.deposit('tx-other', '25', to_address=OTHER_ADDRESS)
+        FakeTronClient.receipts['tx-other'] = usdt_receipt('tx-other', '25', to=OTHER_ADDRESS)
+
+        self.assertEqual(verification.verify()['mismatched'], 1)
+
+        deposit.refresh_from_db()
+        self.assertEqual((deposit.status, deposit.chain_status), ('pending_verification', 'mismatch'))
+        self.assertIn(ADMIN_ADDRESS, deposit.chain_error)
+        self.assertFalse(WalletTransaction.objects.filter(user=self.user).exists())
+
+    def test_someone_elses_transfer_is_not_credited(self):
+        # A public tx_hash to our address, claimed by a user who did not send it
+        deposit = self.deposit('tx-copied', '25', from_address=CLAIMANT)
+        FakeTronClient.receipts['tx-copied'] = usdt_receipt('tx-copied', '25')
+
+        self.assertEqual(verification.verify()['mismatched'], 1)
+
+        deposit.refresh_from_db()
+        self.assertEqual((deposit.status, deposit.chain_status), ('pending_verification', 'mismatch'))
+        self.assertIn(CLAIMANT, deposit.chain_error)
+        self.assertFalse(WalletTransaction.objects.filter(user=self.user).exists())
+
+    def test_deposit_without_sender_goes_to_manual_review(self):
+        deposit = self.deposit('tx-anonymous', '25', from_address='')
+        FakeTronClient.receipts['tx-anonymous'] = usdt_receipt('tx-anonymous', '25')
+
+        self.assertEqual(verification.verify()['review'], 1)
+
+        deposit.refresh_from_db()
+        self.assertEqual((deposit.status, deposit.chain_status), ('pending_verification', 'review'))
+        self.assertIsNone(deposit.chain_next_check_at)
+        self.assertFalse(WalletTransaction.objects.filter(user=self.user).exists())
+
+    def test_sender_address_is_required_on_submission(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = reverse('wallets:crypto_deposit_create')
+
+        response = client.post(url, {'amount': '25', 'tx_hash': 'tx-new'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('from_address', response.data)
+
+        response = client.post(url, {'amount': '25', 'tx_hash': 'tx-new', 'from_address': SENDER})
+        self.assertEqual(response.status_code, 201)
+
+    def test_short_or_failed_transfers_are_mismatches(self):
+        self.deposit('tx-short', '25')
+        self.deposit('tx-failed', '25')
+        FakeTronClient.receipts['tx-short'] = usdt_receipt('tx-short', '24.5')
+        FakeTronClient.receipts['tx-failed'] = usdt_receipt('tx-failed', '25', success=False)
+
+        self.assertEqual(verification.verify()['mismatched'], 2)
+        self.assertEqual(CryptoDeposit.objects.filter(chain_status='mismatch').count(), 2)
+
+    def test_unknown_transaction_is_retried_with_backoff(self):
+        deposit = self.deposit('tx-later', '10')
+        FakeTronClient.receipts['tx-later'] = chain.ChainError('node unavailable')
+
+        before = timezone.now()
+        self.assertEqual(verification.verify()['retried'], 1)
+        deposit.refresh_from_db()
+        self.assertEqual((deposit.chain_checks, deposit.chain_error), (1, 'node unavailable'))
+        self.assertGreaterEqual(deposit.chain_next_check_at, before + timedelta(seconds=60))
+
+        # Not due again until the backoff passes
+        self.assertFalse(any(verification.verify().values()))
+
+        # Second check waits twice as long; the third gives up
+        del FakeTronClient.receipts['tx-later']
+        CryptoDeposit.objects.filter(pk=deposit.pk).update(chain_next_check_at=timezone.now())
+        before = timezone.now()
+        verification.verify()
+        deposit.refresh_from_db()
+        self.assertGreaterEqual(deposit.chain_next_check_at, before + timedelta(seconds=120))
+
+        CryptoDeposit.objects.filter(pk=deposit.pk).update(chain_next_check_at=timezone.now())
+        self.assertEqual(verification.verify()['not_found'], 1)
+        deposit.refresh_from_db()
+        self.assertEqual((deposit.chain_status, deposit.chain_next_check_at), ('not_found', None))
+
+    def test_solidified_receipts_are_cached(self):
+        FakeTronClient.receipts['tx-cached'] = usdt_receipt('tx-cached', '10')
+
+        for _ in range(2):
+            receipts = asyncio.run(chain.fetch_receipts(['tx-cached', 'tx-unknown']))
+        self.assertEqual(receipts['tx-cached']['tx_hash'], 'tx-cached')
+        self.assertIsNone(receipts['tx-unknown'])
+        # Unknown hashes are asked again, solidified ones are not
+        self.assertEqual(sorted(FakeTronClient.requests), ['tx-cached', 'tx-unknown', 'tx-unknown'])
+
+    def test_indexed_transfers_settle_without_lookups(self):
+        deposit = self.deposit('tx-indexed', '40')
+        ignored = self.deposit('tx-elsewhere', '40')
+        now_ms = int(timezone.now().timestamp() * 1000)
+        FakeTronClient.transfers = [
+            {'tx_hash': 'tx-indexed', 'timestamp': now_ms, 'contract': USDT,
+             'from': SENDER, 'to': ADMIN_ADDRESS, 'value': 40 * 10 ** 6},
+            {'tx_hash': 'tx-elsewhere', 'timestamp': now_ms, 'contract': USDT,
+             'from': SENDER, 'to': OTHER_ADDRESS, 'value': 40 * 10 ** 6},
+        ]
+
+        self.assertEqual(indexer.sync(), {'fetched': 1, 'complete': True})
+        self.assertEqual(indexer.match(), {'confirmed': 1, 'mismatched': 0, 'review': 0})
+
+        deposit.refresh_from_db()
+        ignored.refresh_from_db()
+        self.assertEqual(deposit.status, 'confirmed')
+        self.assertEqual(ignored.status, 'pending_verification')
+        self.assertEqual(list(ChainTransfer.objects.values_list('tx_hash', flat=True)), ['tx-indexed'])
+        self.assertEqual(FakeTronClient.requests, [])
+
+
+
+STATEMENT = """\ufeffTxid,Block,From,To,Amount USDT
+tx-match,1,TFrom,TTo,25
+tx-short,2,TFrom,TTo,"1,250.50"
+tx-legacy,3,TFrom,TTo,$10
+
+tx-unknown,4,TFrom,TTo,5
+tx-garbled,5,TFrom,TTo,abc
+,6,TFrom,TTo,7
+tx-cut,7
+"""
+
+
+class StatementReconciliationTests(TestCase):
+    """Statements matched against CryptoDeposit and Deposit rows by hash"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_superuser(username='admin', email='admin@example.com', password='pass12345')
+        for tx_hash, amount in (('tx-match', '25'), ('tx-short', '1250'), ('tx-garbled', '3'), ('tx-cut', '1')):
+            CryptoDeposit.objects.create(user=cls.staff, amount=Decimal(amount), tx_hash=tx_hash, to_address='TTo')
+        Deposit.objects.create(user=cls.staff, amount=Decimal('10'), transaction_hash='tx-legacy')
+
+    def reconcile(self, text, **kwargs):
+        rows = reconciliation.read_statement(io.StringIO(text.lstrip('\ufeff'), newline=''))
+        return {row['tx_hash']: (line, result, record and record[0])
+                for line, result, row, record in reconciliation.reconcile(rows, **kwargs)}
+
+    def test_rows_are_matched_by_hash_and_amount(self):
+        results = self.reconcile(STATEMENT)
+
+        self.assertEqual(results, {
+            'tx-match': (2, reconciliation.MATCHED, 'crypto_deposit'),
+            'tx-short': (3, reconciliation.AMOUNT_MISMATCH, 'crypto_deposit'),
+            'tx-legacy': (4, reconciliation.MATCHED, 'deposit'),
+            # Line 5 is blank
+            'tx-unknown': (6, reconciliation.UNMATCHED, None),
+            # Malformed rows: a bad amount never matches, a missing hash matches nothing
+            'tx-garbled': (7, reconciliation.AMOUNT_MISMATCH, 'crypto_deposit'),
+            '': (8, reconciliation.UNMATCHED, None),
+            'tx-cut': (9, reconciliation.AMOUNT_MISMATCH, 'crypto_deposit'),
+        })
+
+    def test_amounts_are_parsed_leniently(self):
+        for value, amount in (('1,250.50', '1250.50'), ('$10', '10'), ('10 USDT', '10'), (' 7 ', '7')):
+            self.assertEqual(reconciliation.parse_amount(value), Decimal(amount))
+        for value in ('abc', '', 'NaN', 'Infinity'):
+            self.assertIsNone(reconciliation.parse_amount(value))
+
+    def test_unreadable_statements_are_rejected(self):
+        for text, error in (('', 'empty'), ('Txid,From\nabc,TFrom\n', 'amount'), ('Amount\n1\n', 'tx_hash')):
+            with self.assertRaisesMessage(reconciliation.StatementError, error):
+                reconciliation.read_statement(io.StringIO(text))
+
+    def test_command_writes_one_report_per_result(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'statement.csv')
+            with open(path, 'w', encoding='utf-8', newline='') as statement:
+                statement.write(STATEMENT)
+            output = io.StringIO()
+
+            call_command('reconcile_statement', path, output_dir=directory, stdout=output)
+
+            reports = {}
+            for result in reconciliation.RESULTS:
+                with open(os.path.join(directory, f'{result}.csv'), newline='') as report:
+                    rows = list(csv.reader(report))
+                self.assertEqual(rows[0], reconciliation.REPORT_FIELDS)
+                reports[result] = [row[2] for row in rows[1:]]
+
+        self.assertEqual(reports, {
+            'matched': ['tx-match', 'tx-legacy'],
+            'amount_mismatch': ['tx-short', 'tx-garbled', 'tx-cut'],
+            'unmatched': ['tx-unknown', ''],
+        })
+        self.assertIn('Reconciled 7 rows', output.getvalue())
+
+    def test_command_rejects_a_statement_without_required_columns(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'statement.csv')
+            with open(path, 'w') as statement:
+                statement.write('Txid,Block\ntx-match,1\n')
+
+            with self.assertRaisesMessage(CommandError, 'Missing column(s): amount'):
+                call_command('reconcile_statement', path, output_dir=directory)
+
+    def test_admin_upload_streams_the_report(self):
+        self.client.force_login(self.staff)
+        url = reverse('admin:wallets_cryptodeposit_reconcile')
+
+        response = self.client.post(url, {
+            'statement': SimpleUploadedFile('statement.csv', STATEMENT.encode('utf-8')),
+        })
+
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0], reconciliation.REPORT_FIELDS)
+        # Matched rows are left out unless asked for
+        self.assertEqual([row[2] for row in rows[1:]], ['tx-short', 'tx-unknown', 'tx-garbled', '', 'tx-cut'])
+
+        response = self.client.post(url, {'statement': SimpleUploadedFile('statement.csv', b'Txid\nabc\n')})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Missing column(s): amount', response.content.decode())
+
+    def test_large_statement_is_streamed_in_batches(self):
+        total, batch_size = 50000, 2000
+        consumed = []
+
+        def statement():
+            yield 'Txid,Amount\n'
+            for i in range(total):
+                consumed.append(i)
+                yield f'tx-{i},{i}\n'
+
+        rows = reconciliation.read_statement(statement())
+        with mock.patch.object(reconciliation, '_lookup', wraps=reconciliation._lookup) as lookup:
+            results = reconciliation.reconcile(rows, batch_size=batch_size)
+            next(results)
+            # Only the first batch has been read so far
+            self.assertEqual(len(consumed), batch_size)
+            remaining = sum(1 for _ in results)
+
+        self.assertEqual(remaining + 1, total)
+        self.assertEqual(lookup.call_count, total // batch_size)
+        self.assertTrue(all(len(call.args[0]) <= batch_size for call in lookup.call_args_list))
@@ -0,0 +1,175 @@
+"""
+On-chain verification of crypto deposits
+
+CryptoDeposits wait in pending_verification with chain_status='pending'.
+The wallets.verify_crypto_deposits task takes the ones that are due in
+batches with verify(), looks their tx_hash up on the chain concurrently
+(see apps.wallets.chain) and checks that the transaction succeeded and
+moved at least the deposit amount of USDT (TRON_USDT_CONTRACT) to
+ADMIN_USDT_TRC20_ADDRESS from the deposit's from_address. The deposit's
+own to_address is editable and is never trusted here.
+
+- Matching deposits are confirmed through CryptoDepositSettlement, exactly
+  as an admin confirmation would be (wallet credit, order auto-payment).
+- Transactions that are not solidified yet, and node errors, are checked
+  again after TRON_VERIFY_RETRY_DELAY seconds, doubled per check and capped
+  at TRON_VERIFY_MAX_DELAY. After TRON_VERIFY_MAX_CHECKS the deposit is
+  marked 'not_found'.
+- Transactions that do not match are marked 'mismatch'.
+- Deposits without a from_address cannot be tied to the user who submitted
+  them (any public tx_hash to our address could be claimed), so a matching
+  transfer only marks them 'review'; they are never confirmed automatically.
+
+Deposits marked 'not_found', 'mismatch' or 'review' stay in pending_verification for
+an admin to review; the "Re-check on chain" admin action queues them again.
+
+Transfers already picked up by the transfer indexer (apps.wallets.indexer)
+are matched from its table through record() without any lookup.
+"""
+import asyncio
+import logging
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import chain
+from .models import CryptoDeposit
+from .services import CryptoDepositSettlement
+
+logger = logging.getLogger(__name__)
+
+USDT_DECIMALS = 6
+
+# Per-deposit outcomes of a check
+CONFIRMED = 'confirmed'
+MISMATCH = 'mismatch'
+REVIEW = 'review'
+RETRY = 'retry'
+
+
+def check(deposit, receipt):
+    """
+    Compare a deposit with its transaction receipt.
+
+    Returns:
+        tuple: (outcome, error)
+    """
+    if receipt is None:
+        return RETRY, 'Transaction not found or not confirmed yet'
+    if isinstance(receipt, chain.ChainError):
+        return RETRY, str(receipt)
+    if not receipt['success']:
+        return MISMATCH, 'Transaction failed on chain'
+
+    address = settings.ADMIN_USDT_TRC20_ADDRESS
+    if not address:
+        return RETRY, 'ADMIN_USDT_TRC20_ADDRESS is not configured'
+
+    contract = getattr(settings, 'TRON_USDT_CONTRACT', 'TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t')
+    transfers = [
+        transfer for transfer in receipt['transfers']
+        if transfer['contract'] == contract
+        and transfer['to'] == address
+        and (not deposit.from_address or transfer['from'] == deposit.from_address)
+    ]
+    if not transfers:
+        sender = f' from {deposit.from_address}' if deposit.from_address else ''
+        return MISMATCH, f'No USDT transfer to {address}{sender}'
+
+    received = Decimal(sum(transfer['value'] for transfer in transfers)).scaleb(-USDT_DECIMALS)
+    if received < deposit.amount:
+        return MISMATCH, f'Received {received.normalize():f} USDT, deposit is for {deposit.amount}'
+    if not deposit.from_address:
+        return REVIEW, 'No sender address on the deposit; confirm manually'
+    return CONFIRMED, ''
+
+
+def due_deposits():
+    return CryptoDeposit.objects.filter(
+        status='pending_verification',
+        chain_status='pending',
+        chain_next_check_at__lte=timezone.now()
+    )
+
+
+def verify(batch_size=None):
+    """
+    Check one batch of due deposits on the chain.
+
+    Returns:
+        dict: counts of confirmed, retried, mismatched, review and not_found deposits
+    """
+    batch_size = batch_size or getattr(settings, 'TRON_VERIFY_BATCH_SIZE', 100)
+
+    # No lock is held during the lookups: the task runs one verification at a
+    # time, and settlement re-checks the status of every deposit it confirms
+    deposits = list(due_deposits().order_by('chain_next_check_at', 'id')[:batch_size])
+    if not deposits:
+        return {'confirmed': 0, 'retried': 0, 'mismatched': 0, 'review': 0, 'not_found': 0}
+
+    receipts = asyncio.run(chain.fetch_receipts({deposit.tx_hash for deposit in deposits}))
+    return record(deposits, receipts)
+
+
+def record(deposits, receipts):
+    """
+    Check deposits against {tx_hash: receipt}, settle the ones that match
+    and save the outcome of the others.
+
+    Returns:
+        dict: counts of confirmed, retried, mismatched, review and not_found deposits
+    """
+    result = {'confirmed': 0, 'retried': 0, 'mismatched': 0, 'review': 0, 'not_found': 0}
+    max_checks = getattr(settings, 'TRON_VERIFY_MAX_CHECKS', 12)
+    retry_delay = getattr(settings, 'TRON_VERIFY_RETRY_DELAY', 60)
+    max_delay = getattr(settings, 'TRON_VERIFY_MAX_DELAY', 3600)
+
+    now = timezone.now()
+    confirmed_ids = []
+    for deposit in deposits:
+        outcome, error = check(deposit, receipts.get(deposit.tx_hash))
+        deposit.chain_checks += 1
+        deposit.chain_error = error[:255]
+
+        if outcome == CONFIRMED:
+            deposit.chain_status = 'confirmed'
+            deposit.chain_next_check_at = None
+            confirmed_ids.append(deposit.pk)
+            result['confirmed'] += 1
+        elif outcome == MISMATCH:
+            deposit.chain_status = 'mismatch'
+            deposit.chain_next_check_at = None
+            result['mismatched'] += 1
+            logger.warning(f"Crypto deposit {deposit.pk} ({deposit.tx_hash}) does not match the chain: {error}")
+        elif outcome == REVIEW:
+            deposit.chain_status = 'review'
+            deposit.chain_next_check_at = None
+            result['review'] += 1
+        elif deposit.chain_checks >= max_checks:
+            deposit.chain_status = 'not_found'
+            deposit.chain_next_check_at = None
+            result['not_found'] += 1
+            logger.warning(f"Crypto deposit {deposit.pk} ({deposit.tx_hash}) not confirmed after {max_checks} checks: {error}")
+        else:
+            delay = min(retry_delay * 2 ** (deposit.chain_checks - 1), max_delay)
+            deposit.chain_next_check_at = now + timedelta(seconds=delay)
+            result['retried'] += 1
+
+    # Settle first: if that fails the batch is simply checked again
+    for deposit, outcome, order in CryptoDepositSettlement.confirm(confirmed_ids):
+        if outcome in (CryptoDepositSettlement.INSUFFICIENT, CryptoDepositSettlement.ORDER_NOT_PENDING):
+            logger.warning(
+                f"Crypto deposit {deposit.pk} confirmed on chain but order "
+                f"{order.order_id} was not paid: {outcome}"
+            )
+        elif outcome == CryptoDepositSettlement.ALREADY_CREDITED:
+            logger.warning(f"Crypto deposit {deposit.pk} confirmed on chain but already credited; left for review")
+
+    CryptoDeposit.objects.bulk_update(
+        deposits,
+        ['chain_status', 'chain_checks', 'chain_next_check_at', 'chain_error']
+    )
+
+    return result
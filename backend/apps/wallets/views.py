@@ -2,6 +2,7 @@ from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.conf import settings
+from apps.core.mixins import SparseFieldsetsViewMixin
 from .models import UserWallet, Deposit, WalletTransaction, CryptoDeposit
 from .serializers import (
     UserWalletSerializer,
@@ -84,19 +85,19 @@ class CryptoDepositCreateView(generics.CreateAPIView):
         )
 
 
-class CryptoDepositListView(generics.ListAPIView):
+class CryptoDepositListView(SparseFieldsetsViewMixin, generics.ListAPIView):
     """API endpoint for listing user crypto deposits"""
     serializer_class = CryptoDepositSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return CryptoDeposit.objects.filter(user=self.request.user).select_related('related_order')
+        return CryptoDeposit.objects.filter(user=self.request.user).select_related('user', 'related_order')
 
 
-class CryptoDepositDetailView(generics.RetrieveAPIView):
+class CryptoDepositDetailView(SparseFieldsetsViewMixin, generics.RetrieveAPIView):
     """API endpoint for crypto deposit detail"""
     serializer_class = CryptoDepositSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return CryptoDeposit.objects.filter(user=self.request.user).select_related('related_order')
+        return CryptoDeposit.objects.filter(user=self.request.user).select_related('user', 'related_order')
@@ -4,6 +4,7 @@ Django settings for game topup project.
 import os
 from pathlib import Path
 from datetime import timedelta
+from celery.schedules import crontab
 from decouple import config
 import dj_database_url
 
@@ -231,15 +232,151 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+CELERY_BEAT_SCHEDULE = {
+    'relay-outbox': {
+        'task': 'core.relay_outbox',
+        'schedule': 10.0,
+    },
+    'auto-cancel-unpaid-orders': {
+        'task': 'orders.auto_cancel_unpaid_orders',
+        'schedule': crontab(minute='*/10'),
+    },
+    'reconcile-unread-counters': {
+        'task': 'notifications.reconcile_unread_counters',
+        'schedule': crontab(minute='*/15'),
+    },
+    'cleanup-outbox': {
+        'task': 'core.cleanup_outbox',
+        'schedule': crontab(hour=3, minute=30),
+    },
+    'deliver-emails': {
+        'task': 'core.deliver_emails',
+        'schedule': 60.0,
+    },
+    'deliver-telegram': {
+        'task': 'notifications.deliver_telegram',
+        'schedule': 30.0,
+    },
+    'verify-crypto-deposits': {
+        'task': 'wallets.verify_crypto_deposits',
+        'schedule': 30.0,
+    },
+    'cleanup-sent-emails': {
+        'task': 'core.cleanup_sent_emails',
+        'schedule': crontab(hour=3, minute=45),
+    },
+}
+
+# Transactional outbox
+# Events are relayed right after commit; the beat entry above catches anything missed
+OUTBOX_RELAY_BATCH_SIZE = config('OUTBOX_RELAY_BATCH_SIZE', default=100, cast=int)
+OUTBOX_MAX_ATTEMPTS = config('OUTBOX_MAX_ATTEMPTS', default=5, cast=int)
+OUTBOX_RELAY_ON_COMMIT = config('OUTBOX_RELAY_ON_COMMIT', default=True, cast=bool)
 
 # Redis
 REDIS_URL = config('REDIS_URL', default='redis://localhost:6379/0')
 
+# Cache
+# Shared Redis cache (one pool per process, degrades to no cache if Redis is down).
+# Set CACHE_URL=locmem:// to use a per-process cache (e.g. local development).
+CACHE_URL = config('CACHE_URL', default=REDIS_URL)
+if CACHE_URL.startswith('locmem://'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'KEY_PREFIX': 'gametopup',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'apps.core.cache_backends.ResilientRedisCache',
+            'LOCATION': CACHE_URL,
+            'KEY_PREFIX': 'gametopup',
+            'TIMEOUT': 300,
+            'FAILURE_COOLDOWN': config('CACHE_FAILURE_COOLDOWN', default=5, cast=int),
+            'OPTIONS': {
+                'max_connections': config('CACHE_MAX_CONNECTIONS', default=50, cast=int),
+                'socket_connect_timeout': 0.5,
+                'socket_timeout': 0.5,
+                'health_check_interval': 30,
+            },
+        }
+    }
+CACHE_DEFAULT_TIMEOUT = 300
+CACHE_LOCK_TIMEOUT = 10  # max seconds a single-flight recompute may hold its lock
+CACHE_LOCK_WAIT = 2  # seconds other callers wait for that result before computing themselves
+
+# Catalog
+# Rendered game catalog responses; invalidated by a version bump on every change
+CATALOG_CACHE_TIMEOUT = config('CATALOG_CACHE_TIMEOUT', default=300, cast=int)
+
+# Notifications
+# Cached per-user unread counters expire after this many seconds (bounds any drift)
+UNREAD_COUNTER_TIMEOUT = config('UNREAD_COUNTER_TIMEOUT', default=3600, cast=int)
+# Cached notification preference bitmasks (rewritten on every save)
+PREFERENCE_CACHE_TIMEOUT = 86400
+# Delta sync cursors stay this many seconds behind now, so rows from transactions
+# that commit late are still picked up on the next poll
+SYNC_CURSOR_LAG = 2
+# Realtime stream (/api/notifications/stream/, served by the ASGI app)
+SSE_HEARTBEAT = 20  # seconds between keep-alive comments
+SSE_MAX_DURATION = config('SSE_MAX_DURATION', default=300, cast=int)  # clients reconnect with a fresh ticket
+SSE_RETRY_MS = 5000
+SSE_TICKET_TIMEOUT = 60
+SSE_QUEUE_SIZE = 100  # pending events per connection before new ones are dropped
+SSE_PUBLISH_COOLDOWN = config('SSE_PUBLISH_COOLDOWN', default=5, cast=int)  # seconds pushes are dropped after a Redis failure
+# Telegram delivery (apps.notifications.telegram); disabled while TELEGRAM_BOT_TOKEN is empty
+TELEGRAM_BOT_TOKEN = config('TELEGRAM_BOT_TOKEN', default='')
+TELEGRAM_API_URL = config('TELEGRAM_API_URL', default='https://api.telegram.org')  # point at a stub server for testing
+TELEGRAM_BATCH_SIZE = config('TELEGRAM_BATCH_SIZE', default=200, cast=int)
+TELEGRAM_MAX_ATTEMPTS = config('TELEGRAM_MAX_ATTEMPTS', default=5, cast=int)
+TELEGRAM_RETRY_DELAY = 30  # seconds before the first retry, doubled on each further attempt
+TELEGRAM_GLOBAL_RATE = config('TELEGRAM_GLOBAL_RATE', default=25, cast=float)  # messages/second for the bot (Telegram allows ~30)
+TELEGRAM_CHAT_RATE = 1  # messages/second to a single chat
+TELEGRAM_MAX_CONNECTIONS = 20  # pooled HTTP connections to the Bot API
+TELEGRAM_TIMEOUT = 10  # seconds per request
+TELEGRAM_LOCK_TIMEOUT = 300  # upper bound on one delivery run
+TELEGRAM_LEASE_TIMEOUT = 300  # a claimed batch is sent again after this if its worker died
+
+# Orders
+# Hi-lo block size for order numbers on databases without sequences (SQLite)
+ORDER_NUMBER_BLOCK_SIZE = config('ORDER_NUMBER_BLOCK_SIZE', default=20, cast=int)
+# Unpaid orders are canceled after this many hours, in chunks of AUTO_CANCEL_CHUNK_SIZE
+AUTO_CANCEL_UNPAID_HOURS = config('AUTO_CANCEL_UNPAID_HOURS', default=12, cast=int)
+AUTO_CANCEL_CHUNK_SIZE = config('AUTO_CANCEL_CHUNK_SIZE', default=500, cast=int)
+
+# Deposits
+# Bulk crypto deposit confirmation commits every DEPOSIT_SETTLEMENT_CHUNK_SIZE deposits
+DEPOSIT_SETTLEMENT_CHUNK_SIZE = config('DEPOSIT_SETTLEMENT_CHUNK_SIZE', default=100, cast=int)
+# Statement reconciliation looks up this many statement rows per query
+RECONCILIATION_BATCH_SIZE = config('RECONCILIATION_BATCH_SIZE', default=2000, cast=int)
+
 # Payment Settings
 ADMIN_PAYMENT_ADDRESS = config('ADMIN_PAYMENT_ADDRESS', default='')
 # Legacy support for old environment variable name
 ADMIN_USDT_TRC20_ADDRESS = config('ADMIN_USDT_TRC20_ADDRESS', default=ADMIN_PAYMENT_ADDRESS)
 TRON_API_KEY = config('TRON_API_KEY', default='')
+# On-chain verification of crypto deposits (apps.wallets.verification)
+TRON_VERIFY_ENABLED = config('TRON_VERIFY_ENABLED', default=True, cast=bool)
+TRON_API_URL = config('TRON_API_URL', default='https://api.trongrid.io')  # point at a fake node for testing
+TRON_CHAIN_CLIENT = config('TRON_CHAIN_CLIENT', default='apps.wallets.chain.TronGridClient')
+TRON_USDT_CONTRACT = config('TRON_USDT_CONTRACT', default='TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t')
+TRON_MAX_CONCURRENCY = config('TRON_MAX_CONCURRENCY', default=10, cast=int)  # lookups in flight
+TRON_TIMEOUT = 10  # seconds per request
+TRON_RECEIPT_CACHE_SIZE = 1024  # receipts kept per process
+TRON_RECEIPT_CACHE_TTL = 3600
+TRON_VERIFY_BATCH_SIZE = config('TRON_VERIFY_BATCH_SIZE', default=100, cast=int)
+TRON_VERIFY_MAX_CHECKS = config('TRON_VERIFY_MAX_CHECKS', default=12, cast=int)
+TRON_VERIFY_RETRY_DELAY = 60  # seconds before the second check, doubled per check
+TRON_VERIFY_MAX_DELAY = 3600
+TRON_VERIFY_LOCK_TIMEOUT = 300  # upper bound on one verification run
+# Transfer indexer (apps.wallets.indexer): scans transfers to ADMIN_USDT_TRC20_ADDRESS
+TRON_INDEXER_ENABLED = config('TRON_INDEXER_ENABLED', default=True, cast=bool)
+TRON_INDEXER_PAGE_SIZE = 200  # transfers per request (TronGrid maximum)
+TRON_INDEXER_MAX_PAGES = config('TRON_INDEXER_MAX_PAGES', default=50, cast=int)  # per sync
+TRON_INDEXER_OVERLAP = 60  # seconds re-read before the cursor on every sync
+TRON_INDEXER_BACKFILL_HOURS = config('TRON_INDEXER_BACKFILL_HOURS', default=72, cast=int)  # start of a new cursor
 
 # Email Settings
 EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
@@ -436,6 +573,12 @@ EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='noreply@gametopup.com')
 SERVER_EMAIL = DEFAULT_FROM_EMAIL
+EMAIL_TIMEOUT = config('EMAIL_TIMEOUT', default=10, cast=int)  # seconds, so a stuck SMTP server cannot hang a worker
+
+# Outgoing email queue (apps.core.mailer), drained by the core.deliver_emails task
+EMAIL_BATCH_SIZE = config('EMAIL_BATCH_SIZE', default=50, cast=int)  # messages sent per SMTP connection
+EMAIL_MAX_ATTEMPTS = config('EMAIL_MAX_ATTEMPTS', default=5, cast=int)
+EMAIL_RETRY_DELAY = 30  # seconds before the first retry, doubled on each further attempt
 
 # ==============================================================================
 # CAPTCHA CONFIGURATION
@@ -464,6 +607,10 @@ PASSWORD_RESET_TIMEOUT = 3600  # seconds
 # Rate limit settings for authentication endpoints
 RATELIMIT_ENABLE = True
 RATELIMIT_USE_CACHE = 'default'
+# While Redis is down the default cache (ResilientRedisCache) cannot count
+# requests. Rate-limited endpoints (forgot-password) then fail closed and
+# answer 403 until Redis is back; failing open would leave them unlimited.
+RATELIMIT_FAIL_OPEN = False
 
 # Max login attempts
 MAX_LOGIN_ATTEMPTS = 5
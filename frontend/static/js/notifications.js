@@ -8,7 +8,11 @@ class NotificationManager {
         this.apiBaseUrl = '/api/notifications';
         this.pollingInterval = 30000; // 30 seconds
         this.pollingTimer = null;
+        this.eventSource = null;
+        this.streamRetryDelay = 5000;
+        this.streamRetryTimer = null;
         this.notifications = [];
+        this.cursor = null; // delta sync position, see syncNotifications()
         this.unreadCount = 0;
         this.isDropdownOpen = false;
         this.toastQueue = [];
@@ -28,7 +32,7 @@ class NotificationManager {
         this.bindEvents();
         this.fetchUnreadCount();
         this.checkImportantNotifications();
-        this.startPolling();
+        this.startStream();
     }
 
     createNotificationElements() {
@@ -139,6 +143,7 @@ class NotificationManager {
             if (response.ok) {
                 const data = await response.json();
                 this.notifications = data.results;
+                this.cursor = data.cursor;
                 this.updateBadge(data.unread_count);
                 this.renderNotificationList();
             }
@@ -147,6 +152,45 @@ class NotificationManager {
         }
     }
 
+    /**
+     * Fetch only what changed since the last fetch and merge it into the list.
+     */
+    async syncNotifications() {
+        if (!this.cursor) {
+            return this.fetchRecentNotifications();
+        }
+
+        try {
+            let hasMore = true;
+            while (hasMore) {
+                const response = await fetch(`${this.apiBaseUrl}/recent/?since=${encodeURIComponent(this.cursor)}`, {
+                    headers: this.getAuthHeaders()
+                });
+                if (!response.ok) {
+                    // e.g. cursor rejected: start over
+                    return this.fetchRecentNotifications();
+                }
+
+                const data = await response.json();
+                if (data.results.length > 0) {
+                    const changed = new Map(data.results.map(n => [n.id, n]));
+                    this.notifications = [
+                        ...data.results.filter(n => !this.notifications.some(existing => existing.id === n.id)),
+                        ...this.notifications.map(n => changed.get(n.id) || n)
+                    ]
+                        .sort((a, b) => new Date(b.created_at) - new Date(a.created_at))
+                        .slice(0, 10);
+                    this.renderNotificationList();
+                }
+                this.cursor = data.cursor;
+                this.updateBadge(data.unread_count);
+                hasMore = data.has_more;
+            }
+        } catch (error) {
+            console.error('Failed to sync notifications:', error);
+        }
+    }
+
     async checkImportantNotifications() {
         try {
             const response = await fetch(`${this.apiBaseUrl}/important/`, {
@@ -245,7 +289,7 @@ class NotificationManager {
         if (dropdown) {
             dropdown.classList.remove('hidden');
             this.isDropdownOpen = true;
-            this.fetchRecentNotifications();
+            this.syncNotifications();
         }
     }
 
@@ -386,9 +430,86 @@ class NotificationManager {
         }
     }
 
+    /**
+     * Realtime updates over Server-Sent Events.
+     * Polling is only used while the stream is unavailable.
+     */
+    async startStream() {
+        if (!window.EventSource) {
+            this.startPolling();
+            return;
+        }
+
+        try {
+            const response = await fetch(`${this.apiBaseUrl}/stream_ticket/`, {
+                method: 'POST',
+                headers: this.getAuthHeaders()
+            });
+            if (!response.ok) {
+                throw new Error(`Stream ticket request failed: ${response.status}`);
+            }
+            const data = await response.json();
+
+            this.eventSource = new EventSource(`${this.apiBaseUrl}/stream/?ticket=${encodeURIComponent(data.ticket)}`);
+            this.eventSource.onopen = () => {
+                this.stopPolling();
+                // Catch up on anything missed while disconnected
+                this.fetchUnreadCount();
+            };
+            this.eventSource.onerror = () => this.restartStream();
+            this.eventSource.addEventListener('notification', (e) => {
+                this.handlePushedNotification(JSON.parse(e.data));
+            });
+            this.eventSource.addEventListener('broadcast', (e) => {
+                // Every user receives broadcasts at once: spread the follow-up requests
+                const notification = JSON.parse(e.data);
+                setTimeout(() => this.handlePushedNotification(notification), Math.random() * 10000);
+            });
+            this.eventSource.addEventListener('order_status', (e) => {
+                document.dispatchEvent(new CustomEvent('order-status-changed', { detail: JSON.parse(e.data) }));
+            });
+        } catch (error) {
+            console.error('Failed to open notification stream:', error);
+            this.restartStream();
+        }
+    }
+
+    restartStream() {
+        this.stopStream();
+        this.startPolling();
+        // A fresh ticket is needed for every connection, so reconnect manually
+        this.streamRetryTimer = setTimeout(() => this.startStream(), this.streamRetryDelay);
+    }
+
+    stopStream() {
+        if (this.eventSource) {
+            this.eventSource.close();
+            this.eventSource = null;
+        }
+        if (this.streamRetryTimer) {
+            clearTimeout(this.streamRetryTimer);
+            this.streamRetryTimer = null;
+        }
+    }
+
+    handlePushedNotification(notification) {
+        this.fetchUnreadCount();
+        if (notification.is_important) {
+            this.checkImportantNotifications();
+        }
+        if (this.isDropdownOpen) {
+            this.syncNotifications();
+        }
+    }
+
     startPolling() {
+        if (this.pollingTimer) return;
         this.pollingTimer = setInterval(() => {
-            this.fetchUnreadCount();
+            if (this.cursor) {
+                this.syncNotifications();
+            } else {
+                this.fetchUnreadCount();
+            }
             this.checkImportantNotifications();
         }, this.pollingInterval);
     }
@@ -401,6 +522,7 @@ class NotificationManager {
     }
 
     destroy() {
+        this.stopStream();
         this.stopPolling();
         const container = document.getElementById('notification-container');
         if (container) {